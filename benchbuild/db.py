@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+""" Manage the BB database. """
+import os
+from collections import OrderedDict
+
+from plumbum import cli
+
+# SQLite limits the number of variables in a single statement.
+CHUNK_SIZE = 500
+# The number of rows we read from the source at once.
+FETCH_SIZE = 10000
+# Tables that belong to the database they are in, we never copy them.
+LOCAL_TABLES = ("journal_applied", "journal_run", "run_summary")
+
+
+def __chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def __fetch(src, query, size=CHUNK_SIZE):
+    """Stream the rows of :query: in lists of :size: rows."""
+    result = src.execution_options(stream_results=True).execute(query)
+    try:
+        rows = result.fetchmany(size)
+        while rows:
+            yield rows
+            rows = result.fetchmany(size)
+    finally:
+        result.close()
+
+
+def __copy_by_key(src, session, table):
+    """Copy all rows of :table:, whose primary key is not known yet."""
+    key = list(table.primary_key.columns)
+    count = 0
+    for chunk in __fetch(src, table.select()):
+        rows = [dict(row) for row in chunk]
+        known = {tuple(row) for row in session.query(*key).filter(
+            key[0].in_({row[key[0].name] for row in rows}))}
+        rows = [row for row in rows
+                if tuple(row[c.name] for c in key) not in known]
+        if rows:
+            session.execute(table.insert(), rows)
+        count += len(rows)
+    return count
+
+
+def __copy_runs(src, session):
+    """Copy all runs we do not know yet, they get new ids in the target."""
+    from benchbuild.utils.schema import Run
+
+    table = Run.__table__
+    id_map = {}
+    for chunk in __fetch(src, table.select()):
+        rows = [dict(row) for row in chunk]
+        known = set(session.query(
+            Run.experiment_group, Run.run_group, Run.command,
+            Run.begin).filter(Run.experiment_group.in_(
+                {row["experiment_group"] for row in rows})))
+        for row in rows:
+            if (row["experiment_group"], row["run_group"], row["command"],
+                    row["begin"]) in known:
+                continue
+            old_id = row.pop("id")
+            id_map[old_id] = session.execute(
+                table.insert().values(**row)).inserted_primary_key[0]
+    return id_map
+
+
+def __copy_run_data(src, session, table, id_map):
+    """Copy all rows of :table: that belong to one of the copied runs."""
+    from benchbuild.utils.db import bulk_insert
+
+    columns = [c.name for c in table.columns]
+    key = list(table.primary_key.columns)
+    if len(key) == 1 and key[0].name == "id":
+        # Surrogate keys are assigned by the target.
+        columns.remove("id")
+
+    count = 0
+    for chunk in __chunks(id_map):
+        query = table.select().where(table.c.run_id.in_(chunk))
+        for rows in __fetch(src, query, FETCH_SIZE):
+            count += bulk_insert(session, table, columns, [
+                tuple(id_map[row[c]] if c == "run_id" else row[c]
+                      for c in columns) for row in rows
+            ])
+    return count
+
+
+def __summarize_runs(session, run_ids):
+    """Rebuild the run summary of all run groups of :run_ids:."""
+    from benchbuild.utils.db import refresh_run_summary
+    from benchbuild.utils.schema import Run
+
+    groups = set()
+    for chunk in __chunks(run_ids):
+        groups.update(group for group, in session.query(
+            Run.run_group).filter(Run.id.in_(chunk)) if group is not None)
+    for chunk in __chunks(groups):
+        refresh_run_summary(session, chunk)
+    return len(groups)
+
+
+def merge(source, session):
+    """
+    Merge all results of the database at :source: into :session:'s database.
+
+    Projects, experiments and run groups are copied, if we do not know their
+    primary key yet. Runs get new ids, all data attached to them is updated
+    accordingly. A run is considered known, if its experiment, run group,
+    command and begin match. Merging the same database twice does not
+    duplicate anything.
+
+    The bookkeeping of journals and the run summary are not copied. The
+    summary of every run group we copied runs of is rebuilt afterwards.
+    Rows are read from :source: in chunks.
+
+    Args:
+        source: The sqlalchemy URL of the database we merge.
+        session: The db transaction of the target database.
+
+    Returns:
+        An ordered dictionary with the number of rows copied per table and
+        the number of run groups we summarized.
+    """
+    from benchbuild.utils.schema import BASE, Run, RunSummary, \
+        create_db_engine
+
+    counts = OrderedDict()
+    src = create_db_engine(source).connect()
+    try:
+        by_run = []
+        for table in BASE.metadata.sorted_tables:
+            if table.name in LOCAL_TABLES:
+                continue
+            if table is Run.__table__:
+                id_map = __copy_runs(src, session)
+                counts[table.name] = len(id_map)
+            elif "run_id" in table.columns:
+                by_run.append(table)
+            else:
+                counts[table.name] = __copy_by_key(src, session, table)
+
+        for table in by_run:
+            counts[table.name] = __copy_run_data(src, session, table, id_map)
+        counts[RunSummary.__tablename__] = __summarize_runs(
+            session, id_map.values())
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        src.close()
+    return counts
+
+
+def summarize(session, experiment_ids=None):
+    """
+    Rebuild the run summary of all run groups.
+
+    Args:
+        session: The db transaction we belong to.
+        experiment_ids: Only rebuild the run groups of these experiments.
+
+    Returns:
+        The number of run groups we summarized.
+    """
+    from benchbuild.utils.db import refresh_run_summary
+    from benchbuild.utils.schema import Run
+
+    query = session.query(Run.run_group).distinct()
+    if experiment_ids:
+        query = query.filter(Run.experiment_group.in_(experiment_ids))
+    groups = [group for group, in query]
+    for chunk in __chunks(groups):
+        refresh_run_summary(session, chunk)
+    session.commit()
+    return len(groups)
+
+
+def partition(session):
+    """Partition all fact tables by experiment_group."""
+    from benchbuild.utils import partitions
+
+    try:
+        tables = partitions.partition(session.connection())
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return tables
+
+
+def archive(session, experiment_id, directory=None, keep=False):
+    """
+    Export and/or remove all rows of an experiment.
+
+    Args:
+        session: The db transaction we belong to.
+        experiment_id: The id of the experiment.
+        directory: Export the rows into this directory first.
+        keep: Keep the rows in the database after the export.
+
+    Returns:
+        A tuple of the exported row counts, the deleted row counts and the
+        dropped partitions.
+    """
+    from benchbuild.utils import partitions
+
+    exported = OrderedDict()
+    deleted, dropped = OrderedDict(), []
+    try:
+        connection = session.connection()
+        if directory:
+            exported = partitions.export(connection, experiment_id,
+                                         directory)
+        if not keep:
+            deleted, dropped = partitions.prune(connection, experiment_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return exported, deleted, dropped
+
+
+def print_archive(exported, deleted, dropped):
+    for table, count in exported.items():
+        print("{0}: {1} rows exported".format(table, count))
+    for table, count in deleted.items():
+        print("{0}: {1} rows deleted".format(table, count))
+    for name in dropped:
+        print("{0}: dropped".format(name))
+
+
+class BenchBuildDB(cli.Application):
+    """ Manage the benchbuild database. """
+
+    def main(self, *args):
+        if args:
+            print("Unknown command {0!r}".format(args[0]))
+            return 1
+        if not self.nested_command:
+            self.help()
+
+
+@BenchBuildDB.subcommand("import")
+class BenchBuildDBImport(cli.Application):
+    """ Merge the results of another database into the configured one. """
+
+    def main(self, source):
+        """
+        Args:
+            source: A sqlalchemy URL or the path of a SQLite database.
+        """
+        from benchbuild.utils.schema import Session
+
+        if "://" not in source:
+            source = "sqlite:///" + os.path.abspath(source)
+        for table, count in merge(source, Session()).items():
+            print("{0}: {1} rows".format(table, count))
+
+
+@BenchBuildDB.subcommand("summary")
+class BenchBuildDBSummary(cli.Application):
+    """ Rebuild the run summary of all run groups. """
+
+    experiment_ids = cli.SwitchAttr(
+        ["-e", "--experiment-id"], str, list=True,
+        help="Only rebuild the summary of these experiment ids.")
+
+    def main(self):
+        from benchbuild.utils.schema import Session
+
+        count = summarize(Session(), self.experiment_ids)
+        print("Summarized {0} run groups.".format(count))
+
+
+@BenchBuildDB.subcommand("partition")
+class BenchBuildDBPartition(cli.Application):
+    """ Partition the fact tables by experiment (PostgreSQL only). """
+
+    def main(self):
+        from benchbuild.utils.schema import Session
+
+        tables = partition(Session())
+        if tables:
+            print("Partitioned: {0}".format(", ".join(tables)))
+        else:
+            print("All tables are partitioned already.")
+
+
+@BenchBuildDB.subcommand("prune")
+class BenchBuildDBPrune(cli.Application):
+    """ Remove all results of an experiment. """
+
+    experiment_id = cli.SwitchAttr(
+        ["-e", "--experiment-id"], str, mandatory=True,
+        help="The experiment id we remove.")
+
+    def main(self):
+        from benchbuild.utils.schema import Session
+
+        print_archive(*archive(Session(), self.experiment_id))
+
+
+@BenchBuildDB.subcommand("archive")
+class BenchBuildDBArchive(cli.Application):
+    """ Export all results of an experiment and remove them afterwards. """
+
+    experiment_id = cli.SwitchAttr(
+        ["-e", "--experiment-id"], str, mandatory=True,
+        help="The experiment id we archive.")
+    directory = cli.SwitchAttr(
+        ["-o", "--output"], str, mandatory=True,
+        help="The directory that receives the compressed tables.")
+    keep = cli.Flag(["--keep"], help="Keep the results in the database.")
+
+    def main(self):
+        from benchbuild.utils.schema import Session
+
+        print_archive(*archive(Session(), self.experiment_id,
+                               self.directory, self.keep))
+
+
+@BenchBuildDB.subcommand("compact-events")
+class BenchBuildDBCompactEvents(cli.Application):
+    """ Move the region events of runs into columnar chunks. """
+
+    experiment_id = cli.SwitchAttr(
+        ["-e", "--experiment-id"], str,
+        help="Only compact the events of this experiment id.")
+    chunk_size = cli.SwitchAttr(
+        ["-s", "--chunk-size"], int,
+        help="Maximum number of events per chunk, "
+             "defaults to BB_EVENTS_CHUNK_SIZE.")
+
+    def main(self):
+        from benchbuild.utils import events
+        from benchbuild.utils.schema import Session
+
+        counts = events.compact(Session(), self.experiment_id,
+                                self.chunk_size)
+        for kind, (runs, count) in sorted(counts.items()):
+            print("{0}: {1} events of {2} runs".format(kind, count, runs))
+
+
+@BenchBuildDB.subcommand("replay")
+class BenchBuildDBReplay(cli.Application):
+    """ Write the local journals of unreachable databases. """
+
+    def main(self, directory=None):
+        """
+        Args:
+            directory: The journal directory, defaults to BB_DB_JOURNAL.
+        """
+        from benchbuild.settings import CFG
+        from benchbuild.utils import journal
+        from benchbuild.utils.schema import BASE, Session
+
+        directory = directory or CFG["db"]["journal"].value()
+        if not directory:
+            print("No journal directory given, set BB_DB_JOURNAL.")
+            return 1
+
+        counts, failed = journal.replay_directory(
+            directory, Session, BASE.metadata,
+            int(CFG["db"]["batch_size"].value()))
+        for path, count in sorted(counts.items()):
+            print("{0}: {1} entries".format(path, count))
+        for path, ex in sorted(failed.items()):
+            print("{0}: failed, {1}".format(path, ex))
+        return 1 if failed else 0
@@ -36,6 +36,7 @@ def main(*args):
                               "benchbuild.bootstrap.BenchBuildBootstrap")
     PollyProfiling.subcommand("run", "benchbuild.run.BenchBuildRun")
     PollyProfiling.subcommand("log", "benchbuild.log.BenchBuildLog")
+    PollyProfiling.subcommand("db", "benchbuild.db.BenchBuildDB")
     PollyProfiling.subcommand("test", "benchbuild.test.BenchBuildTest")
     PollyProfiling.subcommand("slurm", "benchbuild.slurm.Slurm")
     PollyProfiling.subcommand("report", "benchbuild.report.BenchBuildReport")
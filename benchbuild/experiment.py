@@ -96,6 +96,8 @@ class Experiment(object, metaclass=ExperimentRegistry):
     """
 
     NAME = None
+    # Resource limits for all runs of this experiment, see utils.limits.
+    LIMITS = {}
 
     def __new__(cls, *args, **kwargs):
         """Create a new experiment instance and set some defaults."""
@@ -217,6 +219,7 @@ class RuntimeExperiment(Experiment):
                 str(cmd), project.name, self.name, project.run_uuid)
             metric = s.Metric(name="papi.calibration.time_ns",
                               value=calibration,
-                              run_id=run.id)
+                              run_id=run.id,
+                              experiment_group=run.experiment_group)
             session.add(metric)
             session.commit()
@@ -5,24 +5,27 @@ This experiment is a basic experiment in the benchbuild study. It simply runs
 all projects after compiling it with -O3 and catches all statistics emitted
 by llvm.
 
+The statistics are written to a file by the build's own compilation, see
+CollectCompilestats. No translation unit is compiled twice.
 """
 
+import os
 import parse
+import tempfile
 import warnings
 import logging
 from plumbum import local
 from benchbuild.experiment import RuntimeExperiment
-from functools import partial
+from benchbuild.utils.compiler import SinglePassExtension
 from benchbuild.utils.actions import (Prepare, Build, Download, Configure,
                                       Clean, MakeBuildDir, Echo)
 
 
 def collect_compilestats(project, experiment, config, clang, **kwargs):
-    """Collect compilestats."""
+    """Collect compilestats, by compiling a second time with -stats."""
     from benchbuild.utils.run import track_execution, handle_stdin
     from benchbuild.settings import CFG as c
     from benchbuild.utils.db import persist_compilestats
-    from benchbuild.utils.schema import CompileStat
 
     c.update(config)
     clang = handle_stdin(clang["-mllvm", "-stats"], kwargs)
@@ -32,32 +35,107 @@ def collect_compilestats(project, experiment, config, clang, **kwargs):
             ri = run()
 
     if ri.retcode == 0:
-        stats = []
-        for stat in get_compilestats(ri.stderr):
-            compile_s = CompileStat()
-            compile_s.name = stat["desc"].rstrip()
-            compile_s.component = stat["component"].rstrip()
-            compile_s.value = stat["value"]
-            stats.append(compile_s)
-
-        components = c["cs"]["components"].value()
-        if components is not None:
-            stats = [s for s in stats if str(s.component) in components]
-        names = c["cs"]["names"].value()
-        if names is not None:
-            stats = [s for s in stats if str(s.name) in names]
-
-        log = logging.getLogger()
-        log.info("\n=========================================================")
-        log.info("{:s} results for project {:s}:".format(experiment.NAME,
-                                                         project.NAME))
-        log.info("=========================================================\n")
-        for s in stats:
-            log.info("{:s} - {:s}".format(str(s.name), str(s.value)))
-        log.info("=========================================================\n")
+        stats = filter_compilestats(ri.stderr, c)
+        log_compilestats(project, experiment, stats)
         persist_compilestats(ri.db_run, ri.session, stats)
 
 
+def filter_compilestats(prog_out, config):
+    """
+    Parse the LLVM compilation stats and keep the configured ones.
+
+    Args:
+        prog_out: The output of -mllvm -stats.
+        config: The configuration that selects the components and names.
+
+    Returns:
+        A list of CompileStat.
+    """
+    from benchbuild.utils.schema import CompileStat
+
+    stats = []
+    for stat in get_compilestats(prog_out):
+        compile_s = CompileStat()
+        compile_s.name = stat["desc"].rstrip()
+        compile_s.component = stat["component"].rstrip()
+        compile_s.value = stat["value"]
+        stats.append(compile_s)
+
+    components = config["cs"]["components"].value()
+    if components is not None:
+        stats = [s for s in stats if str(s.component) in components]
+    names = config["cs"]["names"].value()
+    if names is not None:
+        stats = [s for s in stats if str(s.name) in names]
+    return stats
+
+
+def log_compilestats(project, experiment, stats):
+    log = logging.getLogger()
+    log.info("\n=========================================================")
+    log.info("{:s} results for project {:s}:".format(experiment.NAME,
+                                                     project.NAME))
+    log.info("=========================================================\n")
+    for s in stats:
+        log.info("{:s} - {:s}".format(str(s.name), str(s.value)))
+    log.info("=========================================================\n")
+
+
+class CollectCompilestats(SinglePassExtension):
+    """
+    Collect the compilestats of the build's own compilation.
+
+    LLVM writes the statistics into a temporary file, instead of stderr.
+    This keeps the compiler's output untouched for the build system.
+    """
+
+    def __init__(self, project, experiment, config):
+        self.project = project
+        self.experiment = experiment
+        self.config = config
+        self.stats_f = None
+        self.db_run = None
+        self.session = None
+
+    def flags(self):
+        fd, self.stats_f = tempfile.mkstemp(prefix="bb-stats-",
+                                            suffix=".txt")
+        os.close(fd)
+        return ["-mllvm", "-stats",
+                "-mllvm", "-info-output-file=" + self.stats_f]
+
+    def begin(self, cmd):
+        from benchbuild.settings import CFG
+        from benchbuild.utils.run import begin
+
+        CFG.update(self.config)
+        self.db_run, self.session = begin(cmd, self.project,
+                                          self.experiment.name,
+                                          self.project.run_uuid)
+
+    def end(self, cmd, retcode, stdout, stderr):
+        from benchbuild.settings import CFG
+        from benchbuild.utils.db import persist_compilestats
+        from benchbuild.utils.run import end, fail
+
+        prog_out = ""
+        if self.stats_f is not None:
+            try:
+                with open(self.stats_f) as stats_f:
+                    prog_out = stats_f.read()
+            finally:
+                os.remove(self.stats_f)
+
+        if retcode != 0:
+            fail(self.db_run, self.session, retcode, stdout, stderr)
+            return
+
+        end(self.db_run, self.session, stdout, stderr)
+        stats = filter_compilestats(prog_out, CFG)
+        log_compilestats(self.project, self.experiment, stats)
+        persist_compilestats(self.db_run, self.session, stats)
+
+
 class CompilestatsExperiment(RuntimeExperiment):
     """The compilestats experiment."""
 
@@ -66,7 +144,7 @@ class CompilestatsExperiment(RuntimeExperiment):
     def actions_for_project(self, p):
         from benchbuild.settings import CFG
 
-        p.compiler_extension = partial(collect_compilestats, p, self, CFG)
+        p.compiler_extension = CollectCompilestats(p, self, CFG)
 
         actns = [
             MakeBuildDir(p),
@@ -91,7 +169,7 @@ class PollyCompilestatsExperiment(RuntimeExperiment):
 
         p.cflags = ["-O3", "-Xclang", "-load", "-Xclang", "LLVMPolly.so",
                     "-mllvm", "-polly"]
-        p.compiler_extension = partial(collect_compilestats, p, self, CFG)
+        p.compiler_extension = CollectCompilestats(p, self, CFG)
 
         actns = [
             MakeBuildDir(p),
@@ -54,7 +54,12 @@ class PapiScopCoverage(RuntimeExperiment):
     NAME = "papi"
 
     def run(self):
-        """Do the postprocessing, after all projects are done."""
+        """
+        Do the postprocessing, after all projects are done.
+
+        pprof-analyze reads the rows libpprof wrote. With
+        BB_EVENTS_STORAGE=chunks, we compact them afterwards.
+        """
         super(PapiScopCoverage, self).run()
         from benchbuild.utils.cmd import pprof_analyze
 
@@ -65,6 +70,11 @@ class PapiScopCoverage(RuntimeExperiment):
                        BB_USE_CSV=0):
             pprof_analyze()
 
+        if CFG["events"]["storage"].value() == "chunks":
+            from benchbuild.utils import events
+            from benchbuild.utils.schema import Session
+            events.compact(Session(), CFG["experiment_id"].value())
+
     def actions_for_project(self, p):
         """
         Create & Run a papi-instrumented version of the project.
@@ -76,18 +76,21 @@ def run_with_papi(project, experiment, config, jobs, run_f, args, **kwargs):
     from benchbuild.settings import CFG
     from benchbuild.utils.run import track_execution, handle_stdin
     from benchbuild.utils.db import persist_config
+    from benchbuild.utils import slots
 
     CFG.update(config)
     project.name = kwargs.get("project_name", project.name)
     run_cmd = local[run_f]
     run_cmd = handle_stdin(run_cmd[args], kwargs)
 
-    with local.env(POLLI_ENABLE_PAPI=1, OMP_NUM_THREADS=jobs):
-        with track_execution(run_cmd, project, experiment) as run:
-            run_info = run()
+    with slots.slot(jobs) as cores:
+        with local.env(POLLI_ENABLE_PAPI=1, OMP_NUM_THREADS=jobs):
+            with track_execution(run_cmd, project, experiment) as run:
+                run_info = run()
 
     persist_config(run_info.db_run, run_info.session,
                    {"cores": str(jobs)})
+    slots.persist(run_info.db_run, run_info.session, cores)
 
 
 def run_with_likwid(project, experiment, config, jobs, run_f, args, **kwargs):
@@ -113,23 +116,28 @@ def run_with_likwid(project, experiment, config, jobs, run_f, args, **kwargs):
     from benchbuild.utils.run import track_execution, handle_stdin
     from benchbuild.utils.db import persist_likwid, persist_config
     from benchbuild.likwid import get_likwid_perfctr
+    from benchbuild.utils import slots
 
     CFG.update(config)
     project.name = kwargs.get("project_name", project.name)
     likwid_f = project.name + ".txt"
 
     for group in ["CLOCK"]:
-        likwid_path = path.join(CFG["likwiddir"], "bin")
-        likwid_perfctr = local[path.join(likwid_path, "likwid-perfctr")]
-        run_cmd = \
-            likwid_perfctr["-O", "-o", likwid_f, "-m",
-                           "-C", "0-{0:d}".format(jobs),
-                           "-g", group, run_f]
-        run_cmd = handle_stdin(run_cmd[args], kwargs)
-
-        with local.env(POLLI_ENABLE_LIKWID=1):
-            with track_execution(run_cmd, project, experiment) as run:
-                ri = run()
+        with slots.slot(jobs) as cores:
+            cpu_list = "0-{0:d}".format(jobs)
+            if cores is not None:
+                cpu_list = ",".join(str(c) for c in cores)
+            likwid_path = path.join(CFG["likwiddir"], "bin")
+            likwid_perfctr = local[path.join(likwid_path, "likwid-perfctr")]
+            run_cmd = \
+                likwid_perfctr["-O", "-o", likwid_f, "-m",
+                               "-C", cpu_list,
+                               "-g", group, run_f]
+            run_cmd = handle_stdin(run_cmd[args], kwargs)
+
+            with local.env(POLLI_ENABLE_LIKWID=1):
+                with track_execution(run_cmd, project, experiment) as run:
+                    ri = run()
 
         likwid_measurement = get_likwid_perfctr(likwid_f)
         persist_likwid(run, ri.session, likwid_measurement)
@@ -137,6 +145,7 @@ def run_with_likwid(project, experiment, config, jobs, run_f, args, **kwargs):
             "cores": str(jobs),
             "likwid.group": group
         })
+        slots.persist(ri.db_run, ri.session, cores)
         rm("-f", likwid_f)
 
 
@@ -162,6 +171,7 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
     from benchbuild.utils.run import track_execution, fetch_time_output
     from benchbuild.settings import CFG
     from benchbuild.utils.db import persist_time, persist_config
+    from benchbuild.utils import slots
 
     CFG.update(config)
     project.name = kwargs.get("project_name", project.name)
@@ -174,8 +184,9 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
     if may_wrap:
         run_cmd = time["-f", timing_tag + "%U-%S-%e", run_cmd]
 
-    with local.env(OMP_NUM_THREADS=str(jobs),
-                   POLLI_LOG_FILE=CFG["slurm"]["extra_log"].value()):
+    with slots.slot(jobs) as cores, \
+            local.env(OMP_NUM_THREADS=str(jobs),
+                      POLLI_LOG_FILE=CFG["slurm"]["extra_log"].value()):
         with track_execution(run_cmd, project, experiment) as run:
             ri = run()
 
@@ -188,6 +199,7 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
     persist_config(ri.db_run, ri.session, {"cores": str(jobs-1),
                                            "cores-config": str(jobs),
                                            "recompilation": "enabled"})
+    slots.persist(ri.db_run, ri.session, cores)
     return ri
 
 
@@ -14,6 +14,17 @@ Measurements
     time.user_s - The time spent in user space in seconds (aka virtual time)
     time.system_s - The time spent in kernel space in seconds (aka system time)
     time.real_s - The time spent overall in seconds (aka Wall clock)
+
+Repetitions
+-----------
+
+Each binary is executed between BB_REPEAT_MIN and BB_REPEAT_MAX times, after
+BB_REPEAT_WARMUP unmeasured warmup runs. We stop as soon as the confidence
+interval of the mean wall clock time is narrower than BB_REPEAT_CI_WIDTH
+times the mean. Every sample is stored as a separate run in the project's
+run group. The last run additionally carries the summary metrics:
+    time.real_s.mean, time.real_s.stddev, time.real_s.ci,
+    time.real_s.ci_rel, time.real_s.n
 """
 import logging
 
@@ -21,7 +32,8 @@ from benchbuild.experiment import RuntimeExperiment
 from benchbuild.utils.actions import (Prepare, Build, Download, Configure,
                                       Clean, MakeBuildDir, Run, Echo)
 from benchbuild.utils.run import track_execution, fetch_time_output
-from benchbuild.utils.db import persist_time, persist_config
+from benchbuild.utils.db import persist_time, persist_config, persist_metrics
+from benchbuild.utils import stats
 from benchbuild.utils.cmd import time
 
 from benchbuild.settings import CFG
@@ -50,6 +62,7 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
                 be the same as the configured project name, if we got wrapped
                 with ::benchbuild.project.wrap_dynamic
             has_stdin: Signals whether we should take care of stdin.
+                Binaries that read from stdin are never repeated.
             may_wrap:
                 Project may signal that it they are not suitable for
                 wrapping. Usually because they scan/parse the output, which
@@ -66,7 +79,10 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
     if may_wrap:
         run_cmd = time["-f", timing_tag + "%U-%S-%e", run_cmd]
 
-    def handle_timing_info(ri):
+    def timed_run():
+        timings = []
+        with track_execution(run_cmd, project, experiment, **kwargs) as run:
+            ri = run()
         if may_wrap:
             timings = fetch_time_output(
                 timing_tag, timing_tag + "{:g}-{:g}-{:g}",
@@ -75,11 +91,36 @@ def run_with_time(project, experiment, config, jobs, run_f, args, **kwargs):
                 persist_time(ri.db_run, ri.session, timings)
             else:
                 logging.warn("No timing information found.")
+        persist_config(ri.db_run, ri.session, {"cores": str(jobs)})
+        return ri, timings
+
+    repeat = CFG["repeat"]
+    if not may_wrap or kwargs.get("has_stdin", False):
+        ri, _ = timed_run()
         return ri
 
-    with track_execution(run_cmd, project, experiment, **kwargs) as run:
-        ri = handle_timing_info(run())
-    persist_config(ri.db_run, ri.session, {"cores": str(jobs)})
+    for _ in range(int(repeat["warmup"].value())):
+        run_cmd(retcode=None)
+
+    min_runs = max(1, int(repeat["min"].value()))
+    max_runs = max(min_runs, int(repeat["max"].value()))
+    ci_width = float(repeat["ci_width"].value())
+    confidence = float(repeat["confidence"].value())
+
+    samples = []
+    while len(samples) < max_runs:
+        ri, timings = timed_run()
+        if ri.retcode != 0 or not timings:
+            break
+        samples.append(timings[0][2])
+        if len(samples) >= min_runs and \
+                stats.converged(samples, ci_width, confidence):
+            break
+
+    if len(samples) > 1:
+        summary = stats.summary(samples, confidence)
+        persist_metrics(ri.db_run, ri.session, {
+            "time.real_s." + k: v for k, v in summary.items()})
     return ri
 
 
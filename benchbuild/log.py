@@ -27,7 +27,7 @@ def print_logs(query, types=None):
 
     for run, log in query:
         print(("{0} @ {1} - {2} id: {3} group: {4} status: {5}".format(
-            run.finished, run.experiment_name, run.project_name,
+            run.end, run.experiment_name, run.project_name,
             run.experiment_group, run.run_group, log.status)))
         print(("command: {0}".format(run.command)))
         if "stderr" in types:
@@ -82,15 +82,25 @@ class BenchBuildLog(cli.Application):
         """ Set the output types to print. """
         self._types = types
 
+    @cli.switch(["-s", "--status"],
+                cli.Set("timeout", "cputime", "output"),
+                list=True,
+                help="Only show runs that were killed for exceeding a limit.")
+    def status(self, statuses):
+        """ Set the limit states to filter for. """
+        self._statuses = statuses
+
     _experiments = None
     _experiment_ids = None
     _projects = None
     _project_ids = None
     _types = None
+    _statuses = None
 
     def main(self):
         """ Run the log command. """
         from benchbuild.utils.schema import Session, Run, RunLog
+        from benchbuild.utils.limits import Status
 
         s = Session()
 
@@ -99,6 +109,10 @@ class BenchBuildLog(cli.Application):
         projects = self._projects
         project_ids = self._project_ids
         types = self._types
+        statuses = self._statuses
+
+        if statuses is not None and types is None:
+            types = []
 
         if types is not None:
             query = s.query(Run, RunLog).filter(Run.id == RunLog.run_id)
@@ -117,6 +131,13 @@ class BenchBuildLog(cli.Application):
         if project_ids is not None:
             query = query.filter(Run.run_group.in_(project_ids))
 
+        if statuses is not None:
+            codes = {"timeout": Status.WALL_TIME,
+                     "cputime": Status.CPU_TIME,
+                     "output": Status.OUTPUT}
+            query = query.filter(
+                RunLog.status.in_([int(codes[x]) for x in statuses]))
+
         if types is not None:
             print_logs(query, types)
         else:
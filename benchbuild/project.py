@@ -81,6 +81,8 @@ class Project(object, metaclass=ProjectDecorator):
     VERSION = None
     SRC_FILE = None
     CONTAINER = Gentoo()
+    # Resource limits for all runs of this project, see utils.limits.
+    LIMITS = {}
 
     def __new__(cls, *args, **kwargs):
         """Create a new project instance and set some defaults."""
@@ -140,7 +142,6 @@ class Project(object, metaclass=ProjectDecorator):
         self.ldflags = []
 
         self.setup_derived_filenames()
-        persist_project(self)
 
     def setup_derived_filenames(self):
         """Construct all derived file names."""
@@ -181,6 +182,7 @@ class Project(object, metaclass=ProjectDecorator):
         CFG["use_database"] = 1
         CFG["db"]["run_group"] = str(self.run_uuid)
         with local.cwd(self.builddir):
+            persist_project(self)
             group, session = begin_run_group(self)
             try:
                 self.run_tests(experiment, ur.run)
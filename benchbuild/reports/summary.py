@@ -0,0 +1,52 @@
+import csv
+import os
+from benchbuild.reports import Report
+import benchbuild.utils.schema as schema
+
+
+Experiment = schema.Experiment
+RunSummary = schema.RunSummary
+
+
+class SummaryReport(Report):
+    """
+    Report the aggregated metrics of every run group.
+
+    Reads the precomputed run_summary table, see
+    benchbuild.utils.db.refresh_run_summary. The report is written next to
+    the raw report, as <outfile>.summary.csv.
+    """
+
+    SUPPORTED_EXPERIMENTS = ["raw"]
+
+    def __init__(self, exp_name, exp_ids, out_path):
+        root, ext = os.path.splitext(out_path)
+        super(SummaryReport, self).__init__(
+            exp_name, exp_ids, root + ".summary" + (ext or ".csv"))
+
+    def report(self):
+        exp_ids = [str(exp_id) for exp_id in self.experiment_ids]
+        qr = self.session.query(
+            Experiment.name, Experiment.begin, Experiment.end,
+            RunSummary.experiment_group, RunSummary.project_name,
+            RunSummary.run_group, RunSummary.metric, RunSummary.count,
+            RunSummary.total, RunSummary.minimum, RunSummary.maximum,
+            RunSummary.mean)\
+            .filter(RunSummary.experiment_group == Experiment.id)\
+            .filter(RunSummary.experiment_group.in_(exp_ids))\
+            .order_by(RunSummary.project_name, RunSummary.run_group,
+                      RunSummary.metric)
+
+        for r in qr:
+            yield r
+
+    def generate(self):
+        results_f = os.path.abspath(self.out_path)
+        with open(results_f, 'w') as csv_f:
+            fieldnames = ["exp_name", "exp_begin", "exp_end", "exp_id",
+                          "project", "run_group", "metric", "count", "total",
+                          "min", "max", "mean"]
+            csv_w = csv.writer(csv_f)
+            csv_w.writerow(fieldnames)
+            for rep in self.report():
+                csv_w.writerow(rep)
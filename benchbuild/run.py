@@ -71,6 +71,25 @@ class BenchBuildRun(cli.Application):
     def group(self, group):
         self._group_name = group
 
+    @cli.switch(["--parallel"],
+                int,
+                help="Run up to N projects of an experiment concurrently")
+    def parallel(self, workers):
+        CFG["scheduler"]["parallel"] = workers
+
+    @cli.switch(["--pipeline"],
+                help="Overlap download & build of upcoming projects with the "
+                     "measurements of the current one")
+    def pipeline(self):
+        CFG["scheduler"]["pipeline"] = True
+
+    @cli.switch(["--resume"],
+                help="Skip all steps that completed in a previous run of the "
+                     "same experiment")
+    def resume(self):
+        CFG["ledger"]["enable"] = True
+        CFG["ledger"]["resume"] = True
+
     pretend = cli.Flag(['p', 'pretend'], default=False)
 
     def main(self):
@@ -124,6 +143,16 @@ class BenchBuildRun(cli.Application):
                     mkdir("-p", builddir)
                     print("Created directory {0}.".format(builddir))
 
+        if CFG["ledger"]["resume"].value() and \
+                "BB_EXPERIMENT_ID" not in os.environ:
+            from benchbuild.utils import ledger
+            for exp_name in self._experiment_names:
+                exp_id = ledger.latest_experiment_id(exp_name)
+                if exp_id is not None:
+                    print("Resuming experiment {0}".format(exp_id))
+                    CFG["experiment_id"] = exp_id
+                    break
+
         actns = []
         for exp_name in self._experiment_names:
             if exp_name in exps:
@@ -142,11 +171,33 @@ class BenchBuildRun(cli.Application):
             print(a)
         print()
 
-        if not self.pretend:
+        if self.pretend:
+            print_estimate(actns)
+        else:
             for a in actns:
                 a()
 
 
+def print_estimate(actns):
+    """
+    Print the predicted wall time of all experiments, if we can.
+
+    Args:
+        actns: The experiment actions we would execute.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from benchbuild.utils import estimate
+
+    pairs = [(a._experiment.name, p) for a in actns
+             for p in a._experiment.projects]
+    try:
+        estimate.print_estimate(
+            pairs, int(CFG["scheduler"]["parallel"].value()),
+            CFG["scheduler"]["pipeline"].value())
+    except SQLAlchemyError as ex:
+        print("No estimate available: {0}".format(ex))
+
+
 def print_projects(exp):
     """
     Print a list of projects registered for that experiment.
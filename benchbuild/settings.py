@@ -13,7 +13,29 @@ import logging
 import copy
 
 from datetime import datetime
-from plumbum import local
+from benchbuild.utils import runtime
+
+
+def available_cpus():
+    """
+    Get the ids of all CPUs we are allowed to run on.
+
+    The ids are taken from the Cpus_allowed mask of our process, which
+    honors cpusets.
+
+    Returns:
+        A sorted list of CPU ids, empty if we cannot find out.
+    """
+    log = logging.getLogger('benchbuild')
+    try:
+        match = re.search(r'(?m)^Cpus_allowed:\s*(.*)$',
+                          open('/proc/self/status').read())
+        if match:
+            mask = int(match.group(1).replace(',', ''), 16)
+            return [i for i in range(mask.bit_length()) if mask & (1 << i)]
+    except IOError:
+        log.debug("Could not get the list of allowed CPUs")
+    return []
 
 
 def available_cpu_count():
@@ -31,15 +53,9 @@ def available_cpu_count():
 
     # cpuset
     # cpuset may restrict the number of *available* processors
-    try:
-        match = re.search(r'(?m)^Cpus_allowed:\s*(.*)$',
-                          open('/proc/self/status').read())
-        if match:
-            res = bin(int(match.group(1).replace(',', ''), 16)).count('1')
-            if res > 0:
-                return res
-    except IOError:
-        log.debug("Could not get the number of allowed CPUs")
+    res = len(available_cpus())
+    if res > 0:
+        return res
 
     # http://code.google.com/p/psutil/
     try:
@@ -225,6 +241,26 @@ class Configuration():
                 for k in self.node:
                     self[k].init_from_env()
 
+    def init_from_snapshot(self, values):
+        """
+        Initialize this node from a flat snapshot, see to_env_dict.
+
+        Like init_from_env, the environment takes precedence. However, only
+        the variables that are actually set are decoded.
+
+        Args:
+            values: A dictionary that maps env variables to values.
+        """
+        if 'default' in self.node:
+            env_var = self.__to_env_var__().upper()
+            if env_var in os.environ or env_var in values:
+                self.node['value'] = runtime.value(env_var, values)
+            elif not self.has_value():
+                self.node['value'] = self.node['default']
+        elif isinstance(self.node, dict):
+            for k in self.node:
+                self[k].init_from_snapshot(values)
+
     def update(self, cfg_dict):
         """
         Update the configuration dictionary with new content.
@@ -328,6 +364,7 @@ def to_env_dict(config):
 # Initialize the global configuration once.
 CFG = Configuration(
     "bb",
+    init=False,
     node={
         "version": {
             "desc": "Version Number",
@@ -521,9 +558,37 @@ CFG['db'] = {
                 "Refer to sqlalchemy for available options.",
         "default": "postgresql+psycopg2"
     },
+    "connect_string": {
+        "desc": "A complete sqlalchemy URL, e.g., sqlite:////tmp/bb.sqlite. "
+                "Overrides all other connection settings.",
+        "default": None
+    },
     "create_functions": {
         "default": False,
         "desc": "Should we recreate our SQL functions from scratch?"
+    },
+    "schema_cache": {
+        "desc": "Directory that remembers the databases whose schema we "
+                "checked already. Defaults to ~/.cache/benchbuild/schema.",
+        "default": None
+    },
+    "async": {
+        "default": False,
+        "desc": "Write run records in a background thread, "
+                "see benchbuild.utils.dbwriter."
+    },
+    "queue_size": {
+        "default": 1000,
+        "desc": "Maximal number of records waiting for the background writer."
+    },
+    "batch_size": {
+        "default": 100,
+        "desc": "Maximal number of records written in one transaction."
+    },
+    "journal": {
+        "default": None,
+        "desc": "Write run records into a local journal in this directory "
+                "first, see benchbuild.utils.journal."
     }
 }
 
@@ -625,6 +690,220 @@ CFG["slurm"] = {
     }
 }
 
+CFG["scheduler"] = {
+    "parallel": {
+        "desc": "Number of projects that may run concurrently. The jobs "
+                "budget (BB_JOBS) is split evenly among them.",
+        "default": 1
+    },
+    "pipeline": {
+        "desc": "Prepare upcoming projects while measuring the current one. "
+                "Only one measurement runs at a time, on the reserved cores. "
+                "Builds keep running on the other cores meanwhile.",
+        "default": False
+    },
+    "reserved_cores": {
+        "desc": "List of CPU ids reserved for measurements in pipeline mode. "
+                "Defaults to the last available CPU.",
+        "default": []
+    }
+}
+
+CFG["ledger"] = {
+    "enable": {
+        "desc": "Record all completed steps in a ledger on disk.",
+        "default": False
+    },
+    "resume": {
+        "desc": "Skip all steps the ledger of this experiment id has "
+                "recorded as completed.",
+        "default": False
+    },
+    "dir": {
+        "desc": "Directory for the ledger files. Defaults to "
+                "<build_dir>/.ledger",
+        "default": None
+    }
+}
+
+CFG["build_cache"] = {
+    "enable": {
+        "desc": "Share build artifacts of identical builds between "
+                "experiments.",
+        "default": False
+    },
+    "dir": {
+        "desc": "Directory for cached build trees. Defaults to "
+                "<tmp_dir>/build-cache",
+        "default": None
+    },
+    "link": {
+        "desc": "How to restore cached build trees: 'reflink' copies, if "
+                "possible with reflinks, 'hardlink' links all files. "
+                "Hardlinks are cheaper, but the cache is not protected from "
+                "projects that modify their build tree in place.",
+        "default": "reflink"
+    }
+}
+
+CFG["compile_cache"] = {
+    "enable": {
+        "desc": "Cache the objects of single translation units in the "
+                "compiler wrapper.",
+        "default": False
+    },
+    "dir": {
+        "desc": "Directory for cached objects. Defaults to "
+                "<tmp_dir>/compile-cache",
+        "default": None
+    },
+    "max_size": {
+        "desc": "Maximal size of the cache in bytes, least recently used "
+                "objects are evicted first.",
+        "default": 5 * 1024 ** 3
+    },
+    "env": {
+        "desc": "Environment variables that influence the compilation.",
+        "default": ["CPATH", "C_INCLUDE_PATH", "CPLUS_INCLUDE_PATH",
+                    "LIBRARY_PATH", "SOURCE_DATE_EPOCH"]
+    }
+}
+
+CFG["repeat"] = {
+    "warmup": {
+        "desc": "Number of unmeasured runs before the measurements start.",
+        "default": 0
+    },
+    "min": {
+        "desc": "Minimum number of measured runs per binary.",
+        "default": 1
+    },
+    "max": {
+        "desc": "Maximum number of measured runs per binary.",
+        "default": 1
+    },
+    "ci_width": {
+        "desc": "Stop repeating, once the confidence interval of the mean "
+                "is narrower than this fraction of the mean.",
+        "default": 0.05
+    },
+    "confidence": {
+        "desc": "Confidence level of the interval: 0.9, 0.95 or 0.99.",
+        "default": 0.95
+    }
+}
+
+CFG["slots"] = {
+    "enable": {
+        "desc": "Pin each measured binary to a disjoint set of cores.",
+        "default": False
+    },
+    "lock_dir": {
+        "desc": "Directory for the per-core lock files, shared by all "
+                "benchbuild processes on this machine.",
+        "default": None
+    }
+}
+
+CFG["capture"] = {
+    "mode": {
+        "desc": "How to capture the output of measured binaries: 'full' "
+                "keeps everything in memory, 'stream' keeps only head and "
+                "tail and writes the rest to a compressed file.",
+        "default": "full"
+    },
+    "head": {
+        "desc": "Bytes kept from the beginning of each stream (stream mode).",
+        "default": 64 * 1024
+    },
+    "tail": {
+        "desc": "Bytes kept from the end of each stream (stream mode).",
+        "default": 64 * 1024
+    },
+    "dir": {
+        "desc": "Directory for the complete output streams. Defaults to "
+                "<build_dir>/.capture/<experiment_id>",
+        "default": None
+    }
+}
+
+CFG["limits"] = {
+    "wall_s": {
+        "desc": "Kill measured binaries after this many seconds of wall "
+                "clock time, 0 disables the limit.",
+        "default": 0
+    },
+    "cpu_s": {
+        "desc": "Limit the CPU time of measured binaries in seconds, "
+                "0 disables the limit.",
+        "default": 0
+    },
+    "as_bytes": {
+        "desc": "Limit the address space of measured binaries in bytes, "
+                "0 disables the limit.",
+        "default": 0
+    },
+    "output_bytes": {
+        "desc": "Kill measured binaries, after they wrote this many bytes "
+                "to stdout and stderr, 0 disables the limit.",
+        "default": 0
+    }
+}
+
+CFG["trace"] = {
+    "enable": {
+        "desc": "Trace all steps, wrappers and runs as Chrome trace.",
+        "default": False
+    },
+    "metrics": {
+        "desc": "Store the duration of each project step in the database.",
+        "default": False
+    },
+    "dir": {
+        "desc": "Directory for the trace files. Defaults to "
+                "<build_dir>/.trace/<experiment_id>",
+        "default": None
+    }
+}
+
+CFG["events"] = {
+    "storage": {
+        "desc": "How to store region events: 'rows' keeps one row per "
+                "event, 'chunks' compacts the rows libpprof writes into "
+                "compressed columnar chunks at the end of the PAPI "
+                "experiments, see benchbuild.utils.events.",
+        "default": "rows"
+    },
+    "chunk_size": {
+        "desc": "Maximum number of events per chunk.",
+        "default": 1 << 16
+    }
+}
+
+CFG["wrapper"] = {
+    "daemon": {
+        "desc": "Serve wrapped binaries from a long-lived wrapper server, "
+                "see benchbuild.utils.wrapserver.",
+        "default": False
+    },
+    "socket": {
+        "desc": "UNIX socket of the wrapper server. Defaults to "
+                "$XDG_RUNTIME_DIR/benchbuild/wrapper.sock or "
+                "<tempdir>/benchbuild-<uid>/wrapper.sock",
+        "default": None
+    },
+    "idle": {
+        "desc": "Seconds without requests, until the wrapper server exits.",
+        "default": 600
+    },
+    "blob_dir": {
+        "desc": "Content-addressed store for the runners of wrapped "
+                "binaries, see benchbuild.utils.blobs. Defaults to "
+                "<build_dir>/.blobs",
+        "default": None
+    }
+}
+
 CFG["perf"] = {
     "config": {
         "default": None,
@@ -657,7 +936,8 @@ CFG["plugins"] = {
     },
     "reports": {
         "default": [
-            "benchbuild.reports.raw"
+            "benchbuild.reports.raw",
+            "benchbuild.reports.summary"
         ],
         "desc": "Report plugins."
     },
@@ -821,7 +1101,15 @@ def __init_config(cfg):
     WARNING: Environment variables do _not_ take precedence over the config
              file right now. (init_from_env will refuse to update the
              value, if there is already one.)
+
+    Generated wrappers activate a frozen snapshot of the configuration
+    instead (see benchbuild.utils.runtime).
     """
+    snapshot = runtime.snapshot()
+    if snapshot is not None:
+        cfg.init_from_snapshot(snapshot)
+        return
+
     config_path = os.getenv("BB_CONFIG_FILE", None)
     if not config_path:
         config_path = find_config()
@@ -835,24 +1123,11 @@ def __init_config(cfg):
 
 
 def update_env():
-    lookup_path = CFG["env"]["lookup_path"].value()
-    lookup_path = os.path.pathsep.join(lookup_path)
-    if "PATH" in os.environ:
-        lookup_path = os.path.pathsep.join([lookup_path, os.environ["PATH"]])
-    os.environ["PATH"] = lookup_path
-
-    lib_path = CFG["env"]["lookup_ld_library_path"].value()
-    lib_path = os.path.pathsep.join(lib_path)
-    if "LD_LIBRARY_PATH" in os.environ:
-        lib_path = os.path.pathsep.join([lib_path,
-                                        os.environ["LD_LIBRARY_PATH"]])
-    os.environ["LD_LIBRARY_PATH"] = lib_path
-
-    # Update local's env property because we changed the environment
-    # of the running python process.
-    local.env.update(PATH=os.environ["PATH"])
-    local.env.update(LD_LIBRARY_PATH=os.environ["LD_LIBRARY_PATH"])
+    runtime.update_env(CFG["env"]["lookup_path"].value(),
+                       CFG["env"]["lookup_ld_library_path"].value())
 
 
 __init_config(CFG)
-update_env()
\ No newline at end of file
+if runtime.snapshot() is None:
+    # An active snapshot did this already.
+    update_env()
\ No newline at end of file
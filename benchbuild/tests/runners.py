@@ -0,0 +1,67 @@
+"""
+Runners for the tests of wrapped binaries.
+"""
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+
+def make_runner():
+    """
+    Return a runner that reports how it was called.
+
+    The runner prints a JSON object with the name of the binary, the
+    arguments, the working directory, ``BB_TEST_VAR``, the compile cache
+    directory of the wrapper's configuration, the CPU affinity, the CPU time
+    limit, whether plumbum was loaded and the project name of dynamic
+    wrappers. Its return code is the number of arguments. If the first
+    argument is ``sleep``, it prints its pid and sleeps instead.
+    """
+    # Nested, so dill pickles it by value.
+    def runner(run_f, args, has_stdin=False, has_stdout=False,
+               project_name=None):
+        import resource
+        from benchbuild.settings import CFG
+        if args[:1] == ["sleep"]:
+            print(os.getpid(), flush=True)
+            time.sleep(60)
+        print(json.dumps({
+            "binary": os.path.basename(run_f),
+            "args": args,
+            "cwd": os.getcwd(),
+            "var": os.environ.get("BB_TEST_VAR"),
+            "dir": CFG["compile_cache"]["dir"].value(),
+            "affinity": sorted(os.sched_getaffinity(0)),
+            "cpu_limit": list(resource.getrlimit(resource.RLIMIT_CPU)),
+            "plumbum": "plumbum" in sys.modules,
+            "project": project_name
+        }))
+        return SimpleNamespace(retcode=len(args))
+    return runner
+
+
+def hide_plumbum(directory):
+    """
+    Shadow plumbum for the wrappers we start.
+
+    Prepend the returned directory to ``PYTHONPATH``, a wrapper that
+    imports plumbum fails.
+    """
+    package = os.path.join(directory, "plumbum")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, "__init__.py"), "w") as init_f:
+        init_f.write("raise ImportError('plumbum is hidden')\n")
+    return directory
+
+
+def make_extension(out_f):
+    """
+    Return a compiler extension that writes the module of the command it
+    gets to :out_f:.
+    """
+    def extension(cmd, **kwargs):
+        with open(out_f, "w") as ext_f:
+            ext_f.write(type(cmd).__module__)
+    return extension
@@ -0,0 +1,95 @@
+"""
+Test the content-addressed blob store of wrapped binaries.
+"""
+import os
+import tempfile
+import unittest
+from functools import partial
+from types import SimpleNamespace
+
+import dill
+
+from benchbuild.experiment import Experiment
+from benchbuild.project import Project
+from benchbuild.settings import CFG
+from benchbuild.utils import blobs, runtime
+
+
+class BlobProject(Project):
+    NAME = "test_blob"
+    DOMAIN = "debug"
+    GROUP = "debug"
+    SRC_FILE = "none"
+
+
+class OtherBlobProject(Project):
+    NAME = "test_blob_other"
+    DOMAIN = "debug"
+    GROUP = "debug"
+    SRC_FILE = "none"
+
+
+class BlobExperiment(Experiment):
+    NAME = "test_blob"
+
+
+def runner(project, experiment, config, run_f, args, **kwargs):
+    return SimpleNamespace(project=project, experiment=experiment,
+                           config=config, args=args)
+
+
+class BlobStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.exp = BlobExperiment(projects=["test_blob", "test_blob_other"])
+        self.project = BlobProject(self.exp)
+        self.runner = partial(runner, self.project, self.exp, CFG)
+        self.project.runtime_extension = self.runner
+        self.project.compiler_extension = partial(
+            runner, OtherBlobProject(self.exp), self.exp, CFG)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def blobs(self):
+        return sorted(f for _, _, files in os.walk(self.tmp.name)
+                      for f in files)
+
+    def test_dedup(self):
+        path = blobs.store(self.runner, self.tmp.name)
+        self.assertEqual(blobs.store(self.runner, self.tmp.name), path)
+        self.assertEqual(blobs.store(partial(runner, self.project, self.exp,
+                                             CFG), self.tmp.name), path)
+        # The spec, the experiment and both projects.
+        self.assertEqual(len(self.blobs()), 4)
+        self.assertLess(os.path.getsize(path),
+                        len(dill.dumps(self.runner, recurse=True)) / 4)
+
+    def test_lazy(self):
+        spec = runtime.load_blob(blobs.store(self.runner, self.tmp.name))
+        result = spec("tool", ["a"])
+        self.assertEqual(result.args, ["a"])
+        self.assertIs(result.config, CFG)
+        self.assertIsInstance(result.project, BlobProject)
+        self.assertIsNot(result.project, self.project)
+        self.assertIs(type(result.experiment), BlobExperiment)
+
+        # Everything else is loaded on first access.
+        back = result.project.experiment
+        self.assertIs(type(back), blobs.Lazy)
+        self.assertIsInstance(blobs.resolve(back), BlobExperiment)
+        self.assertIs(blobs.resolve(back), result.experiment)
+        self.assertIs(result.project.runtime_extension.args[0],
+                      result.project)
+        other = result.project.compiler_extension.args[0]
+        self.assertIs(type(other), blobs.Lazy)
+        self.assertEqual(other.name, "test_blob_other")
+        self.assertIs(type(blobs.resolve(other)), OtherBlobProject)
+
+    def test_changed(self):
+        path = blobs.store(self.runner, self.tmp.name)
+        self.project.version = "changed"
+        changed = blobs.store(self.runner, self.tmp.name)
+        self.assertNotEqual(changed, path)
+        result = runtime.load_blob(changed)("tool", [])
+        self.assertEqual(result.project.version, "changed")
@@ -0,0 +1,118 @@
+"""
+Test the build artifact cache.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchbuild.settings import CFG
+from benchbuild.utils import actions as a
+from benchbuild.utils import buildcache
+
+
+class Dummy(object):
+    NAME = "dummy"
+    VERSION = "1.0"
+
+    def __init__(self, builddir):
+        self.name = self.NAME
+        self.src_file = "dummy.tar.gz"
+        self.builddir = builddir
+        self.cflags = ["-O3"]
+        self.ldflags = []
+        self.compiler_extension = None
+        self.builds = 0
+
+    def version(self):
+        return "deadbeef"
+
+    def build(self):
+        self.builds += 1
+        with open(os.path.join(self.builddir, "dummy"), 'w') as bin_f:
+            bin_f.write("binary")
+        with open(os.path.join(self.builddir, "Makefile"), 'w') as make_f:
+            make_f.write("srcdir = {0}/src\n".format(self.builddir))
+        for ext in ["", ".benchbuild.cc", ".config.json"]:
+            with open(os.path.join(self.builddir, "clang" + ext), 'w'):
+                pass
+
+
+class BuildCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.saved_tmp = CFG["tmp_dir"].value()
+        CFG["tmp_dir"] = self.tmp_dir.name
+        CFG["build_cache"]["enable"] = True
+        CFG["build_cache"]["dir"] = os.path.join(self.tmp_dir.name, "cache")
+        with open(os.path.join(self.tmp_dir.name, "dummy.tar.gz.hash"),
+                  'w') as hash_f:
+            hash_f.write("deadbeef\n")
+
+    def tearDown(self):
+        CFG["tmp_dir"] = self.saved_tmp
+        CFG["build_cache"]["enable"] = False
+        CFG["build_cache"]["dir"] = None
+        self.tmp_dir.cleanup()
+
+    def project(self, name):
+        builddir = os.path.join(self.tmp_dir.name, name)
+        os.makedirs(builddir)
+        return Dummy(builddir)
+
+    def test_hit_skips_build(self):
+        first, second = self.project("raw"), self.project("papi")
+        a.Build(first)()
+        a.Build(second)()
+
+        self.assertEqual((first.builds, second.builds), (1, 0))
+        with open(os.path.join(second.builddir, "dummy")) as bin_f:
+            self.assertEqual(bin_f.read(), "binary")
+        with open(os.path.join(second.builddir, "Makefile")) as make_f:
+            self.assertEqual(make_f.read(),
+                             "srcdir = {0}/src\n".format(second.builddir))
+        self.assertFalse(os.path.exists(os.path.join(second.builddir,
+                                                     "clang")))
+        self.assertFalse(os.path.exists(
+            os.path.join(second.builddir, "clang.config.json")))
+
+    def test_hit_persists_counters(self):
+        CFG["compile_cache"]["enable"] = True
+        try:
+            with mock.patch("benchbuild.utils.compilecache."
+                            "persist_counters") as persist:
+                a.Build(self.project("raw"))()
+                a.Build(self.project("papi"))()
+        finally:
+            CFG["compile_cache"]["enable"] = False
+        self.assertEqual(persist.call_count, 2)
+
+    def test_binary_reference(self):
+        prj = self.project("raw")
+        prj.build()
+        with open(os.path.join(prj.builddir, "dummy"), 'w') as bin_f:
+            bin_f.write("rpath\0{0}/lib".format(prj.builddir))
+        key = buildcache.cache_key(prj)
+        buildcache.store(prj, key)
+        self.assertFalse(buildcache.restore(self.project("papi"), key))
+
+    def test_no_source_hash(self):
+        os.remove(os.path.join(self.tmp_dir.name, "dummy.tar.gz.hash"))
+        self.assertFalse(buildcache.cacheable(self.project("raw")))
+
+    def test_flags_change_the_key(self):
+        first, second = self.project("raw"), self.project("pj-raw")
+        second.cflags = ["-O3", "-mllvm", "-polly"]
+        self.assertNotEqual(buildcache.cache_key(first),
+                            buildcache.cache_key(second))
+
+    def test_extension_changes_the_key(self):
+        first, second = self.project("raw"), self.project("cs")
+        second.compiler_extension = print
+        self.assertNotEqual(buildcache.cache_key(first),
+                            buildcache.cache_key(second))
+
+    def test_bypass_compiler_extension(self):
+        prj = self.project("cs")
+        prj.compiler_extension = print
+        self.assertFalse(buildcache.cacheable(prj))
@@ -0,0 +1,37 @@
+"""
+Test the bulk persistence layer.
+"""
+import unittest
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.utils.db import bulk_insert
+
+
+class BulkInsertTestCase(unittest.TestCase):
+    def setUp(self):
+        self.meta = MetaData()
+        self.table = Table("kv", self.meta, Column("name", String),
+                           Column("value", String), Column("run_id", Integer))
+        engine = create_engine("sqlite://")
+        self.meta.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_bulk_insert(self):
+        rows = [("k{0}".format(i), None if i % 2 else "v", 1)
+                for i in range(1000)]
+        self.assertEqual(
+            bulk_insert(self.session, self.table,
+                        ["name", "value", "run_id"], iter(rows)), 1000)
+        self.session.commit()
+
+        stored = self.session.query(self.table).order_by("name").all()
+        self.assertEqual(sorted(stored), sorted(rows))
+
+    def test_no_rows(self):
+        self.assertEqual(
+            bulk_insert(self.session, self.table, ["name"], []), 0)
@@ -0,0 +1,50 @@
+"""
+Test the bounded capture of output streams.
+"""
+import gzip
+import os
+import tempfile
+import unittest
+
+from plumbum import local, ProcessExecutionError
+
+from benchbuild.settings import CFG
+from benchbuild.utils import capture
+
+
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        CFG["capture"]["dir"] = self.tmp_dir.name
+        CFG["capture"]["head"] = 16
+        CFG["capture"]["tail"] = 16
+
+    def tearDown(self):
+        CFG["capture"]["dir"] = None
+        CFG["capture"]["head"] = 64 * 1024
+        CFG["capture"]["tail"] = 64 * 1024
+        self.tmp_dir.cleanup()
+
+    def test_short_output_is_kept(self):
+        echo = local["sh"]["-c", "echo out; echo err >&2"]
+        ret, stdout, stderr = capture.run(echo, "short")
+        self.assertEqual((ret, stdout, stderr), (0, "out\n", "err\n"))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_long_output_is_truncated(self):
+        seq = local["seq"]["1", "10000"]
+        _, stdout, _ = capture.run(seq, "long")
+        spill = os.path.join(self.tmp_dir.name, "long.stdout.gz")
+
+        self.assertTrue(stdout.startswith("1\n2\n3\n"))
+        self.assertTrue(stdout.endswith("9999\n10000\n"))
+        self.assertIn(spill, stdout)
+        with gzip.open(spill) as spill_f:
+            self.assertEqual(spill_f.read().decode().split(),
+                             [str(i) for i in range(1, 10001)])
+
+    def test_unexpected_retcode(self):
+        self.assertRaises(ProcessExecutionError, capture.run,
+                          local["false"], "fail")
+        ret, _, _ = capture.run(local["false"], "fail", retcode=None)
+        self.assertEqual(ret, 1)
@@ -0,0 +1,127 @@
+"""
+Test the compile cache of the compiler wrapper.
+"""
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from plumbum import local
+from sqlalchemy.exc import OperationalError
+
+from benchbuild.settings import CFG
+from benchbuild.utils import compilecache
+from benchbuild.utils.compiler import ExperimentCommand, SinglePassExtension
+
+
+class CompileCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = {k: CFG["compile_cache"][k].value()
+                      for k in ("enable", "dir")}
+        self.saved_id = CFG["experiment_id"].value()
+        CFG["compile_cache"]["enable"] = True
+        CFG["compile_cache"]["dir"] = os.path.join(self.tmp.name, "cache")
+        CFG["experiment_id"] = "7b3ae6c6-0e5b-4a2e-9d0b-3c3e6c1f0a11"
+        self.compiled = 0
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            CFG["compile_cache"][key] = value
+        CFG["experiment_id"] = self.saved_id
+        self.tmp.cleanup()
+
+    def compile(self, source, text):
+        src = os.path.join(self.tmp.name, source)
+        obj = os.path.splitext(src)[0] + ".o"
+        with open(src, "w") as src_f:
+            src_f.write(text)
+
+        def run(_):
+            self.compiled += 1
+            with open(obj, "w") as obj_f:
+                obj_f.write("obj:" + text)
+            return 0, "", "warning\n"
+
+        job = compilecache.job(["-O2", "-c", src, "-o", obj])
+        result = compilecache.cached_compile(job, local["true"],
+                                             local["cat"][src], run, ["-O3"])
+        with open(obj) as obj_f:
+            return result, obj_f.read()
+
+    def test_hit(self):
+        self.assertEqual(self.compile("a.c", "int a;"),
+                         ((0, "", "warning\n"), "obj:int a;"))
+        os.remove(os.path.join(self.tmp.name, "a.o"))
+        self.assertEqual(self.compile("a.c", "int a;"),
+                         ((0, "", "warning\n"), "obj:int a;"))
+        self.assertEqual(self.compiled, 1)
+
+        # Same source under a different name, different source.
+        self.compile("b.c", "int a;")
+        self.compile("a.c", "int b;")
+        self.assertEqual(self.compiled, 2)
+        self.assertEqual(compilecache.counters(CFG["experiment_id"]),
+                         {"hits": 2, "misses": 2})
+
+    def test_evict(self):
+        self.compile("a.c", "int a;")
+        self.compile("b.c", "int b;")
+        old = time.time() - 100
+        for sub in os.scandir(compilecache.cache_dir()):
+            if len(sub.name) == 2:
+                for obj in os.scandir(sub.path):
+                    if obj.name.endswith(".o"):
+                        os.utime(obj.path, (old, old))
+                        old += 10
+        self.assertEqual(compilecache.evict(25), 1)
+        self.compile("b.c", "int b;")
+        self.compile("a.c", "int a;")
+        self.assertEqual(self.compiled, 3)
+
+    def test_build_dirs(self):
+        cc = local["true"]
+        for build in ["a", "b"]:
+            build_dir = os.path.join(self.tmp.name, build, "build")
+            os.makedirs(build_dir)
+            src = os.path.join(build_dir, "a.c")
+            obj = os.path.join(build_dir, "a.o")
+            with open(src, "w") as src_f:
+                src_f.write("int a;")
+
+            def run(_, obj=obj):
+                self.compiled += 1
+                with open(obj, "w") as obj_f:
+                    obj_f.write("obj")
+                return 0, "", ""
+
+            flags = ["-O2", "-c", src, "-o", obj]
+            cmd = ExperimentCommand(cc, ["-Qunused-arguments"],
+                                    [flags]).with_env(LC_ALL="C")
+            compilecache.cached_compile(compilecache.job(flags), cmd,
+                                        local["cat"][src], run)
+            self.assertTrue(os.path.exists(obj))
+        self.assertEqual(self.compiled, 1)
+
+    def test_size_file(self):
+        self.compile("a.c", "int a;")
+        size_f = os.path.join(compilecache.cache_dir(), compilecache.SIZE_F)
+        with open(size_f) as size:
+            total = int(size.read())
+        self.assertGreater(total, 0)
+        with mock.patch("os.scandir") as scandir:
+            self.compile("b.c", "int b;")
+            scandir.assert_not_called()
+        with open(size_f) as size:
+            self.assertGreater(int(size.read()), total)
+
+    def test_persist_counters(self):
+        error = OperationalError("INSERT", {}, Exception("unreachable"))
+        with mock.patch("benchbuild.utils.schema.Session",
+                        side_effect=error):
+            compilecache.persist_counters(CFG["experiment_id"].value())
+
+    def test_bypass(self):
+        self.assertTrue(compilecache.enabled(None))
+        self.assertFalse(compilecache.enabled(SinglePassExtension()))
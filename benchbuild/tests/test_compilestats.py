@@ -0,0 +1,73 @@
+"""
+Test the single-pass collection of compilestats.
+"""
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from benchbuild.experiments import compilestats
+from benchbuild.settings import CFG
+
+STATS = """\
+===-------------------------------------------------------------------------===
+                          ... Statistics Collected ...
+===-------------------------------------------------------------------------===
+
+  12 instcombine - Number of insts combined
+   3 licm        - Number of instructions hoisted out of loop
+"""
+
+
+class CollectCompilestatsTestCase(unittest.TestCase):
+    def setUp(self):
+        project = SimpleNamespace(NAME="p", run_uuid="g")
+        experiment = SimpleNamespace(NAME="cs", name="cs")
+        self.ext = compilestats.CollectCompilestats(project, experiment, CFG)
+        self.run = mock.patch.multiple("benchbuild.utils.run",
+                                       begin=mock.DEFAULT, end=mock.DEFAULT,
+                                       fail=mock.DEFAULT)
+        self.mocks = self.run.start()
+        self.mocks["begin"].return_value = ("run", "session")
+        self.persist = mock.patch(
+            "benchbuild.utils.db.persist_compilestats").start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def compile(self, retcode):
+        flags = self.ext.flags()
+        self.assertEqual(flags[:3], ["-mllvm", "-stats", "-mllvm"])
+        stats_f = flags[3].split("=", 1)[1]
+        with open(stats_f, "a") as out:
+            out.write(STATS)
+        self.ext.begin("clang")
+        self.ext.end("clang", retcode, "out", "err")
+        self.assertFalse(os.path.exists(stats_f))
+
+    def test_single_pass(self):
+        self.compile(0)
+        self.mocks["begin"].assert_called_once_with("clang", self.ext.project,
+                                                    "cs", "g")
+        self.mocks["end"].assert_called_once_with("run", "session", "out",
+                                                  "err")
+        stats = self.persist.call_args[0][2]
+        self.assertEqual([(s.component, s.name, s.value) for s in stats],
+                         [("instcombine", "Number of insts combined", 12),
+                          ("licm", "Number of instructions hoisted out of "
+                           "loop", 3)])
+
+    def test_failed_compile(self):
+        self.compile(1)
+        self.mocks["fail"].assert_called_once_with("run", "session", 1,
+                                                   "out", "err")
+        self.persist.assert_not_called()
+
+    def test_filter(self):
+        saved = CFG["cs"]["components"].value()
+        CFG["cs"]["components"] = ["licm"]
+        try:
+            stats = compilestats.filter_compilestats(STATS, CFG)
+        finally:
+            CFG["cs"]["components"] = saved
+        self.assertEqual([s.component for s in stats], ["licm"])
@@ -0,0 +1,53 @@
+"""
+Test the content-addressed configuration storage.
+"""
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.settings import CFG
+from benchbuild.utils import schema as s
+from benchbuild.utils.db import persist_config_blob
+
+
+class ConfigBlobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = s.create_db_engine("sqlite://")
+        self.engine.execute(text(
+            'CREATE TABLE log (run_id INTEGER PRIMARY KEY, "begin" DATETIME, '
+            '"end" DATETIME, status INTEGER, config VARCHAR, '
+            'stderr VARCHAR, stdout VARCHAR)'))
+        s.BASE.metadata.create_all(self.engine)
+        s.upgrade(self.engine)
+        s.upgrade(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_deduplicate(self):
+        known = "run_id" in CFG["db"]
+        saved = CFG["db"]["run_id"].value() if known else None
+        try:
+            CFG["db"]["run_id"] = 1
+            first = persist_config_blob(self.session, CFG)
+            CFG["db"]["run_id"] = 2
+            self.assertEqual(persist_config_blob(self.session, CFG), first)
+        finally:
+            if known:
+                CFG["db"]["run_id"] = saved
+            else:
+                del CFG["db"].node["run_id"]
+        self.assertEqual(self.session.query(s.ConfigBlob).count(), 1)
+
+    def test_compat_view(self):
+        digest = persist_config_blob(self.session, CFG)
+        self.session.add(s.RunLog(run_id=1, config_hash=digest))
+        self.session.add(s.RunLog(run_id=2, config="old"))
+        self.session.commit()
+
+        configs = dict(self.session.execute(
+            "SELECT run_id, config FROM log_with_config").fetchall())
+        self.assertIn("BB_DB_NAME=", configs[1])
+        self.assertEqual(configs[2], "old")
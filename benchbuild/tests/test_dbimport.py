@@ -0,0 +1,100 @@
+"""
+Test the portable schema and the database import.
+"""
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.db import merge
+from benchbuild.utils import schema as s
+
+
+class DBImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.urls = [
+            "sqlite:///" + os.path.join(self.tmp.name, name)
+            for name in ["local.sqlite", "central.sqlite"]
+        ]
+        self.sessions = []
+        for url in self.urls:
+            engine = s.create_db_engine(url)
+            s.BASE.metadata.create_all(engine)
+            self.sessions.append(sessionmaker(bind=engine)())
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+        self.tmp.cleanup()
+
+    def add_run(self, session, exp_id, command):
+        run = s.Run(command=command, project_name="p", experiment_name="e",
+                    run_group=str(uuid.uuid4()), experiment_group=exp_id,
+                    begin=datetime.now(), status="completed")
+        session.add(run)
+        session.flush()
+        session.add(s.Metric(name="time.real_s", value=1.5, run_id=run.id,
+                             experiment_group=exp_id))
+        session.add(s.CompileStat(name="n", component="c", value=2,
+                                  run_id=run.id, experiment_group=exp_id))
+        session.add(s.RunLog(run_id=run.id, experiment_group=exp_id,
+                             status=0, stdout="out"))
+        return run
+
+    def test_portable_types(self):
+        local, _ = self.sessions
+        exp_id = uuid.uuid4()
+        local.add(s.Experiment(name="e", id=exp_id))
+        local.add(s.Project(name="p"))
+        run = self.add_run(local, exp_id, "a")
+        local.commit()
+
+        self.assertEqual(local.query(s.Experiment.id).one()[0], exp_id)
+        self.assertEqual(local.query(s.Run.experiment_group).one()[0],
+                         str(exp_id))
+        self.assertEqual(
+            local.query(s.Metric.value).filter_by(run_id=run.id).one()[0],
+            1.5)
+        self.assertEqual(
+            local.execute("PRAGMA journal_mode").scalar(), "wal")
+
+    def test_merge(self):
+        local, central = self.sessions
+        exp_id = uuid.uuid4()
+        for session in self.sessions:
+            session.add(s.Project(name="p"))
+        central.add(s.Experiment(name="e", id=uuid.uuid4()))
+        self.add_run(central, central.query(s.Experiment.id).scalar(), "c")
+        central.commit()
+
+        local.add(s.Experiment(name="e", id=exp_id))
+        self.add_run(local, exp_id, "a")
+        self.add_run(local, exp_id, "b")
+        local.add(s.JournalEntry(id="local"))
+        local.commit()
+
+        counts = merge(self.urls[0], central)
+        self.assertEqual(counts["run"], 2)
+        self.assertNotIn("journal_applied", counts)
+        self.assertEqual(central.query(s.JournalEntry).count(), 0)
+        self.assertEqual(counts["run_summary"], 2)
+        self.assertEqual(central.query(s.RunSummary).filter_by(
+            experiment_group=str(exp_id)).count(), 2)
+        self.assertEqual(counts["experiment"], 1)
+        self.assertEqual(counts["project"], 0)
+        self.assertEqual(counts["metrics"], 2)
+        self.assertEqual(central.query(s.Run).count(), 3)
+        self.assertEqual(central.query(s.CompileStat).count(), 3)
+
+        for run in central.query(s.Run).filter(s.Run.command != "c"):
+            self.assertEqual(run.experiment_group, str(exp_id))
+            log = central.query(s.RunLog).filter_by(run_id=run.id).one()
+            self.assertEqual(log.stdout, "out")
+
+        counts = merge(self.urls[0], central)
+        self.assertEqual(sum(counts.values()), 0)
+        self.assertEqual(central.query(s.Run).count(), 3)
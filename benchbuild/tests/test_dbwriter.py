@@ -0,0 +1,110 @@
+"""
+Test the asynchronous database writer.
+"""
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table,
+                        create_engine)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.utils import dbwriter
+from benchbuild.utils.db import bulk_insert
+from benchbuild.utils.dbwriter import (DBWriter, DeferredSession, PendingRun,
+                                       WriteError)
+
+
+class DBWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.meta = MetaData()
+        self.run = Table("run", self.meta,
+                         Column("id", Integer, primary_key=True),
+                         Column("status", String), Column("end", DateTime))
+        self.log = Table("log", self.meta,
+                         Column("run_id", Integer, primary_key=True),
+                         Column("stdout", String), Column("stderr", String),
+                         Column("status", Integer), Column("end", DateTime))
+        self.kv = Table("kv", self.meta, Column("name", String),
+                        Column("run_id", Integer))
+        engine = create_engine(
+            "sqlite:///" + os.path.join(self.tmp.name, "db.sqlite"))
+        self.meta.create_all(engine)
+        self.sessions = sessionmaker(bind=engine)
+        self.writer = DBWriter(self.sessions, self.meta, maxsize=8, batch=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def query(self, table):
+        session = self.sessions()
+        try:
+            return session.query(table).all()
+        finally:
+            session.close()
+
+    def test_insert_update(self):
+        for i in range(20):
+            self.writer.put(("insert", "run", [{"id": i, "status": "new"}]))
+        self.writer.put(("update", "run", ("id", 3), {"status": "done"}))
+        self.writer.flush()
+
+        runs = {r[0]: r[1] for r in self.query(self.run)}
+        self.assertEqual(len(runs), 20)
+        self.assertEqual(runs[3], "done")
+        self.assertEqual(self.writer.failed, 0)
+
+    def test_deferred_session(self):
+        session = DeferredSession(self.writer)
+        run = PendingRun(id=1, project_name="p", status="running")
+        self.writer.put(("insert", "run", [{"id": 1, "status": "running"}]))
+        self.writer.put(("insert", "log", [{"run_id": 1}]))
+        self.assertEqual(
+            bulk_insert(session, self.kv, ["name", "run_id"],
+                        [("a", 1), ("b", 1)]), 2)
+        session.end_run(run, "failed", 2, "out", "err")
+        self.assertEqual(session.query(self.kv).count(), 2)
+        session.commit()
+        self.writer.flush()
+
+        self.assertEqual(run.status, "failed")
+        self.assertEqual(self.query(self.run)[0][:2], (1, "failed"))
+        self.assertEqual(self.query(self.log)[0][:4], (1, "out", "err", 2))
+        self.assertEqual(sorted(self.query(self.kv)), [("a", 1), ("b", 1)])
+
+    def test_failed_batch(self):
+        self.writer.put(("insert", "run", [{"id": 1}]))
+        self.writer.put(("insert", "run", [{"id": 1}]))
+        self.writer.put(("insert", "run", [{"id": 2}]))
+        with self.assertRaises(WriteError) as ctx:
+            self.writer.flush()
+        self.assertEqual(ctx.exception.failed, 1)
+        self.assertEqual(self.writer.failed, 1)
+        # Only the failing record is lost, and reported once.
+        self.assertEqual(sorted(r[0] for r in self.query(self.run)), [1, 2])
+        self.writer.flush()
+
+    def test_retry(self):
+        calls = []
+
+        def unavailable():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("connect", {}, Exception("down"))
+            return self.sessions()
+
+        saved = dbwriter.RETRY_DELAYS
+        dbwriter.RETRY_DELAYS = (0, 0, 0)
+        try:
+            writer = DBWriter(unavailable, self.meta)
+            writer.put(("insert", "run", [{"id": 1}]))
+            writer.flush()
+        finally:
+            dbwriter.RETRY_DELAYS = saved
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(self.query(self.run)), 1)
+
+    def test_no_sequence(self):
+        self.assertIsNone(self.writer.allocate_run_id())
@@ -0,0 +1,95 @@
+"""
+Test the wall time prediction for `benchbuild run --pretend`.
+"""
+import unittest
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.settings import CFG
+from benchbuild.utils import estimate, tracing
+from benchbuild.utils import schema as s
+
+
+class EstimateTestCase(unittest.TestCase):
+    estimates = {
+        ("raw", "a"): (400.0, 100.0),
+        ("raw", "b"): (300.0, 200.0),
+        ("raw", "c"): (300.0, 250.0),
+        ("raw", "d"): (200.0, 50.0)
+    }
+
+    def test_sequential(self):
+        prediction = estimate.predict(self.estimates)
+        self.assertEqual(prediction["total"], 1200.0)
+        self.assertEqual(prediction["makespan"], 1200.0)
+        self.assertEqual(prediction["critical_path"], 400.0)
+
+    def test_parallel(self):
+        prediction = estimate.predict(self.estimates, workers=2)
+        self.assertEqual(prediction["makespan"], 600.0)
+
+        prediction = estimate.predict(self.estimates, workers=8)
+        self.assertEqual(prediction["makespan"], 400.0)
+
+    def test_pipeline_serializes_measurements(self):
+        prediction = estimate.predict(self.estimates, workers=8,
+                                      pipeline=True)
+        self.assertEqual(prediction["critical_path"], 600.0)
+        self.assertEqual(prediction["makespan"], 600.0)
+
+    def test_pipeline_workers(self):
+        prediction = estimate.predict(self.estimates, workers=1,
+                                      pipeline=True)
+        self.assertEqual(prediction["workers"], 2)
+        self.assertEqual(prediction["makespan"], 600.0)
+
+    def test_empty(self):
+        prediction = estimate.predict({}, workers=4)
+        self.assertEqual(prediction["makespan"], 0)
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(engine)
+        self.sessions = sessionmaker(bind=engine)
+        self.saved = CFG["experiment_id"].value()
+        CFG["experiment_id"] = str(uuid.uuid4())
+        session = self.sessions()
+        session.add(s.Experiment(name="raw",
+                                 id=uuid.UUID(CFG["experiment_id"].value())))
+        session.commit()
+
+    def tearDown(self):
+        CFG["experiment_id"] = self.saved
+
+    def test_step_durations(self):
+        project = SimpleNamespace(name="p", run_uuid=uuid.uuid4(),
+                                  experiment=SimpleNamespace(name="raw"))
+        session = self.sessions()
+        with mock.patch.object(s, "Session", lambda: session):
+            tracing.persist_duration(project, "BUILD", datetime.now(), 100.0)
+            tracing.persist_duration(project, "RUN", datetime.now(), 40.0)
+            self.assertEqual(session.query(s.Run).count(), 0)
+            self.assertEqual(estimate.history([("raw", "p")]),
+                             {("raw", "p"): (140.0, 40.0)})
+
+    def test_fallback_adds_build_time(self):
+        project = SimpleNamespace(name="p", run_uuid=uuid.uuid4(),
+                                  experiment=SimpleNamespace(name="raw"))
+        session = self.sessions()
+        session.add(s.Run(command="p", project_name="p",
+                          experiment_name="papi", run_group=uuid.uuid4(),
+                          experiment_group=CFG["experiment_id"].value(),
+                          begin=datetime(2018, 1, 1, 0, 0, 0),
+                          end=datetime(2018, 1, 1, 0, 0, 30)))
+        session.commit()
+        with mock.patch.object(s, "Session", lambda: session):
+            tracing.persist_duration(project, "BUILD", datetime.now(), 100.0)
+            tracing.persist_duration(project, "RUN", datetime.now(), 40.0)
+            self.assertEqual(estimate.history([("papi", "p")]),
+                             {("papi", "p"): (130.0, 30.0)})
@@ -0,0 +1,135 @@
+"""
+Test the columnar event storage.
+"""
+import contextlib
+import io
+import unittest
+import uuid
+from unittest import mock
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.db import BenchBuildDB
+
+from benchbuild.settings import CFG
+from benchbuild.utils import events
+from benchbuild.utils import schema as s
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_events(count):
+    return [("region{0}".format(i % 3), 1000000 + 10 * i, i % 7, i, i % 2,
+             4711 + i % 2) for i in range(count)]
+
+
+class EventsTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        evts = make_events(1000)
+        chunk = events.encode(evts)
+        self.assertEqual(events.decode(chunk), evts)
+        self.assertLess(len(chunk), len(repr(evts)) // 10)
+        self.assertEqual(events.decode(events.encode([])), [])
+
+    def test_persist_chunks(self):
+        engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        run = s.Run(command="c")
+        session.add(run)
+        session.commit()
+
+        saved = CFG["events"]["chunk_size"].value()
+        CFG["events"]["storage"] = "chunks"
+        CFG["events"]["chunk_size"] = 400
+        try:
+            events.persist_events(run, session, make_events(1000))
+        finally:
+            CFG["events"]["storage"] = "rows"
+            CFG["events"]["chunk_size"] = saved
+
+        self.assertEqual(session.query(s.EventChunk).count(), 3)
+        stored = [e for chunk in events.load_chunks(session, [run.id])
+                  for e in events.decode(chunk)]
+        self.assertEqual(stored, make_events(1000))
+        session.close()
+
+    @unittest.skipIf(numpy is None, "requires numpy")
+    def test_region_totals(self):
+        evts = make_events(1000)
+        chunks = [events.encode(evts[:500]), events.encode(evts[500:])]
+
+        expected = {}
+        for name, _, duration, _, _, _ in evts:
+            count, total = expected.get(name, (0, 0))
+            expected[name] = (count + 1, total + duration)
+        self.assertEqual(events.region_totals(chunks), expected)
+
+        odd = events.region_totals(chunks, types=[1])
+        self.assertEqual(sum(c for c, _ in odd.values()), 500)
+
+        header, values = events.decode_numpy(chunks[0])
+        self.assertEqual(list(values["start"][:2]), [1000000, 1000010])
+
+
+class CompactTestCase(unittest.TestCase):
+    def setUp(self):
+        engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(engine)
+        self.sessions = sessionmaker(bind=engine)
+        self.session = self.sessions()
+        self.exp_ids = [str(uuid.uuid4()) for _ in range(2)]
+        self.runs = []
+        for exp_id in self.exp_ids:
+            run = s.Run(command="c", experiment_group=exp_id)
+            self.session.add(run)
+            self.session.flush()
+            # libpprof writes rows, in no particular order.
+            for table, evts in [(s.Event, make_events(1000)),
+                                (s.PerfEvent, make_events(10))]:
+                self.session.execute(table.__table__.insert(), [
+                    dict(zip(events.COLUMNS, e), run_id=run.id)
+                    for e in reversed(evts)])
+            self.runs.append(run.id)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def stored(self, run_id, kind="events"):
+        return [e for chunk in events.load_chunks(self.session, [run_id],
+                                                  kind)
+                for e in events.decode(chunk)]
+
+    def test_compact(self):
+        counts = events.compact(self.session, self.exp_ids[0], 400)
+        self.assertEqual(counts, {"events": (1, 1000),
+                                  "perf_events": (1, 10)})
+        self.assertEqual(self.stored(self.runs[0]), make_events(1000))
+        self.assertEqual(self.stored(self.runs[0], "perf_events"),
+                         make_events(10))
+        self.assertEqual(self.session.query(s.EventChunk).count(), 4)
+        self.assertEqual(self.session.query(s.Event.run_id).distinct().all(),
+                         [(self.runs[1],)])
+
+        # New rows of a compacted run are appended.
+        self.session.execute(s.Event.__table__.insert(), [
+            dict(zip(events.COLUMNS, e), run_id=self.runs[0])
+            for e in make_events(1010)[1000:]])
+        self.session.commit()
+        events.compact(self.session, self.exp_ids[0], 400)
+        self.assertEqual(self.stored(self.runs[0]), make_events(1010))
+
+    def test_command(self):
+        out = io.StringIO()
+        with mock.patch("benchbuild.utils.schema.Session", self.sessions), \
+                contextlib.redirect_stdout(out):
+            _, retcode = BenchBuildDB.run(["db", "compact-events"],
+                                          exit=False)
+        self.assertFalse(retcode)
+        self.assertIn("events: 2000 events of 2 runs", out.getvalue())
+        self.assertEqual(self.session.query(s.Event).count(), 0)
+        self.assertEqual(self.session.query(s.PerfEvent).count(), 0)
@@ -0,0 +1,156 @@
+"""
+Test the local write-ahead journal.
+"""
+import glob
+import os
+import tempfile
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.settings import CFG
+from benchbuild.utils import actions, db, dbwriter, journal
+from benchbuild.utils import schema as s
+from benchbuild.utils.db import bulk_insert
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "journal")
+        engine = s.create_db_engine(
+            "sqlite:///" + os.path.join(self.tmp.name, "db.sqlite"))
+        s.BASE.metadata.create_all(engine)
+        self.sessions = sessionmaker(bind=engine)
+        self.session = self.sessions()
+        self.saved = CFG["experiment_id"].value()
+        CFG["experiment_id"] = str(uuid.uuid4())
+
+    def tearDown(self):
+        CFG["experiment_id"] = self.saved
+        self.session.close()
+        self.tmp.cleanup()
+
+    def unreachable(self):
+        url = "sqlite:///" + os.path.join(self.tmp.name, "missing", "db")
+        return sessionmaker(bind=s.create_db_engine(url))()
+
+    def write_journal(self):
+        writer = journal.JournalWriter(self.unreachable, s.BASE.metadata,
+                                       self.directory)
+        project = SimpleNamespace(name="p", run_uuid=uuid.uuid4())
+        group, group_session = writer.begin_run_group(project)
+        run, session = writer.begin_run("cmd", project, "raw",
+                                        project.run_uuid)
+        self.assertLess(run.id, 0)
+        bulk_insert(session, s.Metric,
+                    ["name", "value", "run_id", "experiment_group"],
+                    [("time.real_s", 2.0, run.id, run.experiment_group)])
+        session.end_run(run, "completed", 0, "out", "err")
+        group_session.end_run_group(group, "completed")
+
+        writer.flush()
+        self.assertEqual(writer.failed, 1)
+        return writer.journal.path
+
+    def test_replay(self):
+        path = self.write_journal()
+        exp_id = CFG["experiment_id"].value()
+        # The replaying process belongs to another experiment.
+        CFG["experiment_id"] = str(uuid.uuid4())
+
+        # Replaying the same entries again changes nothing.
+        self.assertEqual(journal.replay(path, self.sessions,
+                                        s.BASE.metadata)[0], 9)
+        self.assertEqual(journal.replay(path, self.sessions,
+                                        s.BASE.metadata)[0], 0)
+
+        counts, failed = journal.replay_directory(
+            self.directory, self.sessions, s.BASE.metadata)
+        self.assertEqual((counts, failed), ({path: 0}, {}))
+        self.assertEqual(glob.glob(os.path.join(self.directory, "*")), [])
+
+        run = self.session.query(s.Run).one()
+        self.assertGreater(run.id, 0)
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(str(run.experiment_group), exp_id)
+        for table in (s.Metric, s.RunLog):
+            self.assertEqual(
+                [str(g) for g, in self.session.query(table.experiment_group)],
+                [exp_id])
+        self.assertEqual(
+            self.session.query(s.Metric.run_id, s.Metric.name).all(),
+            [(run.id, "time.real_s")])
+        self.assertEqual(self.session.query(s.RunLog.stdout).all(),
+                         [("out",)])
+        self.assertEqual(self.session.query(s.RunGroup.status).all(),
+                         [("completed",)])
+        self.assertEqual(self.session.query(s.RunSummary.total).all(),
+                         [(2.0,)])
+
+        # The removed journal is forgotten.
+        self.assertEqual(self.session.query(s.JournalEntry).count(), 0)
+        self.assertEqual(self.session.query(s.JournalRun).count(), 0)
+
+    def test_close(self):
+        path = self.write_journal()
+        writer = journal.JournalWriter(self.unreachable, s.BASE.metadata,
+                                       self.directory)
+        writer.journal.path = path
+        writer.close()
+        self.assertTrue(os.path.exists(path))
+
+        writer = journal.JournalWriter(self.sessions, s.BASE.metadata,
+                                       self.directory)
+        writer.begin_run_group(SimpleNamespace(name="p",
+                                               run_uuid=uuid.uuid4()))
+        self.assertTrue(writer.replay())
+        self.assertGreater(self.session.query(s.JournalEntry).count(), 0)
+        writer.close()
+        self.assertFalse(os.path.exists(writer.journal.path))
+        self.assertEqual(self.session.query(s.JournalEntry).count(), 0)
+
+    def test_experiment(self):
+        writer = journal.JournalWriter(self.unreachable, s.BASE.metadata,
+                                       self.directory)
+        project = SimpleNamespace(name="p", domain="d", group_name="g",
+                                  src_uri="http://x", version="1",
+                                  experiment="e")
+        step = actions.Experiment(SimpleNamespace(name="e"), [])
+        self.addCleanup(getattr(db, "__REGISTERED").discard, "p")
+        with mock.patch.object(dbwriter, "get", return_value=writer):
+            experiment, session = step.begin_transaction()
+            step.register_projects([SimpleNamespace(_obj=project)])
+            step.end_transaction(experiment, session)
+        writer.flush()
+        self.assertEqual(writer.failed, 1)
+
+        counts, failed = journal.replay_directory(
+            self.directory, self.sessions, s.BASE.metadata)
+        self.assertEqual((counts, failed), ({writer.journal.path: 5}, {}))
+        row = self.session.query(s.Experiment).one()
+        self.assertEqual((str(row.id), row.name),
+                         (CFG["experiment_id"].value(), "e"))
+        self.assertLessEqual(row.begin, row.end)
+        self.assertEqual(self.session.query(s.Project.name).all(), [("p",)])
+
+    def test_incomplete_entry(self):
+        path = self.write_journal()
+        with open(path, 'a') as journal_f:
+            journal_f.write('{"id": "x", "rec')
+        entries, offset = journal.read(path)
+        self.assertEqual(len(entries), 9)
+        self.assertLess(offset, os.path.getsize(path))
+
+    def test_inline_replay(self):
+        writer = journal.JournalWriter(self.sessions, s.BASE.metadata,
+                                       self.directory)
+        project = SimpleNamespace(name="p", run_uuid=uuid.uuid4())
+        writer.begin_run_group(project)
+        writer.flush()
+        self.assertEqual(writer.failed, 0)
+        self.assertFalse(os.path.exists(writer.journal.path))
+        self.assertEqual(self.session.query(s.RunGroup).count(), 1)
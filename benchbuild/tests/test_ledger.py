@@ -0,0 +1,114 @@
+"""
+Test the step ledger.
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+from benchbuild.settings import CFG
+from benchbuild.utils import actions as a
+from benchbuild.utils import ledger
+
+
+class Dummy(object):
+    def __init__(self, builddir):
+        self.name = "dummy"
+        self.builddir = builddir
+        self.cflags = []
+        self.ldflags = []
+        self.experiment = self
+
+
+class Count(a.Step):
+    NAME = "COUNT"
+    DESCRIPTION = "Count the calls of this step."
+
+    def __init__(self, obj, fail=False):
+        super(Count, self).__init__(obj)
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            return a.StepResult.ERROR
+
+    def onerror(self):
+        pass
+
+    def __str__(self, indent=0):
+        return "* count"
+
+
+class LedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.exp_id = CFG["experiment_id"].value()
+        CFG["ledger"]["dir"] = self.tmp_dir.name
+        CFG["ledger"]["enable"] = True
+        CFG["ledger"]["resume"] = True
+        CFG["experiment_id"] = "ledger-test"
+        self.obj = Dummy(self.tmp_dir.name)
+
+    def tearDown(self):
+        CFG["ledger"]["dir"] = None
+        CFG["ledger"]["enable"] = False
+        CFG["ledger"]["resume"] = False
+        CFG["experiment_id"] = self.exp_id
+        self.tmp_dir.cleanup()
+
+    def test_resume_at_first_unfinished_step(self):
+        first, second = Count(self.obj), Count(self.obj, fail=True)
+        a.RequireAll([first, second])()
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+        first, second = Count(self.obj), Count(self.obj)
+        a.RequireAll([first, second])()
+        self.assertEqual((first.calls, second.calls), (0, 1))
+
+        first, second = Count(self.obj), Count(self.obj)
+        a.RequireAll([first, second])()
+        self.assertEqual((first.calls, second.calls), (0, 0))
+
+    def test_restart_without_builddir(self):
+        a.RequireAll([Count(self.obj), Count(self.obj, fail=True)])()
+
+        self.obj.builddir = os.path.join(self.tmp_dir.name, "missing")
+        first, second = Count(self.obj), Count(self.obj)
+        a.RequireAll([first, second])()
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+    def test_flags_change_the_key(self):
+        a.RequireAll([Count(self.obj)])()
+
+        self.obj.cflags = ["-O3"]
+        step = Count(self.obj)
+        a.RequireAll([step])()
+        self.assertEqual(step.calls, 1)
+
+    def test_latest_experiment_id(self):
+        a.RequireAll([Count(self.obj)])()
+        self.assertEqual(ledger.latest_experiment_id("dummy"), "ledger-test")
+        self.assertIsNone(ledger.latest_experiment_id("other"))
+
+    def test_damaged_entries(self):
+        a.RequireAll([Count(self.obj)])()
+        path = ledger.get().path
+        with open(path, 'a') as ledger_f:
+            ledger_f.write('\n{"key": "trunc')
+        self.assertEqual(len(ledger.StepLedger(path)._done), 1)
+
+        first, second = Count(self.obj), Count(self.obj)
+        a.RequireAll([first, second])()
+        self.assertEqual((first.calls, second.calls), (0, 1))
+        self.assertEqual(len(ledger.read(path)), 2)
+
+    def test_measurement_slot(self):
+        from benchbuild.utils.scheduler import MeasurementSlot
+
+        slot = MeasurementSlot(Count(self.obj), threading.Lock(),
+                               os.sched_getaffinity(0))
+        a.RequireAll([slot])()
+        self.assertEqual([e["step"] for e in ledger.read(ledger.get().path)],
+                         ["COUNT"])
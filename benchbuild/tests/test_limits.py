@@ -0,0 +1,51 @@
+"""
+Test the resource limits of measured binaries.
+"""
+import sys
+import unittest
+
+from plumbum import local, ProcessExecutionError
+
+from benchbuild.settings import CFG
+from benchbuild.utils import capture, limits
+
+
+class Limited(object):
+    LIMITS = {"wall_s": 10}
+
+
+class LimitsTestCase(unittest.TestCase):
+    def tearDown(self):
+        CFG["limits"]["wall_s"] = 0
+
+    def test_resolve(self):
+        CFG["limits"]["wall_s"] = 60
+        self.assertEqual(limits.resolve(), {"wall_s": 60})
+        self.assertEqual(limits.resolve(project=Limited()), {"wall_s": 10})
+
+    def test_wall_time(self):
+        with self.assertRaises(ProcessExecutionError) as ctx:
+            capture.run(local["sleep"]["10"], "sleep",
+                        limits={"wall_s": 1}, bounded=False)
+        self.assertEqual(ctx.exception.retcode, limits.Status.WALL_TIME)
+
+    def test_output_size(self):
+        with self.assertRaises(ProcessExecutionError) as ctx:
+            capture.run(local["yes"], "yes",
+                        limits={"output_bytes": 1 << 20}, bounded=False)
+        self.assertEqual(ctx.exception.retcode, limits.Status.OUTPUT)
+
+    def test_cpu_time_hard_limit(self):
+        spin = local[sys.executable]["-c", (
+            "import signal\n"
+            "signal.signal(signal.SIGXCPU, signal.SIG_IGN)\n"
+            "while True: pass\n")]
+        with self.assertRaises(ProcessExecutionError) as ctx:
+            capture.run(spin, "spin", limits={"cpu_s": 1, "wall_s": 30},
+                        bounded=False)
+        self.assertEqual(ctx.exception.retcode, limits.Status.CPU_TIME)
+
+    def test_within_limits(self):
+        ret, stdout, _ = capture.run(local["echo"]["ok"], "echo",
+                                     limits={"wall_s": 10}, bounded=False)
+        self.assertEqual((ret, stdout), (0, "ok\n"))
@@ -0,0 +1,68 @@
+"""
+Test the log command.
+"""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import datetime
+from unittest import mock
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.log import BenchBuildLog
+from benchbuild.utils import schema as s
+from benchbuild.utils.limits import Status
+
+
+class LogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        engine = s.create_db_engine(
+            "sqlite:///" + os.path.join(self.tmp.name, "log.sqlite"))
+        s.BASE.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)
+
+        session = self.session()
+        exp_id = uuid.uuid4()
+        session.add(s.Experiment(name="e", id=exp_id))
+        session.add(s.Project(name="p"))
+        for command, status in [("ok", 0), ("slow", Status.WALL_TIME),
+                                ("spin", Status.CPU_TIME)]:
+            run = s.Run(command=command, project_name="p",
+                        experiment_name="e", run_group=str(uuid.uuid4()),
+                        experiment_group=exp_id, begin=datetime.now(),
+                        end=datetime(2018, 1, 1), status="failed")
+            session.add(run)
+            session.flush()
+            session.add(s.RunLog(run_id=run.id, experiment_group=exp_id,
+                                 status=int(status), stderr=command))
+        session.commit()
+        session.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def log(self, *args):
+        out = io.StringIO()
+        with mock.patch("benchbuild.utils.schema.Session", self.session), \
+                contextlib.redirect_stdout(out):
+            _, retcode = BenchBuildLog.run(["log"] + list(args), exit=False)
+        self.assertFalse(retcode)
+        return out.getvalue()
+
+    def test_status(self):
+        out = self.log("-s", "cputime")
+        self.assertIn("2018-01-01 00:00:00 @ e - p", out)
+        self.assertIn("status: {0}".format(int(Status.CPU_TIME)), out)
+        self.assertIn("command: spin", out)
+        self.assertNotIn("command: slow", out)
+
+    def test_status_types(self):
+        out = self.log("-s", "timeout", "-s", "cputime", "-t", "stderr")
+        self.assertIn("command: slow", out)
+        self.assertIn("command: spin", out)
+        self.assertNotIn("command: ok", out)
+        self.assertIn("StdErr:\nslow\n", out)
@@ -0,0 +1,118 @@
+"""
+Test the retention tooling of the fact tables.
+"""
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import MetaData
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.db import archive
+from benchbuild.settings import CFG
+from benchbuild.utils import partitions
+from benchbuild.utils import schema as s
+from benchbuild.utils.db import persist_metrics
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.saved = CFG["experiment_id"].value()
+
+    def tearDown(self):
+        CFG["experiment_id"] = self.saved
+        self.session.close()
+
+    def add_experiment(self, values):
+        exp_id = uuid.uuid4()
+        CFG["experiment_id"] = str(exp_id)
+        self.session.add(s.Experiment(name="raw", id=exp_id))
+        for value in values:
+            run = s.Run(command="c", experiment_name="raw",
+                        experiment_group=exp_id)
+            self.session.add(run)
+            self.session.flush()
+            persist_metrics(run, self.session, {"m": value})
+        self.session.commit()
+        return str(exp_id)
+
+    def test_explicit_group(self):
+        exp_id = self.add_experiment([1.0])
+        CFG["experiment_id"] = str(uuid.uuid4())
+        run = self.session.query(s.Run).one()
+        persist_metrics(run, self.session, {"n": 2.0})
+        self.assertEqual(
+            [str(g) for g, in self.session.query(s.Metric.experiment_group)],
+            [exp_id, exp_id])
+
+    def legacy_metrics(self):
+        """Recreate metrics, like upgrade added experiment_group."""
+        meta = MetaData()
+        s.Run.__table__.tometadata(meta)
+        legacy = s.Metric.__table__.tometadata(meta)
+        legacy.c.experiment_group.nullable = True
+        rows = [dict(row) for row in self.session.execute(
+            s.Metric.__table__.select())]
+        connection = self.session.connection()
+        s.Metric.__table__.drop(connection)
+        legacy.create(connection)
+        connection.execute(legacy.insert(), rows)
+
+    def test_archive(self):
+        exp_id = self.add_experiment([1.0, 2.0])
+        other = self.add_experiment([3.0])
+        # Rows written before experiment_group existed.
+        self.legacy_metrics()
+        self.session.query(s.Metric).update({"experiment_group": None})
+        self.session.commit()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            exported, deleted, dropped = archive(self.session, exp_id,
+                                                 tmp_dir)
+            self.assertEqual(exported["metrics"], 2)
+            self.assertEqual(deleted["metrics"], 2)
+            self.assertEqual(deleted["experiment"], 1)
+            self.assertEqual(dropped, [])
+
+            path = os.path.join(tmp_dir, "metrics.csv.gz")
+            with gzip.open(path, 'rt', newline='') as csv_f:
+                rows = list(csv.DictReader(csv_f))
+            self.assertEqual(sorted(float(r["value"]) for r in rows),
+                             [1.0, 2.0])
+
+        self.assertEqual(
+            [v for v, in self.session.query(s.Metric.value)], [3.0])
+        self.assertEqual(
+            [str(e) for e, in self.session.query(s.Experiment.id)], [other])
+
+    def test_keep(self):
+        exp_id = self.add_experiment([1.0])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive(self.session, exp_id, tmp_dir, keep=True)
+        self.assertEqual(self.session.query(s.Metric).count(), 1)
+
+
+class OldServerTestCase(unittest.TestCase):
+    def connection(self, version):
+        return SimpleNamespace(
+            dialect=SimpleNamespace(name="postgresql",
+                                    server_version_info=version),
+            execute=mock.Mock(side_effect=AssertionError("no query")))
+
+    def test_old_server(self):
+        for version in [(9, 6, 8), (10, 4)]:
+            connection = self.connection(version)
+            partitions.create_partitions(connection, uuid.uuid4())
+            self.assertEqual(partitions.partitioned_tables(connection), set())
+            self.assertRaises(ValueError, partitions.partition, connection)
+
+    def test_supported(self):
+        self.assertTrue(partitions.supported(self.connection((11, 2))))
@@ -0,0 +1,57 @@
+"""
+Test the bulk registration of projects.
+"""
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.utils import db
+from benchbuild.utils import schema as s
+
+
+def make_project(name, version="1"):
+    return SimpleNamespace(name=name, domain="d", group_name="g",
+                           src_uri="http://x", version=lambda: version)
+
+
+class RegisterProjectsTestCase(unittest.TestCase):
+    def setUp(self):
+        engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.factory = mock.Mock(return_value=self.session)
+        self.patch = mock.patch.object(s, "Session", self.factory)
+        self.patch.start()
+        getattr(db, "__REGISTERED").clear()
+
+    def tearDown(self):
+        self.patch.stop()
+        getattr(db, "__REGISTERED").clear()
+        self.session.close()
+
+    def test_bulk_and_cached(self):
+        db.persist_projects([make_project("a"), make_project("b"),
+                             make_project("a")])
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual(
+            sorted(n for n, in self.session.query(s.Project.name)), ["a", "b"])
+
+        db.persist_project(make_project("a"))
+        self.assertEqual(self.factory.call_count, 1)
+
+    def test_update(self):
+        db.persist_projects([make_project("a")])
+        getattr(db, "__REGISTERED").clear()
+        db.persist_projects([make_project("a", version="2")])
+        self.assertEqual(self.session.query(s.Project.version).all(),
+                         [("2",)])
+
+    def test_project_init(self):
+        from benchbuild.projects.benchbuild.xz import XZ
+
+        with mock.patch.object(db, "persist_projects") as persist:
+            XZ(SimpleNamespace(name="exp"))
+            persist.assert_not_called()
+        self.factory.assert_not_called()
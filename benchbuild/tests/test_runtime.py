@@ -0,0 +1,141 @@
+"""
+Test the configuration snapshot of generated wrappers.
+"""
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from benchbuild.settings import CFG
+from benchbuild.utils.wrapping import wrap, wrap_cc, wrap_dynamic
+from runners import hide_plumbum, make_extension, make_runner
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = CFG["compile_cache"]["dir"].value()
+        self.saved_blobs = CFG["wrapper"]["blob_dir"].value()
+        CFG["compile_cache"]["dir"] = "/snapshot"
+        CFG["wrapper"]["blob_dir"] = os.path.join(self.tmp.name, "blobs")
+        binary = os.path.join(self.tmp.name, "tool")
+        with open(binary, "w") as bin_f:
+            bin_f.write("#!/bin/sh\n")
+        try:
+            wrap(binary, make_runner())
+        finally:
+            CFG["compile_cache"]["dir"] = self.saved
+            CFG["wrapper"]["blob_dir"] = self.saved_blobs
+        self.wrapper = binary
+
+        # The wrapper must not read the config file anymore.
+        self.config_f = os.path.join(self.tmp.name, ".benchbuild.json")
+        with open(self.config_f, "w") as config:
+            json.dump({"compile_cache": {"dir": {"value": "/file"}}}, config)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def call(self, *args, **env):
+        import benchbuild
+        root = os.path.dirname(os.path.dirname(benchbuild.__file__))
+        env = dict(os.environ, BB_CONFIG_FILE=self.config_f,
+                   PYTHONPATH=root, **env)
+        proc = subprocess.run([self.wrapper] + list(args),
+                              cwd=self.tmp.name, env=env,
+                              stdout=subprocess.PIPE)
+        return proc.returncode, json.loads(proc.stdout.decode())
+
+    def test_snapshot(self):
+        retcode, result = self.call("a", "b")
+        self.assertEqual(retcode, 2)
+        self.assertEqual(result["dir"], "/snapshot")
+        self.assertEqual(result["args"], ["a", "b"])
+        self.assertFalse(result["plumbum"])
+        self.assertTrue(os.path.exists(self.wrapper + ".config.json"))
+        self.assertEqual(
+            os.stat(self.wrapper + ".config.json").st_mode & 0o777, 0o600)
+
+    def test_environment(self):
+        _, result = self.call(BB_COMPILE_CACHE_DIR="/env")
+        self.assertEqual(result["dir"], "/env")
+
+
+def call(argv, cwd, *pythonpath, **env):
+    import benchbuild
+    root = os.path.dirname(os.path.dirname(benchbuild.__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(pythonpath + (root, )),
+               **env)
+    return subprocess.run(argv, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+
+
+class DynamicWrapperTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = CFG["wrapper"]["blob_dir"].value()
+        CFG["wrapper"]["blob_dir"] = os.path.join(self.tmp.name, "blobs")
+        self.wrapper = os.path.join(self.tmp.name, "runner")
+        try:
+            wrap_dynamic(SimpleNamespace(), self.wrapper, make_runner())
+        finally:
+            CFG["wrapper"]["blob_dir"] = self.saved
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_dynamic(self):
+        proc = call([self.wrapper, "/bin/tool", "a"], self.tmp.name)
+        result = json.loads(proc.stdout.decode())
+        self.assertEqual(proc.returncode, 1)
+        self.assertEqual((result["binary"], result["project"]),
+                         ("tool", "tool"))
+        self.assertFalse(result["plumbum"])
+
+
+class CompilerWrapperTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # Fails with the hidden flags, like a compiler that does not know
+        # them.
+        self.cc = os.path.join(self.tmp.name, "cc")
+        with open(self.cc, "w") as cc_f:
+            cc_f.write('#!/bin/sh\necho "$* $BB_TEST_VAR"\n'
+                       'case "$*" in *-fbad*) exit 1;; esac\n')
+        os.chmod(self.cc, 0o755)
+        self.hidden = hide_plumbum(os.path.join(self.tmp.name, "hidden"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def wrap(self, cflags, extension=None):
+        from plumbum import local
+
+        wrapper = os.path.join(self.tmp.name, "clang")
+        wrap_cc(wrapper, cflags, [], lambda: local[self.cc].with_env(
+            BB_TEST_VAR="x"), extension)
+        return wrapper
+
+    def test_compile(self):
+        wrapper = self.wrap(["-fbad"])
+        proc = call([wrapper, "-c", "a.c"], self.tmp.name, self.hidden)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(proc.stdout.decode().splitlines(), [
+            "-Qunused-arguments -c a.c -fbad x",
+            "-Qunused-arguments -c a.c x"])
+
+        proc = call([wrapper, "-c", "conftest.c"], self.tmp.name,
+                    self.hidden)
+        self.assertEqual(proc.stdout.decode(), "-c conftest.c x\n")
+
+    def test_extension(self):
+        out_f = os.path.join(self.tmp.name, "extension")
+        wrapper = self.wrap(["-O3"], make_extension(out_f))
+        # The extension's blob refers to the module of the runners.
+        proc = call([wrapper, "a.o"], self.tmp.name,
+                    os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        with open(out_f) as ext_f:
+            self.assertTrue(ext_f.read().startswith("plumbum"))
@@ -0,0 +1,102 @@
+"""
+Test the scheduler module.
+"""
+import os
+import tempfile
+import unittest
+
+from benchbuild.settings import CFG
+from benchbuild.utils import actions as a
+from benchbuild.utils import scheduler
+
+
+class TouchPid(a.Step):
+    def __init__(self, path):
+        super(TouchPid, self).__init__(None, None)
+        self.path = path
+
+    def __call__(self):
+        with open(self.path, 'w') as pid_f:
+            pid_f.write("{0} {1}".format(os.getpid(), CFG["jobs"].value()))
+        return a.StepResult.OK
+
+
+class FailAlways(a.Step):
+    def __call__(self):
+        return a.StepResult.ERROR
+
+    def __str__(self, indent=0):
+        return "* fail"
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.jobs = CFG["jobs"].value()
+        CFG["jobs"] = 4
+
+    def tearDown(self):
+        CFG["jobs"] = self.jobs
+
+    def test_partition(self):
+        actns = [a.Echo("start"),
+                 a.RequireAll([]), a.RequireAll([]),
+                 a.Echo("end")]
+        groups = scheduler.partition(actns)
+        self.assertEqual([(c, len(g)) for c, g in groups],
+                         [(False, 1), (True, 2), (False, 1)])
+
+    def test_concurrent_chains_are_isolated(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, str(i)) for i in range(4)]
+            chains = [a.RequireAll([TouchPid(p)]) for p in paths]
+            results = scheduler.run_concurrent(chains, 2)
+
+            self.assertEqual(results, [a.StepResult.OK] * 4)
+            pids = set()
+            for path in paths:
+                with open(path) as pid_f:
+                    pid, jobs = pid_f.read().split()
+                pids.add(pid)
+                self.assertEqual(jobs, "2")
+            self.assertNotIn(str(os.getpid()), pids)
+            self.assertEqual(len(pids), 4)
+
+    def test_execute_returns_last_result(self):
+        chains = [a.RequireAll([FailAlways(None)]),
+                  a.RequireAll([FailAlways(None)])]
+        self.assertEqual(scheduler.execute(chains, 2), a.StepResult.ERROR)
+
+    def test_pipeline_guards_measurements(self):
+        class Measure(a.Step):
+            STAGE = a.StepStage.MEASURE
+
+        measure = Measure(None)
+        chain = a.RequireAll([a.Echo("io"), a.Any([measure])])
+        scheduler.guard_measurements(chain, None, {0})
+
+        guarded = chain._actions[1]._actions[0]
+        self.assertIsInstance(chain._actions[0], a.Echo)
+        self.assertIsInstance(guarded, scheduler.MeasurementSlot)
+        self.assertIs(guarded._action, measure)
+
+    def test_pipeline_measures_on_reserved_cores(self):
+        class MeasureAffinity(TouchPid):
+            STAGE = a.StepStage.MEASURE
+
+            def __call__(self):
+                with open(self.path, 'w') as aff_f:
+                    aff_f.write(",".join(
+                        str(c) for c in sorted(os.sched_getaffinity(0))))
+                return a.StepResult.OK
+
+        reserved, _ = scheduler.measurement_cores()
+        reserved = ",".join(str(c) for c in sorted(reserved))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, str(i)) for i in range(3)]
+            chains = [a.RequireAll([MeasureAffinity(p)]) for p in paths]
+            results = scheduler.execute(chains, 1, pipeline=True)
+
+            self.assertEqual(results, a.StepResult.OK)
+            for path in paths:
+                with open(path) as aff_f:
+                    self.assertEqual(aff_f.read(), reserved)
@@ -0,0 +1,76 @@
+"""
+Test the session manager.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchbuild.settings import CFG
+from benchbuild.utils import schema
+
+
+class SessionManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = {
+            k: CFG["db"][k].value()
+            for k in ["connect_string", "schema_cache", "rollback"]
+        }
+        CFG["db"]["connect_string"] = "sqlite:///" + os.path.join(
+            self.tmp.name, "bb.sqlite")
+        CFG["db"]["schema_cache"] = os.path.join(self.tmp.name, "cache")
+        CFG["db"]["rollback"] = False
+        self.session = schema.__lazy_session__()
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            CFG["db"][key] = value
+        self.tmp.cleanup()
+
+    def test_scoped(self):
+        group = self.session(scope="group")
+        self.assertIs(self.session(scope="group"), group)
+        self.assertIsNot(self.session(), self.session())
+
+        self.session.manager().release("group")
+        self.assertIsNot(self.session(scope="group"), group)
+
+    def test_schema_cache(self):
+        self.session()
+        self.assertEqual(len(os.listdir(CFG["db"]["schema_cache"].value())),
+                         1)
+
+        with mock.patch.object(schema.BASE.metadata, "create_all") as create:
+            schema.__lazy_session__()()
+            create.assert_not_called()
+
+        CFG["db"]["connect_string"] = "sqlite:///" + os.path.join(
+            self.tmp.name, "other.sqlite")
+        with mock.patch.object(schema.BASE.metadata, "create_all") as create:
+            schema.__lazy_session__()()
+            create.assert_called_once()
+
+    def test_schema_cache_missing_tables(self):
+        self.session()
+        self.session.manager().engine.dispose()
+        os.remove(os.path.join(self.tmp.name, "bb.sqlite"))
+
+        with mock.patch.object(schema.BASE.metadata, "create_all") as create:
+            schema.__lazy_session__()()
+            create.assert_called_once()
+
+    def test_schema_cache_ddl(self):
+        self.session()
+        index = schema.Index("ix_test_schema_cache", schema.Run.command)
+        try:
+            with mock.patch.object(schema, "upgrade") as upgrade:
+                schema.__lazy_session__()()
+                upgrade.assert_called_once()
+        finally:
+            schema.Run.__table__.indexes.discard(index)
+
+    def test_fork(self):
+        manager = self.session.manager()
+        with mock.patch("os.getpid", return_value=manager.pid + 1):
+            self.assertIsNot(self.session.manager(), manager)
@@ -0,0 +1,43 @@
+"""
+Test the core-pinned measurement slots.
+"""
+import fcntl
+import os
+import tempfile
+import unittest
+
+from benchbuild.settings import CFG
+from benchbuild.utils import slots
+
+
+class SlotsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        CFG["slots"]["enable"] = True
+        CFG["slots"]["lock_dir"] = self.tmp_dir.name
+
+    def tearDown(self):
+        CFG["slots"]["enable"] = False
+        CFG["slots"]["lock_dir"] = None
+        self.tmp_dir.cleanup()
+
+    def test_split_is_disjoint(self):
+        cpu_slots = slots.split(range(16), 1)
+        self.assertEqual(len(cpu_slots), 16)
+        self.assertEqual(len(set(cpu_slots)), 16)
+
+    def test_slot_pins_and_locks(self):
+        affinity = os.sched_getaffinity(0)
+        with slots.slot(1) as cores:
+            self.assertEqual(os.sched_getaffinity(0), set(cores))
+            lock_f = os.path.join(self.tmp_dir.name,
+                                  "cpu-{0}.lock".format(cores[0]))
+            with open(lock_f, 'w') as lock:
+                self.assertRaises(OSError, fcntl.flock, lock,
+                                  fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.assertEqual(os.sched_getaffinity(0), affinity)
+
+    def test_disabled(self):
+        CFG["slots"]["enable"] = False
+        with slots.slot(1) as cores:
+            self.assertIsNone(cores)
@@ -0,0 +1,25 @@
+"""
+Test the statistics helpers for repeated measurements.
+"""
+import unittest
+
+from benchbuild.utils import stats
+
+
+class StatsTestCase(unittest.TestCase):
+    def test_summary(self):
+        summary = stats.summary([2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0])
+        self.assertEqual(summary["mean"], 5.0)
+        self.assertAlmostEqual(summary["stddev"], 2.138, places=3)
+        self.assertEqual(summary["n"], 8)
+
+    def test_single_sample_never_converges(self):
+        self.assertFalse(stats.converged([1.0], 0.5))
+
+    def test_stable_samples_converge(self):
+        samples = [1.0, 1.001, 0.999, 1.0, 1.002]
+        self.assertTrue(stats.converged(samples, 0.01))
+        self.assertFalse(stats.converged(samples + [2.0], 0.01))
+
+    def test_unsupported_confidence(self):
+        self.assertRaises(ValueError, stats.t_quantile, 0.5, 3)
@@ -0,0 +1,62 @@
+"""
+Test the run summary and the report indices.
+"""
+import unittest
+import uuid
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker
+
+from benchbuild.db import summarize
+from benchbuild.utils import schema as s
+from benchbuild.utils.db import refresh_run_summary
+
+
+class RunSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = s.create_db_engine("sqlite://")
+        s.BASE.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.exp_id = uuid.uuid4()
+        self.session.add(s.Experiment(name="raw", id=self.exp_id))
+
+    def tearDown(self):
+        self.session.close()
+
+    def add_group(self, values):
+        group = str(uuid.uuid4())
+        for value in values:
+            run = s.Run(command="c", project_name="p", experiment_name="raw",
+                        run_group=group, experiment_group=self.exp_id)
+            self.session.add(run)
+            self.session.flush()
+            self.session.add(s.Metric(name="time.real_s", value=value,
+                                      run_id=run.id,
+                                      experiment_group=self.exp_id))
+        self.session.commit()
+        return group
+
+    def test_refresh(self):
+        group = self.add_group([1.0, 2.0, 6.0])
+        other = self.add_group([5.0])
+        refresh_run_summary(self.session, [group])
+        refresh_run_summary(self.session, [group])
+        self.session.commit()
+
+        row = self.session.query(s.RunSummary).one()
+        self.assertEqual((row.run_group, row.metric, row.project_name),
+                         (group, "time.real_s", "p"))
+        self.assertEqual((row.count, row.total, row.minimum, row.maximum,
+                          row.mean), (3, 9.0, 1.0, 6.0, 3.0))
+
+        self.assertEqual(summarize(self.session, [str(self.exp_id)]), 2)
+        totals = dict(self.session.query(s.RunSummary.run_group,
+                                         s.RunSummary.total))
+        self.assertEqual(totals, {group: 9.0, other: 5.0})
+
+    def test_upgrade_indices(self):
+        self.engine.execute("DROP INDEX ix_metrics_run_id_name")
+        s.upgrade(self.engine)
+        names = {i["name"] for i in inspect(self.engine).get_indexes(
+            "metrics")}
+        self.assertIn("ix_metrics_run_id_name", names)
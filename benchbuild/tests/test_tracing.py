@@ -0,0 +1,55 @@
+"""
+Test the tracing of steps.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from benchbuild.settings import CFG
+from benchbuild.utils import actions as a
+from benchbuild.utils import tracing
+
+
+class Exp(object):
+    name = "exp"
+
+
+class Prj(object):
+    name = "prj"
+    experiment = Exp()
+
+
+class Traced(a.Step):
+    NAME = "TRACED"
+    DESCRIPTION = "A traced step."
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        CFG["trace"]["enable"] = True
+        CFG["trace"]["dir"] = self.tmp_dir.name
+
+    def tearDown(self):
+        CFG["trace"]["enable"] = False
+        CFG["trace"]["dir"] = None
+        self.tmp_dir.cleanup()
+
+    def test_step_is_traced(self):
+        Traced(Prj())()
+        with tracing.span("outer", "test"):
+            pass
+
+        with open(tracing.merge()) as trace_f:
+            events = json.load(trace_f)["traceEvents"]
+        spans = {e["name"]: e for e in events if e["ph"] == "X"}
+        self.assertEqual(spans["TRACED"]["args"],
+                         {"project": "prj", "experiment": "exp"})
+        self.assertEqual(spans["TRACED"]["pid"], os.getpid())
+        self.assertIn("outer", spans)
+
+    def test_disabled(self):
+        CFG["trace"]["enable"] = False
+        Traced(Prj())()
+        self.assertIsNone(tracing.merge())
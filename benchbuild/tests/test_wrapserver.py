@@ -0,0 +1,172 @@
+"""
+Test the wrapper server and its thin client.
+"""
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import dill
+
+from benchbuild.settings import CFG
+from benchbuild.utils import runtime, wrapserver
+from benchbuild.utils.path import template_str
+from runners import make_runner
+
+
+class WrapperServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, "wrapper.sock")
+        self.server = subprocess.Popen(
+            [sys.executable, "-m", "benchbuild.utils.wrapserver",
+             self.socket, "60"], stderr=subprocess.DEVNULL)
+        self.wait_for_server()
+
+        self.blob_f = os.path.join(self.tmp.name, "tool.postproc")
+        with open(self.blob_f, "wb") as blob:
+            dill.dump(make_runner(), blob, recurse=True)
+        self.fallback = os.path.join(self.tmp.name, "tool.wrapper")
+        with open(self.fallback, "w") as fallback:
+            fallback.write("#!/bin/sh\necho fallback $@\nexit 3\n")
+        os.chmod(self.fallback, 0o755)
+        self.client = self.make_client("tool", "/one")
+
+    def make_client(self, name, cache_dir):
+        """Write a client, whose snapshot uses :cache_dir:."""
+        client_f = os.path.join(self.tmp.name, name)
+        saved = CFG["compile_cache"]["dir"].value()
+        CFG["compile_cache"]["dir"] = cache_dir
+        try:
+            runtime.store(client_f + ".config.json", CFG)
+        finally:
+            CFG["compile_cache"]["dir"] = saved
+        with open(client_f, "w") as client:
+            client.write(template_str("templates/run_client.py.inc").format(
+                python=sys.executable, socket=self.socket,
+                idle="5", fallback=self.fallback, blobf=self.blob_f,
+                configf=client_f + ".config.json", runf=client_f + ".bin",
+                path="", ld_lib_path=""))
+        os.chmod(client_f, 0o755)
+        return client_f
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.tmp.cleanup()
+
+    def wait_for_server(self):
+        for _ in range(200):
+            sock = wrapserver.connect(self.socket)
+            if sock is not None:
+                sock.close()
+                return True
+            time.sleep(0.05)
+        return False
+
+    def start(self, *args):
+        env = self.env()
+        proc = subprocess.Popen([self.client] + list(args),
+                                cwd=self.tmp.name, env=env,
+                                stdout=subprocess.PIPE)
+        return proc, int(proc.stdout.readline())
+
+    def assertTerminates(self, pid):
+        for _ in range(100):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return
+            time.sleep(0.05)
+        self.fail("The runner {0} is still alive.".format(pid))
+
+    def env(self):
+        import benchbuild
+        root = os.path.dirname(os.path.dirname(benchbuild.__file__))
+        return dict(os.environ, BB_TEST_VAR="42", PYTHONPATH=root)
+
+    def call(self, *args, client=None, preexec_fn=None):
+        env = self.env()
+        proc = subprocess.run([client or self.client] + list(args),
+                              cwd=self.tmp.name, env=env,
+                              stdout=subprocess.PIPE, preexec_fn=preexec_fn)
+        return proc.returncode, proc.stdout.decode()
+
+    def test_request(self):
+        retcode, output = self.call("a", "b")
+        self.assertEqual(retcode, 2)
+        result = json.loads(output)
+        self.assertEqual(result["binary"], "tool.bin")
+        self.assertEqual(result["args"], ["a", "b"])
+        self.assertEqual(result["cwd"], os.path.realpath(self.tmp.name))
+        self.assertEqual(result["var"], "42")
+        self.assertEqual(self.call()[0], 0)
+
+    def test_snapshots(self):
+        other = self.make_client("other", "/two")
+        self.assertEqual(json.loads(self.call()[1])["dir"], "/one")
+        self.assertEqual(json.loads(self.call(client=other)[1])["dir"],
+                         "/two")
+        self.assertEqual(json.loads(self.call()[1])["dir"], "/one")
+
+    def test_limits(self):
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+        def limit():
+            resource.setrlimit(resource.RLIMIT_CPU, (100, hard))
+
+        result = json.loads(self.call(preexec_fn=limit)[1])
+        self.assertEqual(result["cpu_limit"], [100, hard])
+        self.assertEqual(result["affinity"],
+                         sorted(os.sched_getaffinity(0)))
+
+    def test_fallback(self):
+        self.server.terminate()
+        self.server.wait()
+        self.assertEqual(self.call("x"), (3, "fallback x\n"))
+
+        # The fallback started a new server.
+        self.assertTrue(self.wait_for_server())
+        self.assertEqual(self.call("x")[0], 1)
+
+    def test_signal(self):
+        client, pid = self.start("sleep")
+        client.send_signal(signal.SIGTERM)
+        self.assertEqual(client.wait(10), 128 + signal.SIGTERM)
+        self.assertTerminates(pid)
+
+    def test_client_gone(self):
+        client, pid = self.start("sleep")
+        client.kill()
+        client.wait()
+        self.assertTerminates(pid)
+
+
+class PrivateDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = os.environ.get("XDG_RUNTIME_DIR")
+        os.environ["XDG_RUNTIME_DIR"] = self.tmp.name
+
+    def tearDown(self):
+        if self.saved is None:
+            del os.environ["XDG_RUNTIME_DIR"]
+        else:
+            os.environ["XDG_RUNTIME_DIR"] = self.saved
+        self.tmp.cleanup()
+
+    def test_private(self):
+        path = wrapserver.private_dir()
+        self.assertEqual(path, os.path.join(self.tmp.name, "benchbuild"))
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+
+    def test_shared(self):
+        path = os.path.join(self.tmp.name, "benchbuild")
+        os.mkdir(path)
+        os.chmod(path, 0o777)
+        self.assertRaises(OSError, wrapserver.private_dir)
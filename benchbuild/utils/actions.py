@@ -2,8 +2,9 @@
 This defines classes that can be used to implement a series of Actions.
 """
 from benchbuild.settings import CFG
-from benchbuild.utils.db import persist_experiment
+from benchbuild.utils.db import persist_experiment, persist_projects
 from benchbuild.utils.run import GuardedRunException
+from benchbuild.utils import tracing
 
 from plumbum import local
 from benchbuild.utils.cmd import mkdir, rm, rmdir
@@ -27,6 +28,20 @@ class StepResult(Enum):
     ERROR = 2
 
 
+@unique
+class StepStage(Enum):
+    """
+    The kind of resources a step is bound by.
+
+    IO steps are dominated by network or disk access, BUILD steps by
+    compilation. MEASURE steps take the actual measurements and require an
+    otherwise quiet machine.
+    """
+    IO = 1
+    BUILD = 2
+    MEASURE = 3
+
+
 def to_step_result(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -45,7 +60,8 @@ def log_before_after(name, desc):
         @wraps(f)
         def wrapper(*args, **kwargs):
             _log.info("\n{} - {}".format(name, desc))
-            res = f(*args, **kwargs)
+            res = tracing.trace_step(args[0], name,
+                                     partial(f, *args, **kwargs))
             if res == StepResult.OK:
                 _log.info("{} - OK\n".format(name))
             else:
@@ -75,6 +91,7 @@ class StepClass(ABCMeta):
 class Step(metaclass=StepClass):
     NAME = None
     DESCRIPTION = None
+    STAGE = StepStage.BUILD
 
     def __init__(self, project_or_experiment, action_fn=None):
         self._obj = project_or_experiment
@@ -100,6 +117,7 @@ class Step(metaclass=StepClass):
 class Clean(Step):
     NAME = "CLEAN"
     DESCRIPTION = "Cleans the build directory"
+    STAGE = StepStage.IO
 
     def __init__(self, project_or_experiment, action_fn=None, check_empty=False):
         super(Clean, self).__init__(project_or_experiment, action_fn)
@@ -150,6 +168,7 @@ class Clean(Step):
 class MakeBuildDir(Step):
     NAME = "MKDIR"
     DESCRIPTION = "Create the build directory"
+    STAGE = StepStage.IO
 
     def __call__(self):
         if not self._obj:
@@ -166,6 +185,7 @@ class MakeBuildDir(Step):
 class Prepare(Step):
     NAME = "PREPARE"
     DESCRIPTION = "Prepare project build folder"
+    STAGE = StepStage.IO
 
     def __init__(self, project):
         super(Prepare, self).__init__(project, project.prepare)
@@ -178,6 +198,7 @@ class Prepare(Step):
 class Download(Step):
     NAME = "DOWNLOAD"
     DESCRIPTION = "Download project source files"
+    STAGE = StepStage.IO
 
     def __init__(self, project):
         super(Download, self).__init__(project, project.download)
@@ -206,6 +227,19 @@ class Build(Step):
     def __init__(self, project):
         super(Build, self).__init__(project, project.build)
 
+    def __call__(self):
+        from benchbuild.utils import buildcache, compilecache
+
+        key = None
+        if buildcache.cacheable(self._obj):
+            key = buildcache.cache_key(self._obj)
+        if key is None or not buildcache.restore(self._obj, key):
+            self._action_fn()
+            if key is not None:
+                buildcache.store(self._obj, key)
+        if compilecache.enabled():
+            compilecache.persist_counters(CFG["experiment_id"].value())
+
     def __str__(self, indent=0):
         return textwrap.indent("* {0}: Compile".format(self._obj.name),
                                indent * " ")
@@ -214,6 +248,7 @@ class Build(Step):
 class Run(Step):
     NAME = "RUN"
     DESCRIPTION = "Execute the run action"
+    STAGE = StepStage.MEASURE
 
     def __init__(self, project):
         action_fn = partial(project.run, project.runtime_extension)
@@ -238,6 +273,7 @@ class Run(Step):
 class Echo(Step):
     NAME = 'ECHO'
     DESCRIPTION = 'Print a message.'
+    STAGE = StepStage.IO
 
     def __init__(self, message):
         self._message = message
@@ -291,21 +327,59 @@ class Experiment(Any):
         super(Experiment, self).__init__(actions)
 
     def begin_transaction(self):
+        from benchbuild.utils import dbwriter
+
         experiment, session = persist_experiment(self._experiment)
+        if isinstance(session, dbwriter.DeferredSession):
+            # The writer creates the partitions.
+            return experiment, session
         if experiment.begin is None:
             experiment.begin = datetime.now()
         else:
             experiment.begin = min(experiment.begin, datetime.now())
         session.add(experiment)
         session.commit()
+
+        from benchbuild.utils import partitions
+        partitions.create_partitions(session.connection(), experiment.id)
+        session.commit()
         return experiment, session
 
+    def register_projects(self, actions):
+        """Register all projects we are about to run, in bulk."""
+        projects = []
+        pending = list(actions)
+        while pending:
+            action = pending.pop()
+            action = getattr(action, "_action", action)
+            pending.extend(getattr(action, "_actions", []))
+            obj = getattr(action, "_obj", None)
+            if getattr(obj, "experiment", None) is not None:
+                projects.append(obj)
+        persist_projects(projects)
+
     def end_transaction(self, experiment, session):
-        if experiment.end is None:
-            experiment.end = datetime.now()
-        else:
-            experiment.end = max(experiment.end, datetime.now())
-        session.add(experiment)
+        from benchbuild.utils import dbwriter
+        from benchbuild.utils.schema import RunGroup
+
+        deferred = isinstance(session, dbwriter.DeferredSession)
+        if deferred:
+            session.end_experiment(experiment)
+        try:
+            dbwriter.flush()
+        except dbwriter.WriteError as ex:
+            # The ends of these run groups are lost.
+            error("{0} Marking unfinished run groups as failed.".format(ex))
+            session.query(RunGroup).filter(
+                RunGroup.experiment == experiment.id,
+                RunGroup.status == "running").update(
+                    {"status": "failed"}, synchronize_session=False)
+        if not deferred:
+            if experiment.end is None:
+                experiment.end = datetime.now()
+            else:
+                experiment.end = max(experiment.end, datetime.now())
+            session.add(experiment)
         session.commit()
 
     def __call__(self):
@@ -313,9 +387,17 @@ class Experiment(Any):
 
         experiment, session = self.begin_transaction()
         try:
-            for a in self._actions:
-                with local.env(BB_EXPERIMENT_ID=str(CFG["experiment_id"])):
-                    result = a()
+            workers = int(CFG["scheduler"]["parallel"].value())
+            pipeline = CFG["scheduler"]["pipeline"].value()
+            self.register_projects(self._actions)
+            with local.env(BB_EXPERIMENT_ID=str(CFG["experiment_id"])):
+                if workers > 1 or pipeline:
+                    from benchbuild.utils import scheduler
+                    result = scheduler.execute(self._actions, workers,
+                                               pipeline)
+                else:
+                    for a in self._actions:
+                        result = a()
         except KeyboardInterrupt:
             error("User requested termination.")
         except Exception:
@@ -326,6 +408,8 @@ class Experiment(Any):
             print("Shutting down...")
         finally:
             self.end_transaction(experiment, session)
+            if CFG["trace"]["enable"].value():
+                tracing.merge()
 
         return result
 
@@ -347,7 +431,8 @@ class RequireAll(Step):
         return sum([len(x) for x in self._actions])
 
     def __call__(self):
-        for i, action in enumerate(self._actions):
+        from benchbuild.utils import ledger
+        for i, action in enumerate(ledger.resume(self._actions)):
             try:
                 result = action()
             except ProcessExecutionError as proc_ex:
@@ -371,6 +456,7 @@ class RequireAll(Step):
 class CleanExtra(Step):
     NAME = "CLEAN EXTRA"
     DESCRIPTION = "Cleans the extra directories."
+    STAGE = StepStage.IO
 
     def __call__(self):
         if not CFG['clean'].value():
@@ -0,0 +1,251 @@
+"""
+Content-addressed store for the runners of wrapped binaries.
+
+A runner is usually a partial like
+``partial(run_with_time, project, experiment, CFG, jobs)``. Pickled as a
+whole, it drags along the project, the experiment, all other projects of
+the experiment and the configuration. Every wrapped binary had its own copy
+of this graph and every call of a wrapper unpickled all of it.
+
+Instead, benchbuild.utils.wrapping stores the runner as a Spec: the runner
+itself, pickled with all references to projects, experiments and CFG cut
+off. Each project and experiment is pickled the same way and stored on its
+own. Everything is pickled again on every store, so a blob always reflects
+the current state of its object, unchanged objects end up in the blob they
+had before. The configuration is never stored, wrappers use their frozen
+snapshot (see benchbuild.utils.runtime).
+
+Inside a wrapper the graph is rebuilt lazily. The arguments of the runner
+are loaded, when the runner is called. All other references become Lazy
+stand-ins, which load their object on first access. A stand-in is not an
+instance of its object's class, use resolve before type checks.
+
+Blobs are stored under their sha256 in ``BB_WRAPPER_BLOB_DIR``, wrappers
+reference the Spec by its hash. Identical runners share a single blob.
+
+This module depends on python's standard library only, the parts that
+store blobs import benchbuild lazily.
+"""
+import functools
+import hashlib
+import io
+import os
+import pickle
+import uuid
+
+
+def blob_dir():
+    """Return the directory of the blob store."""
+    from benchbuild.settings import CFG
+
+    bdir = CFG["wrapper"]["blob_dir"].value()
+    if bdir is None:
+        bdir = os.path.join(str(CFG["build_dir"]), ".blobs")
+    return bdir
+
+
+def blob_path(directory, key):
+    """Return the path of the blob :key: in the store :directory:."""
+    return os.path.join(directory, key[:2], key)
+
+
+def put(directory, data):
+    """
+    Store :data: under its hash.
+
+    Returns:
+        The path of the blob.
+    """
+    path = blob_path(directory, hashlib.sha256(data).hexdigest())
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{0}.{1}".format(path, uuid.uuid4().hex)
+        with open(tmp, 'wb') as blob:
+            blob.write(data)
+        os.rename(tmp, path)
+    return path
+
+
+def resolve(obj):
+    """Return the object behind :obj:, if it is a Lazy stand-in."""
+    if type(obj) is Lazy:  # pylint: disable=unidiomatic-typecheck
+        return object.__getattribute__(obj, "_Lazy__load")()
+    return obj
+
+
+class Lazy(object):
+    """Stand-in for a stored object, that is loaded on first access."""
+
+    def __init__(self, graph, ident):
+        object.__setattr__(self, "_Lazy__graph", graph)
+        object.__setattr__(self, "_Lazy__ident", ident)
+
+    def __load(self):
+        return self.__graph.load(self.__ident)
+
+    def __getattr__(self, name):
+        return getattr(resolve(self), name)
+
+    def __setattr__(self, name, value):
+        setattr(resolve(self), name, value)
+
+    def __delattr__(self, name):
+        delattr(resolve(self), name)
+
+    def __eq__(self, other):
+        return resolve(self) == resolve(other)
+
+    def __hash__(self):
+        return hash(resolve(self))
+
+    def __repr__(self):
+        return repr(resolve(self))
+
+    def __str__(self):
+        return str(resolve(self))
+
+    def __reduce_ex__(self, protocol):
+        return resolve(self).__reduce_ex__(protocol)
+
+
+class GraphUnpickler(pickle.Unpickler):
+    """Unpickle a blob, references become objects of :graph:."""
+
+    def __init__(self, data, graph):
+        super(GraphUnpickler, self).__init__(io.BytesIO(data))
+        self.graph = graph
+
+    def persistent_load(self, pid):
+        if pid[0] == "cfg":
+            from benchbuild.settings import CFG
+            return CFG
+        ident = pid[1]
+        if ident in self.graph.loaded:
+            return self.graph.loaded[ident]
+        return Lazy(self.graph, ident)
+
+
+class Graph(object):
+    """The stored objects a runner refers to."""
+
+    def __init__(self, directory, objects):
+        self.directory = directory
+        self.objects = objects
+        self.loaded = {}
+
+    def load(self, ident):
+        """Load the object :ident:, once."""
+        if ident not in self.loaded:
+            with open(blob_path(self.directory, self.objects[ident]),
+                      'rb') as blob:
+                self.loaded[ident] = GraphUnpickler(blob.read(),
+                                                    self).load()
+        return self.loaded[ident]
+
+    def loads(self, data):
+        """Unpickle :data:, which refers to objects of this graph."""
+        return GraphUnpickler(data, self).load()
+
+
+class Spec(object):
+    """
+    A stored runner.
+
+    Attributes:
+        payload: The pickled runner, without projects, experiments and CFG.
+        objects: Maps the identity of every object the runner refers to,
+            directly or indirectly, to the key of its blob. Identities are
+            numbered in the order we pickled the objects.
+        directory: The blob store.
+    """
+
+    def __init__(self, payload, objects, directory):
+        self.payload = payload
+        self.objects = objects
+        self.directory = directory
+        self.__runner = None
+
+    def __getstate__(self):
+        return {"payload": self.payload, "objects": self.objects,
+                "directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__runner = None
+
+    def runner(self):
+        """Rebuild the runner, the arguments of a partial are loaded."""
+        if self.__runner is None:
+            runner = Graph(self.directory, self.objects).loads(self.payload)
+            if isinstance(runner, functools.partial):
+                runner = functools.partial(
+                    runner.func, *[resolve(a) for a in runner.args],
+                    **{k: resolve(v) for k, v in runner.keywords.items()})
+            self.__runner = runner
+        return self.__runner
+
+    def __call__(self, *args, **kwargs):
+        return self.runner()(*args, **kwargs)
+
+
+def __dumps(root, ident):
+    """
+    Pickle :root:, cut at all projects, experiments and CFG.
+
+    Args:
+        root: The object we pickle.
+        ident: Returns the identity of a project or experiment we cut at.
+
+    Returns:
+        The pickled :root:.
+    """
+    import dill
+    from benchbuild.experiment import Experiment
+    from benchbuild.project import Project
+    from benchbuild.settings import CFG, Configuration
+
+    class RefPickler(dill.Pickler):
+        def persistent_id(self, obj):
+            if obj is root:
+                return None
+            if isinstance(obj, Configuration) and obj.node is CFG.node:
+                return ("cfg",)
+            if isinstance(obj, (Project, Experiment)):
+                return ("ref", ident(obj))
+            return None
+
+    data = io.BytesIO()
+    RefPickler(data, protocol=-1, recurse=True).dump(root)
+    return data.getvalue()
+
+
+def store(runner, directory=None):
+    """
+    Store :runner: as Spec.
+
+    Args:
+        runner: The runner of a wrapped binary.
+        directory: The blob store, defaults to blob_dir().
+
+    Returns:
+        The path of the Spec's blob.
+    """
+    directory = blob_dir() if directory is None else directory
+    refs = []
+    idents = {}
+
+    def ident(obj):
+        if id(obj) not in idents:
+            idents[id(obj)] = str(len(refs))
+            refs.append(obj)
+        return idents[id(obj)]
+
+    payload = __dumps(runner, ident)
+    objects = {}
+    # Pickling an object may discover more objects.
+    for obj in refs:
+        objects[ident(obj)] = os.path.basename(
+            put(directory, __dumps(obj, ident)))
+
+    return put(directory, pickle.dumps(Spec(payload, objects, directory),
+                                       protocol=-1))
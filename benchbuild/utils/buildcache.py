@@ -0,0 +1,274 @@
+"""
+Content-addressed cache for build artifacts.
+
+Many experiments build the same project with identical flags and the same
+compiler. With the build cache enabled (``BB_BUILD_CACHE_ENABLE``), the
+build directory of a project is stored after a successful build. All
+subsequent builds with the same key restore the tree from the cache and skip
+the build step altogether.
+
+The key is made of:
+    * the project's NAME and VERSION,
+    * the hash of the project's source (see benchbuild.utils.downloader),
+    * everything the compiler wrappers hide from the build: cflags, ldflags,
+      the compiler extension and the compiler environment,
+    * the hash of the clang/clang++ binaries we compile with.
+
+The cache is bypassed for projects with a compiler extension, because those
+collect data during the build, and for sources without a stored hash. It is
+bypassed as well, if the unionfs image lives outside of the build directory
+(``BB_UNIONFS_IMAGE_PREFIX``).
+
+The compiler wrappers (see benchbuild.utils.wrapping.wrap_cc) are not
+stored, they are only needed during the build and their snapshot of the
+configuration contains credentials. Text files that refer to the build
+directory are rewritten on restore. Trees with binaries that refer to the
+build directory are not stored at all.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import dill
+
+from benchbuild.settings import CFG
+
+LOG = logging.getLogger(__name__)
+
+# Hashes of compiler binaries, keyed by (path, mtime, size).
+__COMPILER_HASHES = {}
+
+# Files a compiler wrapper leaves next to its script, see wrapping.wrap_cc.
+WRAPPER_EXTS = (".benchbuild.cc", ".postproc", ".config.json")
+# A cache entry holds the tree and the build directory it was stored from.
+ORIGIN_F = "origin.json"
+TREE_D = "tree"
+
+
+def cache_dir():
+    """Return the directory that contains all cached build trees."""
+    cdir = CFG["build_cache"]["dir"].value()
+    if cdir is None:
+        cdir = os.path.join(str(CFG["tmp_dir"]), "build-cache")
+    return cdir
+
+
+def file_hash(path):
+    """
+    Hash the contents of a file, caching the result for unchanged files.
+
+    Args:
+        path (str): The file we want to hash.
+
+    Returns:
+        The sha256 hex digest of the file, or None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    entry = (path, stat.st_mtime, stat.st_size)
+    if entry not in __COMPILER_HASHES:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as bin_f:
+            for chunk in iter(lambda: bin_f.read(1 << 20), b''):
+                sha.update(chunk)
+        __COMPILER_HASHES[entry] = sha.hexdigest()
+    return __COMPILER_HASHES[entry]
+
+
+def source_hash(project):
+    """
+    Get the hash of the project's source.
+
+    We prefer the hash the downloader stored alongside the source, this saves
+    us from hashing the source tree again.
+
+    Args:
+        project: The project we want the source hash for.
+
+    Returns:
+        The hash of the project's source as a string, or None if the
+        downloader did not store one.
+    """
+    hash_file = os.path.join(str(CFG["tmp_dir"]), project.src_file + ".hash")
+    if not os.path.exists(hash_file):
+        return None
+    with open(hash_file) as h_file:
+        return h_file.readline().strip() or None
+
+
+def cacheable(project):
+    """Check, if the build of :project: may be taken from the cache."""
+    if not CFG["build_cache"]["enable"].value():
+        return False
+    if project.compiler_extension is not None:
+        return False
+    if source_hash(project) is None:
+        LOG.info("No source hash for %s, bypassing the build cache",
+                 project.name)
+        return False
+    unionfs = CFG["unionfs"]
+    return not (unionfs["enable"].value() and
+                unionfs["image_prefix"].value() is not None)
+
+
+def cache_key(project):
+    """
+    Compute the cache key for the build of a project.
+
+    Args:
+        project: The project we want to build.
+
+    Returns:
+        The cache key as hex digest.
+    """
+    from benchbuild.utils.compiler import llvm
+    from benchbuild.utils.path import template_str
+
+    extension = project.compiler_extension
+    if extension is not None:
+        extension = hashlib.sha256(dill.dumps(extension)).hexdigest()
+    key = {
+        "name": project.NAME,
+        "version": project.VERSION,
+        "source": source_hash(project),
+        "cflags": list(project.cflags),
+        "ldflags": list(project.ldflags),
+        "extension": extension,
+        "env": [CFG["env"][var].value() for var in
+                ["compiler_path", "compiler_ld_library_path"]],
+        "wrapper": hashlib.sha256(
+            template_str("templates/compiler.py.inc").encode()).hexdigest(),
+        "compiler": [file_hash(os.path.join(llvm(), cc))
+                     for cc in ["clang", "clang++"]]
+    }
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def __copy_tree(src, tgt):
+    from benchbuild.utils.cmd import cp
+
+    if CFG["build_cache"]["link"].value() == "hardlink":
+        cp("-al", "--remove-destination", src + "/.", tgt)
+    else:
+        cp("-a", "--reflink=auto", src + "/.", tgt)
+
+
+def __files(tree):
+    for root, _, files in os.walk(tree):
+        for name in files:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                yield path
+
+
+def __strip_wrappers(tree):
+    """Remove all compiler wrappers and their files from :tree:."""
+    for path in list(__files(tree)):
+        if path.endswith(WRAPPER_EXTS[0]):
+            script = path[:-len(WRAPPER_EXTS[0])]
+            for wrapper_f in [script] + [script + e for e in WRAPPER_EXTS]:
+                if os.path.exists(wrapper_f):
+                    os.remove(wrapper_f)
+
+
+def __references(tree, prefix):
+    """
+    Find all files in :tree: that contain the path :prefix:.
+
+    Returns:
+        A tuple of the text files and the binary files, relative to :tree:.
+    """
+    needle = prefix.encode()
+    text, binary = [], []
+    for path in __files(tree):
+        with open(path, 'rb') as tree_f:
+            data = tree_f.read()
+        if needle in data:
+            rel_path = os.path.relpath(path, tree)
+            (binary if b"\0" in data else text).append(rel_path)
+    return text, binary
+
+
+def __rewrite(path, old, new):
+    """Replace :old: with :new: in :path:, without touching the cache."""
+    with open(path, 'rb') as tree_f:
+        data = tree_f.read()
+    tmp = "{0}.{1}".format(path, uuid.uuid4().hex)
+    with open(tmp, 'wb') as tree_f:
+        tree_f.write(data.replace(old.encode(), new.encode()))
+    shutil.copystat(path, tmp)
+    os.rename(tmp, path)
+
+
+def restore(project, key):
+    """
+    Restore the build tree of a project from the cache.
+
+    Args:
+        project: The project we restore.
+        key: The cache key of the project's build.
+
+    Returns:
+        True, if the cache contained a build tree for :key:.
+    """
+    entry = os.path.join(cache_dir(), key)
+    origin_f = os.path.join(entry, ORIGIN_F)
+    if not os.path.exists(origin_f):
+        return False
+    with open(origin_f) as origin:
+        origin = json.load(origin)
+
+    LOG.info("Restoring build of %s from %s", project.name, entry)
+    builddir = os.path.abspath(project.builddir)
+    os.makedirs(builddir, exist_ok=True)
+    __copy_tree(os.path.join(entry, TREE_D), builddir)
+    if origin["builddir"] != builddir:
+        for rel_path in origin["rewrite"]:
+            __rewrite(os.path.join(builddir, rel_path), origin["builddir"],
+                      builddir)
+    return True
+
+
+def store(project, key):
+    """
+    Store the build tree of a project in the cache.
+
+    The tree is copied to a temporary location first and moved into place
+    afterwards. If another process stored the same key in the meantime, we
+    keep the existing entry.
+
+    Args:
+        project: The project we store.
+        key: The cache key of the project's build.
+    """
+    from benchbuild.utils.cmd import cp, rm
+
+    entry = os.path.join(cache_dir(), key)
+    if os.path.exists(entry):
+        return
+
+    builddir = os.path.abspath(project.builddir)
+    tmp_entry = "{0}.{1}".format(entry, uuid.uuid4().hex)
+    tree = os.path.join(tmp_entry, TREE_D)
+    os.makedirs(tree)
+    cp("-a", "--reflink=auto", builddir + "/.", tree)
+    __strip_wrappers(tree)
+    text, binary = __references(tree, builddir)
+    if binary:
+        LOG.info("Not caching the build of %s, %s refers to %s",
+                 project.name, binary[0], builddir)
+        rm("-rf", tmp_entry)
+        return
+    with open(os.path.join(tmp_entry, ORIGIN_F), 'w') as origin:
+        json.dump({"builddir": builddir, "rewrite": text}, origin)
+    try:
+        os.rename(tmp_entry, entry)
+        LOG.info("Stored build of %s in %s", project.name, entry)
+    except OSError:
+        rm("-rf", tmp_entry)
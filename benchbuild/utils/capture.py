@@ -0,0 +1,212 @@
+"""
+Bounded capture of a command's output.
+
+Some benchmarks produce hundreds of megabytes of output. Holding all of it in
+memory and storing it in the database does not scale. With
+``BB_CAPTURE_MODE=stream`` we read stdout and stderr incrementally and only
+keep the first ``BB_CAPTURE_HEAD`` and the last ``BB_CAPTURE_TAIL`` bytes of
+each stream in memory. The full output is written to a gzip compressed file
+under ``<build_dir>/.capture``. If we had to truncate a stream, the captured
+text contains a marker with the path of that file.
+
+The same machinery enforces resource limits (see benchbuild.utils.limits)
+on measured binaries, in both modes.
+"""
+import collections
+import gzip
+import os
+import subprocess
+import threading
+
+from plumbum import ProcessExecutionError
+
+from benchbuild.settings import CFG
+
+MARKER = "\n[... {0} bytes truncated, full output in: {1} ...]\n"
+
+
+def spill_dir():
+    """Return the directory that receives the complete output streams."""
+    cdir = CFG["capture"]["dir"].value()
+    if cdir is None:
+        cdir = os.path.join(str(CFG["build_dir"]), ".capture",
+                            str(CFG["experiment_id"]))
+    return cdir
+
+
+class StreamCapture(object):
+    """
+    Keep the head and the tail of a byte stream in memory.
+
+    All data is written to a compressed spill file as well. The spill file
+    is removed again, if the stream was short enough to keep it completely.
+    Without a spill path, we keep the complete stream in memory.
+    """
+
+    def __init__(self, spill_path, head=0, tail=0):
+        self.spill_path = spill_path
+        self.head_size = head
+        self.tail_size = tail
+        self.head = bytearray()
+        self.tail = collections.deque()
+        self.tail_len = 0
+        self.total = 0
+        self._spill = None
+
+    def write(self, chunk):
+        """Add a chunk of bytes to the stream."""
+        self.total += len(chunk)
+        if self.spill_path is None:
+            self.head += chunk
+            return
+
+        if self._spill is None:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            self._spill = gzip.open(self.spill_path, 'wb')
+        self._spill.write(chunk)
+
+        missing = self.head_size - len(self.head)
+        if missing > 0:
+            self.head += chunk[:missing]
+            chunk = chunk[missing:]
+        if not chunk:
+            return
+
+        self.tail.append(chunk)
+        self.tail_len += len(chunk)
+        while self.tail and self.tail_len - len(self.tail[0]) >= \
+                self.tail_size:
+            self.tail_len -= len(self.tail.popleft())
+
+    @property
+    def truncated(self):
+        """True, if we did not keep the complete stream in memory."""
+        if self.spill_path is None:
+            return False
+        return self.total > len(self.head) + self.tail_size
+
+    def close(self):
+        """Close the spill file and remove it, if we do not need it."""
+        if self._spill is not None:
+            self._spill.close()
+            if not self.truncated:
+                os.remove(self.spill_path)
+
+    def text(self):
+        """
+        Return the captured text.
+
+        Returns:
+            The complete stream, or its head and tail, separated by a marker
+            that points to the spill file.
+        """
+        tail = b"".join(self.tail)
+        if not self.truncated:
+            data = bytes(self.head) + tail
+            return data.decode(errors="replace")
+
+        tail = tail[len(tail) - self.tail_size:]
+        omitted = self.total - len(self.head) - len(tail)
+        return bytes(self.head).decode(errors="replace") + \
+            MARKER.format(omitted, self.spill_path) + \
+            tail.decode(errors="replace")
+
+
+def __drain(pipe, capture, watchdog):
+    for chunk in iter(lambda: pipe.read1(1 << 16), b''):
+        capture.write(chunk)
+        watchdog()
+    pipe.close()
+
+
+def __retcode_ok(retcode, expected):
+    if expected is None:
+        return True
+    if isinstance(expected, (list, tuple, set, frozenset)):
+        return retcode in expected
+    return retcode == expected
+
+
+def run(cmd, name, retcode=0, has_stdin=False, limits=None, bounded=True):
+    """
+    Run a plumbum command and capture its output streams.
+
+    Args:
+        cmd: The plumbum command we execute.
+        name: Prefix for the names of the spill files.
+        retcode: The expected return code(s), None accepts all.
+        has_stdin: Close the stdin of the command right away.
+        limits: The resource limits of the command, see
+            benchbuild.utils.limits.resolve.
+        bounded: Keep only the head and the tail of both streams in memory.
+
+    Returns:
+        A tuple (retcode, stdout, stderr), similar to plumbum's run().
+
+    Raises:
+        ProcessExecutionError: If the command exits with an unexpected
+            return code, or if we had to kill it. In the latter case, the
+            return code is one of benchbuild.utils.limits.Status.
+    """
+    from benchbuild.utils import limits as l
+
+    limits = limits or {}
+    if bounded:
+        head = int(CFG["capture"]["head"].value())
+        tail = int(CFG["capture"]["tail"].value())
+        prefix = os.path.join(spill_dir(), name)
+        out = StreamCapture(prefix + ".stdout.gz", head, tail)
+        err = StreamCapture(prefix + ".stderr.gz", head, tail)
+    else:
+        out, err = StreamCapture(None), StreamCapture(None)
+
+    cpu_s = l.cpu_time()
+    proc = cmd.popen(stdin=subprocess.PIPE if has_stdin else None,
+                     stdout=subprocess.PIPE,
+                     stderr=subprocess.PIPE,
+                     preexec_fn=l.preexec(limits))
+    if has_stdin:
+        proc.stdin.close()
+
+    killed = []
+    output_limit = limits.get("output_bytes")
+    output_lock = threading.Lock()
+
+    def output_watchdog():
+        if output_limit is None:
+            return
+        with output_lock:
+            if out.total + err.total > output_limit and not killed:
+                killed.append(l.Status.OUTPUT)
+                l.kill(proc)
+
+    readers = [
+        threading.Thread(target=__drain,
+                         args=(proc.stdout, out, output_watchdog)),
+        threading.Thread(target=__drain,
+                         args=(proc.stderr, err, output_watchdog))
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        ret = proc.wait(timeout=limits.get("wall_s"))
+    except subprocess.TimeoutExpired:
+        killed.append(l.Status.WALL_TIME)
+        l.kill(proc)
+        ret = proc.wait()
+    except BaseException:
+        l.kill(proc)
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+        out.close()
+        err.close()
+
+    cpu_s = l.cpu_time() - cpu_s
+    ret = killed[0] if killed else l.status(ret, limits, cpu_s)
+    stdout, stderr = out.text(), err.text()
+    if killed or not __retcode_ok(ret, retcode):
+        raise ProcessExecutionError(getattr(proc, "argv", []), int(ret),
+                                    stdout, stderr)
+    return ret, stdout, stderr
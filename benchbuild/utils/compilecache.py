@@ -0,0 +1,355 @@
+"""
+Content-addressed cache for compiled translation units.
+
+Experiments that only vary runtime settings compile the same translation
+units over and over again. With ``BB_COMPILE_CACHE_ENABLE`` the compiler
+wrapper (see benchbuild.utils.wrapping.wrap_cc) looks up the object of every
+single-source compilation (``-c``) in a cache first.
+
+The key is made of:
+    * the hash of the preprocessed source,
+    * the effective arguments, including the hidden CFLAGS and LDFLAGS,
+      without the names of the source and the object,
+    * the compiler executable, its hash and its environment variables,
+    * the environment variables in ``BB_COMPILE_CACHE_ENV``,
+    * the working directory, if debug information is requested.
+
+Objects and the compiler's stderr are stored under their key. The cache is
+bounded by ``BB_COMPILE_CACHE_MAX_SIZE``, least recently used objects are
+evicted first. Every lookup is counted per experiment, the counters are
+stored in the experiment's globalconfig after every build.
+
+Compiler extensions with ``bypass_cache`` set, e.g., all extensions that
+observe the real compilation (see SinglePassExtension), bypass the cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+from benchbuild.settings import CFG
+
+LOG = logging.getLogger(__name__)
+
+SOURCE_EXTS = (".c", ".cc", ".cp", ".cpp", ".cxx", ".c++", ".C", ".i",
+               ".ii", ".m", ".mm")
+
+# Flags whose results we do not store, or that change how inputs are read.
+UNCACHEABLE = ("-E", "-S", "-save-temps", "-fprofile-arcs",
+               "--coverage", "-ftest-coverage", "-fmodules", "-")
+
+# Keeps the size of the cache, see account.
+SIZE_F = "size"
+
+Job = namedtuple("Job", ["source", "output", "preprocess", "key"])
+
+
+def cache_dir():
+    """Return the directory that contains all cached objects."""
+    cdir = CFG["compile_cache"]["dir"].value()
+    if cdir is None:
+        cdir = os.path.join(str(CFG["tmp_dir"]), "compile-cache")
+    return cdir
+
+
+def enabled(extension=None):
+    """Check, if compilations with :extension: may use the cache."""
+    if not CFG["compile_cache"]["enable"].value():
+        return False
+    return not getattr(extension, "bypass_cache", False)
+
+
+def job(flags):
+    """
+    Analyze the command line of a compilation.
+
+    Args:
+        flags: The arguments the build system passed to the compiler.
+
+    Returns:
+        A Job, or None if the compilation is not cacheable.
+
+    Examples:
+        >>> cc_job = job(["-O2", "-c", "src/a.c", "-o", "a.o"])
+        >>> cc_job.source, cc_job.output
+        ('src/a.c', 'a.o')
+        >>> cc_job.preprocess
+        ['-O2', 'src/a.c', '-E', '-P']
+        >>> cc_job.key
+        ['-O2', '-c', '<source>', '-o', '<output>']
+        >>> job(["-c", "a.c"]).output
+        'a.o'
+        >>> job(["a.c", "-o", "a"]) is None
+        True
+        >>> job(["-c", "a.c", "-MD"]) is None
+        True
+    """
+    if "-c" not in flags:
+        return None
+    if any(f in UNCACHEABLE or f.startswith(("-M", "-Wp,", "-x"))
+           for f in flags):
+        return None
+    sources = [f for f in flags if f.endswith(SOURCE_EXTS) and f[0] != "-"]
+    if len(sources) != 1:
+        return None
+    source = sources[0]
+
+    output, output_flags = None, []
+    for i, flag in enumerate(flags):
+        if flag == "-o" and i + 1 < len(flags):
+            output, output_flags = flags[i + 1], [i, i + 1]
+        elif flag.startswith("-o") and flag != "-o":
+            output, output_flags = flag[2:], [i]
+    if output is None:
+        output = os.path.splitext(os.path.basename(source))[0] + ".o"
+
+    preprocess = [f for i, f in enumerate(flags)
+                  if f != "-c" and i not in output_flags] + ["-E", "-P"]
+    key = []
+    for i, flag in enumerate(flags):
+        if flag == source:
+            key.append("<source>")
+        elif i in output_flags:
+            key.append("-o" if flag == "-o" else "<output>")
+        else:
+            key.append(flag)
+    return Job(source, output, preprocess, key)
+
+
+def __executable(cmd):
+    """Return the binary that is executed by the plumbum command :cmd:."""
+    while not hasattr(cmd, "executable") and hasattr(cmd, "cmd"):
+        cmd = cmd.cmd
+    return str(getattr(cmd, "executable", ""))
+
+
+def cache_key(cmd, preprocessed, args):
+    """
+    Compute the cache key of a compilation.
+
+    Args:
+        cmd: The compiler command we run.
+        preprocessed: The preprocessed source.
+        args: The effective arguments of the compilation, see Job.key.
+
+    Returns:
+        The cache key as hex digest.
+    """
+    from benchbuild.utils.buildcache import file_hash
+
+    # The command line contains the paths of the source and the object,
+    # they are part of args as placeholders already.
+    executable = __executable(cmd)
+    env = dict(getattr(cmd, "envvars", {}))
+    for name in CFG["compile_cache"]["env"].value():
+        env[name] = os.environ.get(name)
+    key = {
+        "source": hashlib.sha256(preprocessed.encode()).hexdigest(),
+        "args": list(args),
+        "compiler": [executable, file_hash(executable)],
+        "env": env
+    }
+    if any(a.startswith("-g") for a in args):
+        key["cwd"] = os.getcwd()
+    return hashlib.sha256(
+        json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def count(kind):
+    """Count a cache 'hit' or 'miss' of the current experiment."""
+    cdir = os.path.join(cache_dir(), "counters")
+    os.makedirs(cdir, exist_ok=True)
+    # Single byte appends are atomic, no locking required.
+    with open(os.path.join(cdir, str(CFG["experiment_id"])), 'ab') as cnt_f:
+        cnt_f.write(kind[0].encode())
+
+
+def counters(experiment_id):
+    """Return the cache hits and misses of an experiment."""
+    path = os.path.join(cache_dir(), "counters", str(experiment_id))
+    if not os.path.exists(path):
+        return {"hits": 0, "misses": 0}
+    with open(path, 'rb') as cnt_f:
+        events = cnt_f.read()
+    return {"hits": events.count(b"h"), "misses": events.count(b"m")}
+
+
+def persist_counters(experiment_id):
+    """
+    Store the cache counters of an experiment in its globalconfig.
+
+    The counters are informational, a database error is logged and does not
+    fail the build.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from benchbuild.utils.schema import GlobalConfig, Session
+
+    cnt = counters(experiment_id)
+    LOG.info("Compile cache: %d hits, %d misses", cnt["hits"],
+             cnt["misses"])
+    session = None
+    try:
+        session = Session()
+        for name, value in cnt.items():
+            session.merge(GlobalConfig(experiment_group=experiment_id,
+                                       name="compile_cache." + name,
+                                       value=str(value)))
+        session.commit()
+    except SQLAlchemyError as ex:
+        if session is not None:
+            session.rollback()
+        LOG.warning("Could not store the compile cache counters: %s", ex)
+    finally:
+        if session is not None:
+            session.close()
+
+
+def __entry(key):
+    return os.path.join(cache_dir(), key[:2], key)
+
+
+def __copy(src, tgt):
+    """Copy :src: to :tgt: atomically."""
+    tmp = "{0}.{1}".format(tgt, uuid.uuid4().hex)
+    shutil.copyfile(src, tmp)
+    os.rename(tmp, tgt)
+
+
+def __scan():
+    """Return all cached objects with their mtime and the cache's size."""
+    entries = []
+    total = 0
+    for sub in os.scandir(cache_dir()):
+        if not sub.is_dir() or len(sub.name) != 2:
+            continue
+        for obj in os.scandir(sub.path):
+            stat = obj.stat()
+            total += stat.st_size
+            if obj.name.endswith(".o"):
+                entries.append((stat.st_mtime, obj.path))
+    return entries, total
+
+
+def __evict(max_size):
+    entries, total = __scan()
+    if total <= max_size:
+        return 0, total
+
+    evicted = 0
+    for _, path in sorted(entries):
+        if total <= 0.9 * max_size:
+            break
+        for part in (path, path[:-2] + ".stderr"):
+            try:
+                total -= os.stat(part).st_size
+                os.remove(part)
+            except FileNotFoundError:
+                pass
+        evicted += 1
+    return evicted, total
+
+
+@contextmanager
+def __size_file():
+    """Lock the file that keeps the size of the cache."""
+    import fcntl
+
+    os.makedirs(cache_dir(), exist_ok=True)
+    with open(os.path.join(cache_dir(), SIZE_F), 'a+') as size_f:
+        fcntl.flock(size_f, fcntl.LOCK_EX)
+        yield size_f
+
+
+def __write_size(size_f, total):
+    size_f.seek(0)
+    size_f.truncate()
+    size_f.write(str(total))
+
+
+def evict(max_size):
+    """
+    Evict least recently used objects until the cache fits :max_size:.
+
+    This walks the whole cache, see account for the cheap check.
+
+    Returns:
+        The number of evicted objects.
+    """
+    with __size_file() as size_f:
+        evicted, total = __evict(max_size)
+        __write_size(size_f, total)
+    return evicted
+
+
+def account(size, max_size):
+    """
+    Add :size: bytes to the size of the cache, evict if it gets too large.
+
+    The size is kept in a file, we only walk the cache, if the file is
+    missing or the cache exceeds :max_size:.
+
+    Returns:
+        The number of evicted objects.
+    """
+    evicted = 0
+    with __size_file() as size_f:
+        size_f.seek(0)
+        try:
+            total = int(size_f.read()) + size
+        except ValueError:
+            total = __scan()[1]
+        if total > max_size:
+            evicted, total = __evict(max_size)
+        __write_size(size_f, total)
+    return evicted
+
+
+def cached_compile(compile_job, cmd, preprocess, run, args=()):
+    """
+    Compile through the cache.
+
+    Args:
+        compile_job: The Job of this compilation.
+        cmd: The compiler command.
+        preprocess: The command that preprocesses the source to stdout.
+        run: Runs :cmd:, returns (retcode, stdout, stderr).
+        args: Hidden arguments the Job does not know about.
+
+    Returns:
+        A tuple (retcode, stdout, stderr).
+    """
+    retcode, preprocessed, _ = preprocess.run(retcode=None)
+    if retcode != 0:
+        return run(cmd)
+
+    entry = __entry(cache_key(cmd, preprocessed,
+                              list(compile_job.key) + list(args)))
+    if os.path.exists(entry + ".o"):
+        try:
+            __copy(entry + ".o", compile_job.output)
+            os.utime(entry + ".o")
+            with open(entry + ".stderr") as err_f:
+                stderr = err_f.read()
+            sys.stderr.write(stderr)
+            count("hit")
+            return 0, "", stderr
+        except FileNotFoundError:
+            # Evicted in the meantime.
+            pass
+
+    retcode, stdout, stderr = run(cmd)
+    count("miss")
+    if retcode == 0 and os.path.exists(compile_job.output):
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        with open(entry + ".stderr", 'w') as err_f:
+            err_f.write(stderr or "")
+        __copy(compile_job.output, entry + ".o")
+        account(os.path.getsize(entry + ".o") +
+                os.path.getsize(entry + ".stderr"),
+                int(CFG["compile_cache"]["max_size"].value()))
+    return retcode, stdout, stderr
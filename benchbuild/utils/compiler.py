@@ -209,3 +209,32 @@ class ExperimentCommand(BoundCommand):
         self.args = args if args is not None else []
         for inner_list in list(exp_args):
             self.args.extend(inner_list)
+
+
+class SinglePassExtension(object):
+    """
+    Base class of compiler extensions that observe the real compilation.
+
+    A regular compiler extension is called with the compiler command after
+    the compilation finished. To measure something it has to compile the
+    translation unit a second time. The compiler wrapper calls extensions of
+    this class around its one and only compilation instead:
+
+        1. flags() is appended to the compiler's command line.
+        2. begin(cmd) is called right before the compiler starts.
+        3. end(cmd, retcode, stdout, stderr) is called after it finished.
+
+    The compilation always bypasses the compile cache.
+    """
+
+    bypass_cache = True
+
+    def flags(self):
+        """Return the flags we need in addition to the build's flags."""
+        return []
+
+    def begin(self, cmd):
+        """The compilation :cmd: starts."""
+
+    def end(self, cmd, retcode, stdout, stderr):
+        """The compilation :cmd: finished."""
@@ -5,6 +5,9 @@ from sqlalchemy.exc import IntegrityError
 
 logger = logging.getLogger(__name__)
 
+# Configuration keys that differ for every run, see config_blob.
+VOLATILE_CONFIG = ("BB_DB_RUN_ID=", "BB_DB_RUN_GROUP=")
+
 
 def create_run(cmd, project, exp, grp):
     """
@@ -27,7 +30,7 @@ def create_run(cmd, project, exp, grp):
     """
     from benchbuild.utils import schema as s
 
-    session = s.Session()
+    session = s.Session(scope=grp)
     run = s.Run(command=str(cmd),
                 project_name=project.name,
                 experiment_name=exp,
@@ -57,7 +60,7 @@ def create_run_group(prj):
     """
     from benchbuild.utils import schema
 
-    session = schema.Session()
+    session = schema.Session(scope=prj.run_uuid)
     group = schema.RunGroup(id=prj.run_uuid,
                             project=prj.name,
                             experiment=str(CFG["experiment_id"]))
@@ -67,64 +70,205 @@ def create_run_group(prj):
     return (group, session)
 
 
-def persist_project(project):
+def insert_ignore(table, dialect):
     """
-    Persist this project in the benchbuild database.
+    Create an insert statement that skips rows with a known primary key.
 
     Args:
-        project: The project we want to persist.
+        table: The table we insert into.
+        dialect: The dialect of the database we execute the statement on.
+
+    Returns:
+        The insert statement.
     """
-    from benchbuild.utils.schema import Project, Session
-    session = Session()
-    projects = session.query(Project).filter(Project.name == project.name)
-
-    name = project.name
-    desc = project.__doc__
-    src_url = ''
-    domain = project.domain
-    group_name = project.group_name
-    version = project.version() if callable(project.version) else project.version
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect.name == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    if dialect.name == "mysql":
+        return table.insert().prefix_with("IGNORE")
+    return table.insert()
+
+
+def config_blob(config):
+    """
+    Return the content-addressed form of a configuration.
+
+    Args:
+        config: The configuration, e.g., CFG.
+
+    Returns:
+        A tuple (hash, text). Keys that change with every run are not part
+        of the text.
+
+    Examples:
+        >>> from benchbuild.settings import Configuration
+        >>> c = Configuration('bb')
+        >>> c['db'] = {'run_id': {'default': 1}, 'name': {'default': 'x'}}
+        >>> digest, text = config_blob(c)
+        >>> text
+        'BB_DB_NAME="x"'
+        >>> c['db']['run_id'] = 2
+        >>> config_blob(c)[0] == digest
+        True
+    """
+    import hashlib
+
+    text = "\n".join(l for l in repr(config).split("\n")
+                     if not l.startswith(VOLATILE_CONFIG))
+    return hashlib.sha256(text.encode()).hexdigest(), text
+
+
+def persist_config_blob(session, config):
+    """
+    Persist a configuration blob, if the database does not know it yet.
+
+    Args:
+        session: The db transaction we belong to.
+        config: The configuration, e.g., CFG.
+
+    Returns:
+        The hash of the configuration, for RunLog.config_hash.
+    """
+    from benchbuild.utils.schema import ConfigBlob
+
+    digest, text = config_blob(config)
+    session.execute(insert_ignore(ConfigBlob.__table__,
+                                  session.get_bind().dialect).values(
+                                      hash=digest, config=text))
+    return digest
+
+
+def upsert(table, dialect):
+    """
+    Create an insert statement that updates rows with a known primary key.
+
+    Args:
+        table: The table we insert into.
+        dialect: The dialect of the database we execute the statement on.
+
+    Returns:
+        The insert statement, or None if the database does not support it.
+    """
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={c.name: stmt.excluded[c.name]
+                  for c in table.columns if not c.primary_key})
+    if dialect.name == "sqlite":
+        return table.insert().prefix_with("OR REPLACE")
+    return None
+
+
+def upsert_rows(session, table, rows):
+    """
+    Insert rows, update the rows with a known primary key instead.
+
+    Args:
+        session: The db transaction we belong to.
+        table: The table we insert into.
+        rows: A list of dictionaries with the values of each row.
+    """
+    from sqlalchemy import and_
+
+    stmt = upsert(table, session.get_bind().dialect)
+    if stmt is not None:
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        key = and_(*[c == row[c.name] for c in table.primary_key.columns])
+        if session.execute(table.update().where(key).values(
+                **row)).rowcount == 0:
+            session.execute(table.insert().values(**row))
+
+
+def __project_row(project):
     try:
         src_url = project.src_uri
     except AttributeError:
         src_url = 'unknown'
+    version = project.version() if callable(project.version) \
+        else project.version
+    return {
+        "name": project.name,
+        "description": project.__doc__,
+        "src_url": src_url,
+        "domain": project.domain,
+        "group_name": project.group_name,
+        "version": version
+    }
+
+
+# Names of the projects this process registered already.
+__REGISTERED = set()
+
 
-    if projects.count() == 0:
-        newp = Project()
-        newp.name = name
-        newp.description = desc
-        newp.src_url = src_url
-        newp.domain = domain
-        newp.group_name = group_name
-        newp.version = version
-        session.add(newp)
-        logger.debug("Poject INSERT: %s", newp)
+def persist_projects(projects):
+    """
+    Persist projects in the benchbuild database.
+
+    All projects we did not register in this process yet are written with a
+    single upsert. With ``BB_DB_ASYNC`` or ``BB_DB_JOURNAL`` the upsert is
+    handed to the writer of this process, see benchbuild.utils.dbwriter.
+
+    Args:
+        projects: The projects we want to persist.
+    """
+    from benchbuild.utils import dbwriter
+    from benchbuild.utils.schema import Project, Session
+
+    rows = {}
+    for project in projects:
+        if project.name not in __REGISTERED and project.name not in rows:
+            rows[project.name] = __project_row(project)
+    if not rows:
+        return
+
+    writer = dbwriter.get()
+    if writer is not None:
+        writer.put(("upsert", Project.__tablename__, list(rows.values())))
     else:
-        newp_value = {
-            "name": name,
-            "description": desc,
-            "src_url": src_url,
-            "domain": domain,
-            "group_name": group_name,
-            "version": version
-        }
-        projects.update(newp_value)
-        logger.debug("Project UPDATE: %s", newp_value)
+        session = Session(scope=CFG["experiment_id"])
+        upsert_rows(session, Project.__table__, list(rows.values()))
+        session.commit()
+    logger.debug("Project UPSERT: %s", ", ".join(rows))
+    __REGISTERED.update(rows)
 
-    session.commit()
-    return (projects, session)
+
+def persist_project(project):
+    """
+    Persist this project in the benchbuild database.
+
+    Args:
+        project: The project we want to persist.
+    """
+    persist_projects([project])
 
 
 def persist_experiment(experiment):
     """
     Persist this experiment in the benchbuild database.
 
+    With ``BB_DB_ASYNC`` or ``BB_DB_JOURNAL`` the experiment is handed to the
+    writer of this process, see DBWriter.begin_experiment.
+
     Args:
         experiment: The experiment we want to persist.
+
+    Returns:
+        (experiment, session), the experiment's row and our db transaction.
     """
+    from benchbuild.utils import dbwriter
     from benchbuild.utils.schema import Experiment, Session
 
-    session = Session()
+    writer = dbwriter.get()
+    if writer is not None:
+        return writer.begin_experiment(experiment)
+
+    session = Session(scope=CFG["experiment_id"])
 
     cfg_exp = CFG['experiment_id'].value()
     exps = session.query(Experiment).filter(Experiment.id == cfg_exp)
@@ -152,6 +296,112 @@ def persist_experiment(experiment):
     return (ret, session)
 
 
+def refresh_run_summary(session, run_groups):
+    """
+    Recompute the rows of run_summary for a set of run groups.
+
+    The rows are written inside the session's transaction, the caller is
+    responsible for committing it.
+
+    Args:
+        session: The db transaction we belong to.
+        run_groups: The ids of the run groups we want to summarize.
+    """
+    from sqlalchemy import func, select
+    from benchbuild.utils import schema as s
+
+    run_groups = [str(group) for group in run_groups]
+    if not run_groups:
+        return
+
+    summary = s.RunSummary.__table__
+    session.execute(summary.delete().where(
+        summary.c.run_group.in_(run_groups)))
+    keys = [s.Run.run_group, s.Metric.name, s.Run.experiment_group,
+            s.Run.experiment_name, s.Run.project_name]
+    query = select(keys + [
+        func.count(s.Metric.value), func.sum(s.Metric.value),
+        func.min(s.Metric.value), func.max(s.Metric.value),
+        func.avg(s.Metric.value)
+    ]).where(s.Run.id == s.Metric.run_id).where(
+        s.Run.run_group.in_(run_groups)).group_by(*keys)
+    session.execute(summary.insert().from_select(
+        ["run_group", "metric", "experiment_group", "experiment_name",
+         "project_name", "count", "total", "minimum", "maximum", "mean"],
+        query))
+
+
+def __copy_value(value):
+    """Format a value for PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace(
+        "\n", "\\n").replace("\r", "\\r")
+
+
+def __copy(connection, table, columns, rows):
+    """Insert rows with a single COPY ... FROM STDIN."""
+    import io
+
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(__copy_value(v) for v in row) + "\n")
+    buf.seek(0)
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert("COPY {0} ({1}) FROM STDIN".format(
+            table.name, ", ".join(columns)), buf)
+    finally:
+        cursor.close()
+
+
+def bulk_insert(session, table, columns, rows):
+    """
+    Insert many rows into a table with a single statement.
+
+    On PostgreSQL (psycopg2) we use COPY, every other database gets an
+    executemany insert. The rows are written inside the session's transaction, the
+    caller is responsible for committing it.
+
+    Args:
+        session: The db transaction we belong to.
+        table: The table (or mapped class) we insert into.
+        columns: The names of the columns we provide values for.
+        rows: An iterable of tuples, in the order given by :columns:.
+
+    Returns:
+        The number of inserted rows.
+    """
+    from benchbuild.utils.dbwriter import DeferredSession
+
+    table = getattr(table, "__table__", table)
+    if isinstance(session, DeferredSession):
+        return session.insert_rows(table, columns, rows)
+
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    connection = session.connection()
+    if connection.dialect.driver == "psycopg2":
+        # COPY bypasses the column defaults of the schema.
+        defaults = [c for c in table.columns
+                    if c.name not in columns and c.default is not None and
+                    c.default.is_callable]
+        if defaults:
+            columns = list(columns) + [c.name for c in defaults]
+            extra = tuple(c.default.arg(None) for c in defaults)
+            rows = [tuple(row) + extra for row in rows]
+        __copy(connection, table, columns, rows)
+    else:
+        connection.execute(table.insert(),
+                           [dict(zip(columns, row)) for row in rows])
+    return len(rows)
+
+
 def persist_likwid(run, session, measurements):
     """
     Persist all likwid results.
@@ -163,13 +413,11 @@ def persist_likwid(run, session, measurements):
     """
     from benchbuild.utils import schema as s
 
-    for (region, name, core, value) in measurements:
-        db_measurement = s.Likwid(metric=name,
-                                  region=region,
-                                  value=value,
-                                  core=core,
-                                  run_id=run.id)
-        session.add(db_measurement)
+    bulk_insert(session, s.Likwid,
+                ["metric", "region", "value", "core", "run_id",
+                 "experiment_group"],
+                ((name, region, value, core, run.id, run.experiment_group)
+                 for (region, name, core, value) in measurements))
     session.commit()
 
 
@@ -184,16 +432,29 @@ def persist_time(run, session, timings):
     """
     from benchbuild.utils import schema as s
 
-    for timing in timings:
-        session.add(s.Metric(name="time.user_s",
-                             value=timing[0],
-                             run_id=run.id))
-        session.add(s.Metric(name="time.system_s",
-                             value=timing[1],
-                             run_id=run.id))
-        session.add(s.Metric(name="time.real_s",
-                             value=timing[2],
-                             run_id=run.id))
+    names = ["time.user_s", "time.system_s", "time.real_s"]
+    bulk_insert(session, s.Metric,
+                ["name", "value", "run_id", "experiment_group"],
+                ((name, timing[i], run.id, run.experiment_group)
+                 for timing in timings for i, name in enumerate(names)))
+    session.commit()
+
+
+def persist_metrics(run, session, metrics):
+    """
+    Persist a dictionary of metrics in the database.
+
+    Args:
+        run: The run we attach the metrics to.
+        session: The db transaction we belong to.
+        metrics: A dictionary that maps metric names to values.
+    """
+    from benchbuild.utils import schema as s
+
+    bulk_insert(session, s.Metric,
+                ["name", "value", "run_id", "experiment_group"],
+                ((name, metrics[name], run.id, run.experiment_group)
+                 for name in metrics))
     session.commit()
 
 
@@ -228,9 +489,13 @@ def persist_compilestats(run, session, stats):
         session: The db transaction we belong to.
         stats: The stats we want to store in the database.
     """
-    for stat in stats:
-        stat.run_id = run.id
-        session.add(stat)
+    from benchbuild.utils import schema as s
+
+    bulk_insert(session, s.CompileStat,
+                ["name", "component", "value", "run_id",
+                 "experiment_group"],
+                ((stat.name, stat.component, stat.value, run.id,
+                  run.experiment_group) for stat in stats))
     session.commit()
 
 
@@ -245,8 +510,6 @@ def persist_config(run, session, cfg):
     """
     from benchbuild.utils import schema as s
 
-    for cfg_elem in cfg:
-        session.add(s.Config(name=cfg_elem,
-                             value=cfg[cfg_elem],
-                             run_id=run.id))
+    bulk_insert(session, s.Config, ["name", "value", "run_id"],
+                ((name, cfg[name], run.id) for name in cfg))
     session.commit()
@@ -0,0 +1,435 @@
+"""
+Asynchronous write-behind writer for the database.
+
+Tracking a single execution takes several blocking round trips to the
+database. With ``BB_DB_ASYNC`` all writes on the hot path of a run are put
+into a bounded queue instead. A background thread takes them from the queue
+and writes them in batches, one transaction per batch.
+
+The only remaining round trip is the allocation of the run's id, which we
+need before the binary starts. Ids are taken from the run sequence in blocks
+of growing size.
+
+A batch that fails is tried again with growing delays. If it keeps
+failing, its records are written one by one, so that only the failing
+records are lost. flush raises a WriteError, if records were lost since the
+last flush.
+
+The queue is flushed, i.e., all records are committed, at the end of every
+run group and experiment and when the process exits.
+
+With ``BB_DB_JOURNAL`` the records are written to a local journal instead,
+see benchbuild.utils.journal.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from benchbuild.settings import CFG
+
+LOG = logging.getLogger(__name__)
+
+# Delays in seconds before a failed batch is tried again.
+RETRY_DELAYS = (0.5, 2, 8)
+
+
+class WriteError(Exception):
+    """Records could not be written to the database."""
+
+    def __init__(self, failed):
+        super(WriteError, self).__init__(
+            "Could not write {0} records to the database.".format(failed))
+        self.failed = failed
+
+
+class PendingRun(object):
+    """Stand-in for a schema.Run, schema.RunGroup or schema.Experiment, whose
+    row is written by the DBWriter."""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        return ("<PendingRun: {0} status={1} run={2}>").format(
+            self.project_name, self.status, self.id)
+
+
+class DeferredSession(object):
+    """Stand-in for a session, that hands all writes to the DBWriter."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._session = None
+
+    def add(self, obj):
+        """Insert a mapped object."""
+        mapper = inspect(obj).mapper
+        values = {attr.columns[0].name: getattr(obj, attr.key)
+                  for attr in mapper.column_attrs
+                  if getattr(obj, attr.key) is not None}
+        self.writer.put(("insert", mapper.local_table.name, [values]))
+
+    def insert_rows(self, table, columns, rows):
+        """Insert rows, see benchbuild.utils.db.bulk_insert."""
+        rows = [dict(zip(columns, row)) for row in rows]
+        if rows:
+            self.writer.put(("insert", table.name, rows))
+        return len(rows)
+
+    def end_run(self, run, status, retcode, stdout, stderr):
+        """Complete the run and its log."""
+        now = datetime.now()
+        self.writer.put(("update", "log", ("run_id", run.id), {
+            "stdout": stdout, "stderr": stderr, "status": retcode,
+            "end": now}))
+        self.writer.put(("update", "run", ("id", run.id), {
+            "end": now, "status": status}))
+        run.end = now
+        run.status = status
+
+    def end_run_group(self, group, status):
+        """Complete the run group and refresh its summary."""
+        now = datetime.now()
+        self.writer.put(("update", "rungroup", ("id", group.id), {
+            "end": now, "status": status}))
+        self.writer.put(("summary", "run_summary", [group.id]))
+        group.end = now
+        group.status = status
+
+    def end_experiment(self, experiment):
+        """Complete the experiment."""
+        now = datetime.now()
+        self.writer.put(("update", "experiment", ("id", experiment.id), {
+            "end": now}))
+        experiment.end = now
+
+    def query(self, *entities, **kwargs):
+        """Query the database, after all queued records are written."""
+        self.flush()
+        if self._session is None:
+            self._session = self.writer.session()
+        return self._session.query(*entities, **kwargs)
+
+    def commit(self):
+        """
+        Commit the changes made through our queries, everything else is
+        committed by the writer in batches.
+        """
+        if self._session is not None:
+            self._session.commit()
+        self.close()
+
+    def flush(self):
+        """
+        Block until all queued records are written.
+
+        Raises:
+            WriteError: If records were lost since the last flush.
+        """
+        self.writer.flush()
+
+    def rollback(self):
+        """Nothing to undo, the records are queued already."""
+        self.close()
+
+    def close(self):
+        """Release the session of our queries."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def apply(session, metadata, record):
+    """
+    Write a single record inside the session's transaction.
+
+    Records are tuples:
+        ("insert", table, [values, ...])
+        ("insert_ignore", table, [values, ...])
+        ("upsert", table, [values, ...])
+        ("update", table, (key column, key value), values)
+        ("summary", "run_summary", [run group, ...])
+        ("partitions", "experiment", [experiment, ...])
+
+    Args:
+        session: The db transaction we belong to.
+        metadata: The metadata that knows all tables of the records.
+        record: The record we write.
+    """
+    from benchbuild.utils.db import (insert_ignore, refresh_run_summary,
+                                     upsert_rows)
+
+    table = metadata.tables[record[1]]
+    if record[0] == "insert":
+        session.execute(table.insert(), record[2])
+    elif record[0] == "insert_ignore":
+        session.execute(insert_ignore(table, session.get_bind().dialect),
+                        record[2])
+    elif record[0] == "upsert":
+        upsert_rows(session, table, record[2])
+    elif record[0] == "update":
+        key, value = record[2]
+        session.execute(table.update().where(
+            table.c[key] == value).values(**record[3]))
+    elif record[0] == "summary":
+        refresh_run_summary(session, record[2])
+    elif record[0] == "partitions":
+        from benchbuild.utils.partitions import create_partitions
+        for experiment_group in record[2]:
+            create_partitions(session.connection(), experiment_group)
+
+
+class DBWriter(object):
+    """
+    Write queued records to the database in a background thread.
+
+    See apply for the records we understand.
+    """
+
+    def __init__(self, session_factory, metadata, maxsize=1000, batch=100):
+        self.pid = os.getpid()
+        self.failed = 0
+        self._unreported = 0
+        self._session_factory = session_factory
+        self._metadata = metadata
+        self._batch = batch
+        self._queue = queue.Queue(maxsize)
+        self._ids = []
+        self._id_block = 1
+        self._thread = threading.Thread(target=self.__loop, daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queue a record, blocks while the queue is full."""
+        self._queue.put(record)
+
+    def session(self):
+        """Return a new session of the database."""
+        return self._session_factory()
+
+    def flush(self):
+        """
+        Block until all queued records are written.
+
+        Raises:
+            WriteError: If records were lost since the last flush.
+        """
+        self._queue.join()
+        failed, self._unreported = self._unreported, 0
+        if failed:
+            raise WriteError(failed)
+
+    def close(self):
+        """Commit all queued records, when the process exits."""
+        try:
+            self.flush()
+        except WriteError as ex:
+            LOG.error(str(ex))
+
+    def allocate_run_id(self):
+        """
+        Allocate the id of a new run from the run sequence.
+
+        Returns:
+            The id, or None if the database does not support sequences.
+        """
+        if not self._ids:
+            session = self._session_factory()
+            try:
+                if not session.get_bind().dialect.supports_sequences:
+                    return None
+                self._ids = [row[0] for row in session.execute(
+                    text("SELECT nextval('run_id_seq') "
+                         "FROM generate_series(1, :n)"),
+                    {"n": self._id_block})]
+                self._id_block = min(2 * self._id_block, 64)
+            finally:
+                session.close()
+        return self._ids.pop(0)
+
+    def begin_experiment(self, experiment):
+        """
+        Queue the experiment of this process and its partitions.
+
+        An experiment we know already keeps its begin.
+
+        Args:
+            experiment: The experiment we begin.
+
+        Returns:
+            (experiment, session), a PendingRun and a DeferredSession.
+        """
+        values = {
+            "id": str(CFG["experiment_id"]),
+            "name": experiment.name,
+            "description": CFG["experiment_description"].value(),
+            "begin": datetime.now()
+        }
+        self.put(("insert_ignore", "experiment", [values]))
+        self.put(("update", "experiment", ("id", values["id"]), {
+            "name": values["name"], "description": values["description"]}))
+        self.put(("partitions", "experiment", [values["id"]]))
+        return PendingRun(**values), DeferredSession(self)
+
+    def begin_run_group(self, project):
+        """
+        Queue a new run group.
+
+        Args:
+            project: The project we begin a new run group for.
+
+        Returns:
+            (group, session), a PendingRun and a DeferredSession.
+        """
+        values = {
+            "id": str(project.run_uuid),
+            "project": project.name,
+            "experiment": str(CFG["experiment_id"]),
+            "begin": datetime.now(),
+            "status": "running"
+        }
+        self.put(("insert", "rungroup", [values]))
+        return PendingRun(**values), DeferredSession(self)
+
+    def begin_run(self, command, project, ename, group):
+        """
+        Queue a new run and its log.
+
+        Args:
+            command: The command that will be executed.
+            project: The project we belong to.
+            ename: The experiment name we belong to.
+            group: The run group we belong to.
+
+        Returns:
+            (run, session), a PendingRun and a DeferredSession, or None, if
+            we could not allocate an id for the run.
+        """
+        from benchbuild.utils.db import config_blob
+
+        run_id = self.allocate_run_id()
+        if run_id is None:
+            return None
+
+        now = datetime.now()
+        values = {
+            "id": run_id,
+            "command": str(command),
+            "project_name": project.name,
+            "experiment_name": ename,
+            "run_group": str(group),
+            "experiment_group": str(CFG["experiment_id"]),
+            "begin": now,
+            "status": "running"
+        }
+        self.put(("insert", "run", [values]))
+        digest, config = config_blob(CFG)
+        self.put(("insert_ignore", "config_blob", [{
+            "hash": digest, "config": config}]))
+        self.put(("insert", "log", [{
+            "run_id": run_id, "experiment_group": values["experiment_group"],
+            "begin": now, "config_hash": digest}]))
+        return PendingRun(**values), DeferredSession(self)
+
+    def __apply(self, batch):
+        session = self._session_factory()
+        try:
+            for record in batch:
+                apply(session, self._metadata, record)
+            session.commit()
+        finally:
+            session.close()
+
+    def __lose(self, records):
+        self.failed += len(records)
+        self._unreported += len(records)
+        LOG.error("Could not write %d records to the database.",
+                  len(records), exc_info=True)
+
+    def __write(self, batch):
+        """
+        Write a batch, try again later, if the database is unavailable.
+
+        If the batch fails for any other reason, its records are written one
+        by one, so that only the failing records are lost.
+        """
+        for delay in RETRY_DELAYS + (None, ):
+            try:
+                self.__apply(batch)
+                return
+            except DBAPIError as ex:
+                if not (ex.connection_invalidated or
+                        isinstance(ex, OperationalError)):
+                    break
+                if delay is None:
+                    self.__lose(batch)
+                    return
+                LOG.debug("Could not write %d records, retrying in %ss.",
+                          len(batch), delay)
+                time.sleep(delay)
+            except Exception:  # pylint: disable=broad-except
+                break
+
+        for record in batch:
+            try:
+                self.__apply([record])
+            except Exception:  # pylint: disable=broad-except
+                self.__lose([record])
+
+    def __loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.__write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+__WRITER = None
+
+
+def get():
+    """Return the writer of this process, if asynchronous writes or the
+    journal are on."""
+    global __WRITER
+    journal = CFG["db"]["journal"].value()
+    if not (journal or CFG["db"]["async"].value()) or \
+            CFG["db"]["rollback"].value():
+        return None
+
+    if __WRITER is None or __WRITER.pid != os.getpid():
+        from sqlalchemy.orm import sessionmaker
+        from benchbuild.utils import schema
+
+        batch = int(CFG["db"]["batch_size"].value())
+        if journal:
+            # Connect lazily, the database might be unreachable right now.
+            from benchbuild.utils.journal import JournalWriter
+            __WRITER = JournalWriter(schema.Session, schema.BASE.metadata,
+                                     journal, batch)
+        else:
+            engine = schema.Session().get_bind().engine
+            __WRITER = DBWriter(sessionmaker(bind=engine),
+                                schema.BASE.metadata,
+                                int(CFG["db"]["queue_size"].value()), batch)
+        atexit.register(__WRITER.close)
+    return __WRITER
+
+
+def flush():
+    """Commit all queued records of this process, if there are any."""
+    if __WRITER is not None and __WRITER.pid == os.getpid():
+        __WRITER.flush()
@@ -0,0 +1,169 @@
+"""
+Predict the wall time of an experiment from historical runs.
+
+For every experiment/project pair we look at the run groups of previous
+executions in the database. The cost of a run group is either the sum of its
+step durations (see benchbuild.utils.tracing), or, if we do not have those,
+the sum of the wall time of all its runs plus the mean time the project
+spent outside of its measurements in other experiments. The prediction is
+the mean cost over all run groups.
+
+With more than one worker, projects are distributed onto the workers with
+the longest-processing-time-first rule. The critical path is the longest
+single project, in pipeline mode all measurements are serialized and add up
+as well. Pipeline mode uses the same number of workers as
+benchbuild.utils.scheduler.
+"""
+import heapq
+from collections import defaultdict
+
+
+def history(pairs):
+    """
+    Fetch the historical durations of all experiment/project pairs.
+
+    Args:
+        pairs: A list of (experiment name, project name) tuples.
+
+    Returns:
+        A dictionary that maps each pair with at least one finished run
+        group to a tuple (total, measure), the mean duration of the run group
+        and the mean duration of its measurements in seconds.
+    """
+    from benchbuild.utils.schema import Run, Session, StepDuration
+
+    session = Session()
+    experiments = {e for e, _ in pairs}
+    projects = {p for _, p in pairs}
+
+    runs = session.query(Run.experiment_name, Run.project_name,
+                         Run.run_group, Run.begin, Run.end).filter(
+                             Run.experiment_name.in_(experiments),
+                             Run.project_name.in_(projects),
+                             Run.end.isnot(None))
+    measured = defaultdict(float)
+    for exp, prj, group, begin, end in runs:
+        if begin is not None:
+            measured[(exp, prj, group)] += (end - begin).total_seconds()
+
+    steps = session.query(StepDuration.experiment_name,
+                          StepDuration.project_name, StepDuration.run_group,
+                          StepDuration.name, StepDuration.duration).filter(
+                              StepDuration.project_name.in_(projects))
+    stepped = defaultdict(float)
+    step_measure = defaultdict(float)
+    for exp, prj, group, name, value in steps:
+        stepped[(exp, prj, group)] += value
+        if name == "RUN":
+            step_measure[(exp, prj, group)] += value
+
+    # Runs only cover the measurements. Without step durations, we take the
+    # rest from other run groups of the same project.
+    prepare = defaultdict(list)
+    for key, total in stepped.items():
+        prepare[key[1]].append(
+            total - step_measure.get(key, measured.get(key, 0.0)))
+
+    groups = defaultdict(list)
+    for key in set(measured) | set(stepped):
+        exp, prj, _ = key
+        if key in stepped:
+            total = stepped[key]
+            measure = step_measure.get(key, measured.get(key, 0.0))
+        else:
+            measure = measured[key]
+            others = prepare.get(prj)
+            total = measure + (sum(others) / len(others) if others else 0.0)
+        groups[(exp, prj)].append((total, measure))
+
+    wanted = set(pairs)
+    return {
+        pair: (sum(t for t, _ in costs) / len(costs),
+               sum(m for _, m in costs) / len(costs))
+        for pair, costs in groups.items() if pair in wanted
+    }
+
+
+def makespan(costs, workers):
+    """
+    Estimate the makespan of independent jobs on a number of workers.
+
+    Args:
+        costs: A list of job durations.
+        workers: The number of workers.
+
+    Returns:
+        The makespan of the longest-processing-time-first schedule.
+
+    Examples:
+        >>> makespan([4, 3, 3, 2], 2)
+        6
+        >>> makespan([4, 3, 3, 2], 1)
+        12
+        >>> makespan([], 4)
+        0
+    """
+    loads = [0] * max(1, workers)
+    for cost in sorted(costs, reverse=True):
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
+
+
+def predict(estimates, workers=1, pipeline=False):
+    """
+    Predict the wall time of a set of projects.
+
+    Args:
+        estimates: A dictionary that maps projects to (total, measure)
+            tuples, see :func:`history`.
+        workers: The number of concurrent workers.
+        pipeline: Measurements are serialized, see benchbuild.utils.scheduler.
+
+    Returns:
+        A dictionary with the sequential total, the predicted makespan, the
+        critical path, all in seconds, and the number of workers.
+    """
+    from benchbuild.utils.scheduler import pipeline_workers
+
+    if pipeline:
+        workers = pipeline_workers(workers)
+    totals = [t for t, _ in estimates.values()]
+    critical = max(totals, default=0.0)
+    if pipeline:
+        critical = max(critical, sum(m for _, m in estimates.values()))
+    return {
+        "total": sum(totals),
+        "makespan": max(makespan(totals, workers), critical),
+        "critical_path": critical,
+        "workers": workers
+    }
+
+
+def __fmt(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return "{0:d}:{1:02d}:{2:02d}".format(hours, *divmod(rest, 60))
+
+
+def print_estimate(pairs, workers=1, pipeline=False):
+    """
+    Print the predicted wall time of all experiment/project pairs.
+
+    Args:
+        pairs: A list of (experiment name, project name) tuples.
+        workers: The number of concurrent workers.
+        pipeline: Measurements are serialized.
+    """
+    estimates = history(pairs)
+    for exp, prj in sorted(pairs):
+        est = estimates.get((exp, prj))
+        print("{0} @ {1}: {2}".format(
+            prj, exp, __fmt(est[0]) if est else "unknown"))
+
+    prediction = predict(estimates, workers, pipeline)
+    print()
+    print("Estimated for {0} of {1} projects:".format(
+        len(estimates), len(pairs)))
+    print("  Sequential:    {0}".format(__fmt(prediction["total"])))
+    print("  Wall time:     {0} ({1} workers)".format(
+        __fmt(prediction["makespan"]), prediction["workers"]))
+    print("  Critical path: {0}".format(__fmt(prediction["critical_path"])))
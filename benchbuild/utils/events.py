@@ -0,0 +1,300 @@
+"""
+Columnar storage of region events.
+
+libpprof records one event per region instance: name, start, duration, id,
+type and thread id. Stored as one row per event (``benchbuild_events``), a
+single PAPI run of a loop-heavy program produces millions of rows.
+
+Events are stored as compressed columnar chunks of up to
+``BB_EVENTS_CHUNK_SIZE`` events in ``benchbuild_event_chunks`` instead:
+
+    * Start timestamps are delta-encoded int64.
+    * Names and thread ids are dictionary-encoded.
+    * Every column is stored as little-endian array, the whole chunk is
+      compressed with zlib.
+
+:func:`region_totals` aggregates the chunks of a set of runs with NumPy,
+without ever materializing a row per event.
+
+libpprof, i.e., every instrumented binary, always writes rows into
+``benchbuild_events`` and ``benchbuild_perf_events``. The chunks are made
+afterwards by :func:`compact`:
+    * With ``BB_EVENTS_STORAGE=chunks`` the PAPI experiments compact the
+      events of their runs after their analysis (pprof-analyze reads rows).
+    * ``benchbuild db compact-events`` compacts the events of any experiment.
+``BB_EVENTS_STORAGE`` also selects how :func:`persist_events` writes events
+it gets from python.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+
+from benchbuild.settings import CFG
+
+FORMAT_VERSION = 1
+COLUMNS = ["name", "start", "duration", "id", "type", "tid"]
+
+
+def __dictionary(values):
+    index = {}
+    codes = array('I', (index.setdefault(v, len(index)) for v in values))
+    return list(index), codes
+
+
+def __le_bytes(arr):
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def encode(events):
+    """
+    Encode events as a single compressed columnar chunk.
+
+    Args:
+        events: A list of (name, start, duration, id, type, tid) tuples.
+
+    Returns:
+        The chunk as bytes.
+    """
+    names, name_codes = __dictionary(e[0] for e in events)
+    tids, tid_codes = __dictionary(int(e[5]) for e in events)
+    starts = [int(e[1]) for e in events]
+    deltas = array('q', starts[:1] + [b - a for a, b in zip(starts,
+                                                             starts[1:])])
+    columns = [
+        ("name", name_codes),
+        ("start", deltas),
+        ("duration", array('q', (int(e[2]) for e in events))),
+        ("id", array('q', (int(e[3]) for e in events))),
+        ("type", array('h', (int(e[4]) for e in events))),
+        ("tid", tid_codes),
+    ]
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "count": len(events),
+        "names": names,
+        "tids": tids,
+        "columns": [[name, "<{0}{1}".format(
+            "u" if arr.typecode.isupper() else "i", arr.itemsize)]
+                    for name, arr in columns]
+    }).encode()
+    return zlib.compress(
+        struct.pack("<I", len(header)) + header +
+        b"".join(__le_bytes(arr) for _, arr in columns))
+
+
+def __split(chunk):
+    """Yield the header and (name, dtype, buffer) for every column."""
+    payload = zlib.decompress(chunk)
+    size = struct.unpack_from("<I", payload)[0]
+    header = json.loads(payload[4:4 + size].decode())
+    offset = 4 + size
+    columns = []
+    for name, dtype in header["columns"]:
+        length = header["count"] * int(dtype[2:])
+        columns.append((name, dtype, payload[offset:offset + length]))
+        offset += length
+    return header, columns
+
+
+def decode(chunk):
+    """
+    Decode a chunk into a list of events.
+
+    Args:
+        chunk: A chunk, see :func:`encode`.
+
+    Returns:
+        A list of (name, start, duration, id, type, tid) tuples.
+    """
+    header, columns = __split(chunk)
+    typecodes = {"<u4": 'I', "<i8": 'q', "<i2": 'h'}
+    values = {}
+    for name, dtype, data in columns:
+        arr = array(typecodes[dtype])
+        arr.frombytes(data)
+        if sys.byteorder == "big":
+            arr.byteswap()
+        values[name] = arr
+
+    names, tids = header["names"], header["tids"]
+    return list(zip([names[i] for i in values["name"]],
+                    accumulate(values["start"]), values["duration"],
+                    values["id"], values["type"],
+                    [tids[i] for i in values["tid"]]))
+
+
+def decode_numpy(chunk):
+    """
+    Decode a chunk into NumPy arrays.
+
+    Args:
+        chunk: A chunk, see :func:`encode`.
+
+    Returns:
+        A tuple (header, columns). The name and tid columns contain indices
+        into header["names"] and header["tids"], start is already decoded.
+    """
+    import numpy as np
+
+    header, columns = __split(chunk)
+    values = {name: np.frombuffer(data, dtype=dtype)
+              for name, dtype, data in columns}
+    values["start"] = np.cumsum(values["start"])
+    return header, values
+
+
+def region_totals(chunks, types=None):
+    """
+    Compute the number of events and their total duration per region.
+
+    Args:
+        chunks: An iterable of chunks.
+        types: Only count events of these types, None counts all.
+
+    Returns:
+        A dictionary that maps region names to (count, total duration).
+    """
+    import numpy as np
+
+    totals = defaultdict(lambda: [0, 0])
+    for chunk in chunks:
+        header, values = decode_numpy(chunk)
+        codes, durations = values["name"], values["duration"]
+        if types is not None:
+            mask = np.isin(values["type"], list(types))
+            codes, durations = codes[mask], durations[mask]
+
+        size = len(header["names"])
+        counts = np.bincount(codes, minlength=size)
+        sums = np.bincount(codes, weights=durations, minlength=size)
+        for name, count, total in zip(header["names"], counts, sums):
+            if count:
+                totals[name][0] += int(count)
+                totals[name][1] += int(round(total))
+    return {name: tuple(total) for name, total in totals.items()}
+
+
+def __chunks(run_id, kind, events, size, seq=0):
+    """Yield the rows of benchbuild_event_chunks for :events:."""
+    for i in range(0, len(events), size):
+        yield (run_id, kind, seq, len(events[i:i + size]),
+               encode(events[i:i + size]))
+        seq += 1
+
+
+def persist_events(run, session, events, kind="events"):
+    """
+    Persist the region events of a run.
+
+    Args:
+        run: The run we attach the events to.
+        session: The db transaction we belong to.
+        events: A list of (name, start, duration, id, type, tid) tuples.
+        kind: 'events' for PAPI events, 'perf_events' for perf events.
+    """
+    from benchbuild.utils import schema as s
+    from benchbuild.utils.db import bulk_insert
+
+    if CFG["events"]["storage"].value() == "chunks":
+        size = int(CFG["events"]["chunk_size"].value())
+        bulk_insert(session, s.EventChunk,
+                    ["run_id", "kind", "seq", "count", "data"],
+                    __chunks(run.id, kind, events, size))
+    else:
+        table = s.Event if kind == "events" else s.PerfEvent
+        bulk_insert(session, table, COLUMNS + ["run_id"],
+                    (tuple(e) + (run.id,) for e in events))
+    session.commit()
+
+
+def compact(session, experiment_id=None, size=None):
+    """
+    Move the event rows of runs into chunks.
+
+    Every run is compacted in a transaction of its own: its chunks are
+    written and its rows are deleted. Chunks of a run that was compacted
+    before are kept, the new ones are appended.
+
+    Args:
+        session: The db transaction we belong to.
+        experiment_id: Only compact the runs of this experiment.
+        size: The maximum number of events per chunk, defaults to
+            BB_EVENTS_CHUNK_SIZE.
+
+    Returns:
+        A dictionary that maps the kind of events to the number of runs and
+        the number of events we compacted.
+    """
+    from sqlalchemy import func
+    from benchbuild.utils import schema as s
+    from benchbuild.utils.db import bulk_insert
+
+    size = int(size or CFG["events"]["chunk_size"].value())
+    counts = {}
+    for kind, table in [("events", s.Event), ("perf_events", s.PerfEvent)]:
+        runs = session.query(table.run_id).distinct()
+        if experiment_id is not None:
+            runs = runs.join(s.Run, s.Run.id == table.run_id).filter(
+                s.Run.experiment_group == str(experiment_id))
+        runs = [run_id for run_id, in runs]
+
+        total = 0
+        for run_id in runs:
+            seq = session.query(func.max(s.EventChunk.seq)).filter(
+                s.EventChunk.run_id == run_id,
+                s.EventChunk.kind == kind).scalar()
+            seq = 0 if seq is None else seq + 1
+            rows = session.query(table).filter(table.run_id == run_id)
+            query = session.query(*[getattr(table, c) for c in COLUMNS])
+            query = query.filter(table.run_id == run_id).order_by(
+                table.start, table.id)
+
+            # Only the compressed chunks are kept in memory.
+            chunks, events = [], []
+            for event in query.yield_per(size):
+                events.append(tuple(event))
+                if len(events) == size:
+                    chunks.extend(__chunks(run_id, kind, events, size,
+                                           seq + len(chunks)))
+                    events = []
+            chunks.extend(__chunks(run_id, kind, events, size,
+                                   seq + len(chunks)))
+            try:
+                bulk_insert(session, s.EventChunk,
+                            ["run_id", "kind", "seq", "count", "data"],
+                            chunks)
+                rows.delete(synchronize_session=False)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            total += sum(chunk[3] for chunk in chunks)
+        counts[kind] = (len(runs), total)
+    return counts
+
+
+def load_chunks(session, run_ids, kind="events"):
+    """
+    Load the event chunks of a set of runs.
+
+    Args:
+        session: The db transaction we belong to.
+        run_ids: The ids of the runs.
+        kind: 'events' or 'perf_events'.
+
+    Returns:
+        A generator of chunks, ordered by run and sequence number.
+    """
+    from benchbuild.utils.schema import EventChunk
+
+    query = session.query(EventChunk.data).filter(
+        EventChunk.run_id.in_(list(run_ids)),
+        EventChunk.kind == kind).order_by(EventChunk.run_id, EventChunk.seq)
+    return (bytes(chunk) for chunk, in query.yield_per(16))
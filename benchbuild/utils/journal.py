@@ -0,0 +1,454 @@
+"""
+Local write-ahead journal for the database.
+
+With ``BB_DB_JOURNAL=<directory>`` every record of a run (see
+benchbuild.utils.dbwriter) is appended to a journal file in this directory
+first, one file per process. Appending is the only thing that happens on
+the measurement path, nothing there waits for the database.
+
+A background thread replays the journal into the database. If the database
+is unreachable, it tries again later. Whatever is left at the end of the
+process can be replayed with ``benchbuild db replay``.
+
+Runs get a local, negative id, when they begin. The replay inserts the run
+and maps its local id to the id of the row. A local id is never exported
+to child processes as ``BB_DB_RUN_ID``, there is no row they could refer
+to. The ids of all replayed entries are stored in the database, next to the
+records they wrote. Replaying a journal twice does not duplicate anything.
+When a journal file is replayed completely, it is removed and the ids of
+its entries are forgotten.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from benchbuild.utils.dbwriter import DBWriter, apply
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between two replays, if nothing new arrives.
+RETRY_INTERVAL = 30
+
+# Maximal number of ids in a single IN clause.
+CHUNK_SIZE = 500
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def __encode(obj):
+    if isinstance(obj, datetime):
+        return {"$datetime": obj.strftime(DATETIME_FORMAT)}
+    if isinstance(obj, bytes):
+        return {"$bytes": obj.hex()}
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("{0!r} is not JSON serializable".format(obj))
+
+
+def __decode(obj):
+    if "$datetime" in obj:
+        return datetime.strptime(obj["$datetime"], DATETIME_FORMAT)
+    if "$bytes" in obj:
+        return bytes.fromhex(obj["$bytes"])
+    return obj
+
+
+def dumps(entry_id, record):
+    """
+    Serialize a journal entry into a single line.
+
+    Examples:
+        >>> line = dumps("e1", ("update", "run", ("id", -1), {
+        ...     "end": datetime(2017, 1, 2, 3, 4, 5)}))
+        >>> entry_id, record = loads(line)
+        >>> entry_id, record[:3]
+        ('e1', ['update', 'run', ['id', -1]])
+        >>> record[3]["end"]
+        datetime.datetime(2017, 1, 2, 3, 4, 5)
+    """
+    return json.dumps({"id": entry_id, "record": record},
+                      default=__encode) + "\n"
+
+
+def loads(line):
+    """Deserialize a journal entry, see dumps."""
+    entry = json.loads(line, object_hook=__decode)
+    return entry["id"], entry["record"]
+
+
+class Journal(object):
+    """
+    An append-only file of records.
+
+    Every append is flushed to disk before it returns. Appends and the
+    removal of a replayed file are serialized with a file lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __open(self):
+        if self._file is not None and os.fstat(self._file.fileno()).st_nlink:
+            return
+        if self._file is not None:
+            # Replayed and removed, start a new file.
+            self._file.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a')
+
+    def append(self, record):
+        """
+        Append a record to the journal.
+
+        Returns:
+            The id of the new entry.
+        """
+        entry_id = uuid.uuid4().hex
+        line = dumps(entry_id, record)
+        while True:
+            self.__open()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                if not os.fstat(self._file.fileno()).st_nlink:
+                    continue
+                self._file.write(line)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                return entry_id
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+
+def read(path, offset=0):
+    """
+    Read all complete entries of a journal file.
+
+    Args:
+        path: The journal file.
+        offset: Start reading at this byte offset.
+
+    Returns:
+        A tuple (entries, offset): a list of (id, record) and the offset
+        after the last complete entry.
+    """
+    entries = []
+    try:
+        with open(path, 'rb') as journal_f:
+            journal_f.seek(offset)
+            for line in journal_f:
+                if not line.endswith(b"\n"):
+                    # Interrupted while appending.
+                    break
+                entries.append(loads(line.decode()))
+                offset += len(line)
+    except FileNotFoundError:
+        pass
+    return entries, offset
+
+
+def __chunks(values):
+    values = list(values)
+    for i in range(0, len(values), CHUNK_SIZE):
+        yield values[i:i + CHUNK_SIZE]
+
+
+def __local_ids(record):
+    """Return all local run ids a record refers to."""
+    if record[0] == "update":
+        key, value = record[2]
+        ids = {value} if key in ("id", "run_id") else set()
+    elif record[0] in ("insert", "insert_ignore"):
+        ids = {row.get("run_id") for row in record[2]}
+        if record[1] == "run":
+            ids |= {row.get("id") for row in record[2]}
+    else:
+        ids = set()
+    return {i for i in ids if isinstance(i, int) and i < 0}
+
+
+def __apply_entry(session, metadata, record, id_map):
+    """Apply a journaled record, replace local run ids on the way."""
+    from benchbuild.utils.schema import JournalRun
+
+    if record[0] == "update":
+        key, value = record[2]
+        if value in id_map and key in ("id", "run_id"):
+            value = id_map[value]
+        apply(session, metadata, (record[0], record[1], (key, value),
+                                  record[3]))
+        return
+
+    if record[0] not in ("insert", "insert_ignore"):
+        apply(session, metadata, record)
+        return
+
+    table = metadata.tables[record[1]]
+    rows = []
+    for values in record[2]:
+        values = dict(values)
+        local_id = values.get("id")
+        if record[1] == "run" and local_id is not None and local_id < 0:
+            del values["id"]
+            id_map[local_id] = session.execute(
+                table.insert().values(**values)).inserted_primary_key[0]
+            session.execute(JournalRun.__table__.insert().values(
+                local_id=local_id, run_id=id_map[local_id]))
+            continue
+        if values.get("run_id") in id_map:
+            values["run_id"] = id_map[values["run_id"]]
+        rows.append(values)
+    if rows:
+        apply(session, metadata, (record[0], record[1], rows))
+
+
+def replay(path, session_factory, metadata, batch=100, offset=0):
+    """
+    Write all entries of a journal file, that are not known yet.
+
+    Entries are written in order, one transaction per :batch: entries. The
+    first failing batch stops the replay.
+
+    Args:
+        path: The journal file.
+        session_factory: Returns a new session of the database.
+        metadata: The metadata that knows all tables of the records.
+        batch: The number of entries per transaction.
+        offset: Start replaying at this byte offset.
+
+    Returns:
+        A tuple (count, offset): the number of entries we wrote and the
+        offset after the last entry we replayed.
+    """
+    from benchbuild.utils.schema import JournalEntry, JournalRun
+
+    entries, end = read(path, offset)
+    if not entries:
+        return 0, end
+
+    session = session_factory()
+    try:
+        known = set()
+        for chunk in __chunks(entry_id for entry_id, _ in entries):
+            known.update(entry_id for entry_id, in session.query(
+                JournalEntry.id).filter(JournalEntry.id.in_(chunk)))
+        pending = [e for e in entries if e[0] not in known]
+
+        local_ids = set()
+        for _, record in pending:
+            local_ids |= __local_ids(record)
+        id_map = {}
+        for chunk in __chunks(local_ids):
+            id_map.update(session.query(
+                JournalRun.local_id, JournalRun.run_id).filter(
+                    JournalRun.local_id.in_(chunk)))
+
+        for i in range(0, len(pending), batch):
+            for entry_id, record in pending[i:i + batch]:
+                __apply_entry(session, metadata, record, id_map)
+            session.execute(JournalEntry.__table__.insert(), [
+                {"id": entry_id} for entry_id, _ in pending[i:i + batch]])
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return len(pending), end
+
+
+def remove_if_replayed(path, offset):
+    """
+    Remove a journal file, if nothing was appended after :offset:.
+
+    Returns:
+        True, if the file is gone.
+    """
+    try:
+        journal_f = open(path, 'rb')
+    except FileNotFoundError:
+        return True
+    with journal_f:
+        fcntl.flock(journal_f, fcntl.LOCK_EX)
+        try:
+            if os.fstat(journal_f.fileno()).st_size > offset:
+                return False
+            os.unlink(path)
+            return True
+        finally:
+            fcntl.flock(journal_f, fcntl.LOCK_UN)
+
+
+def forget(path, offset, session_factory):
+    """
+    Remove a journal file, if nothing was appended after :offset:, and
+    forget the ids of its entries and runs afterwards.
+
+    Returns:
+        True, if the file is gone.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from benchbuild.utils.schema import JournalEntry, JournalRun
+
+    entries, _ = read(path)
+    if not remove_if_replayed(path, offset):
+        return False
+
+    local_ids = set()
+    for _, record in entries:
+        local_ids |= __local_ids(record)
+    session = session_factory()
+    try:
+        for chunk in __chunks(entry_id for entry_id, _ in entries):
+            session.query(JournalEntry).filter(
+                JournalEntry.id.in_(chunk)).delete(synchronize_session=False)
+        for chunk in __chunks(local_ids):
+            session.query(JournalRun).filter(
+                JournalRun.local_id.in_(chunk)).delete(
+                    synchronize_session=False)
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        LOG.debug("Could not forget the entries of %s.", path,
+                  exc_info=True)
+    finally:
+        session.close()
+    return True
+
+
+def replay_directory(directory, session_factory, metadata, batch=100):
+    """
+    Replay all journal files of a directory and remove them afterwards.
+
+    Files that fail, e.g., because they refer to rows of a file we did not
+    replay yet, are retried as long as we make progress.
+
+    Returns:
+        A dictionary with the number of entries we wrote per file and a
+        dictionary with the exception of every file we could not replay.
+    """
+    counts = {}
+    failed = {}
+    todo = sorted(glob.glob(os.path.join(directory, "*.jsonl")),
+                  key=os.path.getmtime)
+    while todo:
+        retry = []
+        for path in todo:
+            try:
+                count, offset = replay(path, session_factory, metadata,
+                                       batch)
+                while not forget(path, offset, session_factory):
+                    more, offset = replay(path, session_factory, metadata,
+                                          batch, offset)
+                    count += more
+                counts[path] = counts.get(path, 0) + count
+                failed.pop(path, None)
+            except Exception as ex:  # pylint: disable=broad-except
+                failed[path] = ex
+                retry.append(path)
+        if len(retry) == len(todo):
+            break
+        todo = retry
+    return counts, failed
+
+
+class JournalWriter(DBWriter):
+    """
+    Append records to a local journal and replay it in the background.
+
+    Runs are never blocked by the database. The ids of runs are allocated
+    locally.
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, session_factory, metadata, directory, batch=100):
+        from benchbuild.settings import CFG
+
+        self.pid = os.getpid()
+        self.failed = 0
+        self.journal = Journal(os.path.join(directory, "{0}-{1}.jsonl".format(
+            CFG["experiment_id"], self.pid)))
+        self._session_factory = session_factory
+        self._metadata = metadata
+        self._batch = batch
+        self._lock = threading.Lock()
+        self._position = (None, 0)
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self.__loop, daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Append a record to the journal."""
+        self.journal.append(record)
+        self._wakeup.set()
+
+    def allocate_run_id(self):
+        """Allocate a local id, it is replaced when the run is replayed."""
+        return -(uuid.uuid4().int >> 75)
+
+    def replay(self):
+        """
+        Replay everything we did not write yet.
+
+        Returns:
+            True, if the journal is written completely.
+        """
+        path = self.journal.path
+        with self._lock:
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                return True
+            offset = self._position[1] if self._position[0] == inode else 0
+            try:
+                _, offset = replay(path, self._session_factory,
+                                   self._metadata, self._batch, offset)
+            except Exception:  # pylint: disable=broad-except
+                LOG.debug("Could not replay %s.", path, exc_info=True)
+                return False
+            self._position = (inode, offset)
+            return True
+
+    def flush(self):
+        """Replay the journal and remove it, if it is written completely."""
+        path = self.journal.path
+        while self.replay():
+            if forget(path, self._position[1], self._session_factory):
+                self._position = (None, 0)
+                return
+        self.failed += 1
+        LOG.warning("Could not write the journal %s to the database, "
+                    "replay it with: benchbuild db replay", path)
+
+    def close(self):
+        """
+        Remove the journal, if the background thread replayed it
+        completely, and forget the ids of its entries.
+
+        This never waits for a database we could not reach, whatever is
+        left is written by benchbuild db replay.
+        """
+        path = self.journal.path
+        inode, offset = self._position
+        try:
+            if os.stat(path).st_ino == inode and \
+                    forget(path, offset, self._session_factory):
+                return
+        except FileNotFoundError:
+            return
+        LOG.warning("The journal %s is not written to the database yet, "
+                    "replay it with: benchbuild db replay", path)
+
+    def __loop(self):
+        while True:
+            self._wakeup.wait(RETRY_INTERVAL)
+            self._wakeup.clear()
+            self.replay()
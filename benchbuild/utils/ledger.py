@@ -0,0 +1,250 @@
+"""
+Persistent ledger of completed steps.
+
+Every step that completes successfully is appended to a ledger file under a
+key that is built from:
+    * the experiment id,
+    * the name of the project (or experiment) the step works on,
+    * the name of the step,
+    * a hash of the project's cflags, ldflags and version.
+
+If benchbuild is started with ``--resume`` (``BB_LEDGER_RESUME``), every
+chain of steps restarts at its first unfinished step. A chain is only
+resumed, if the build directory of its first unfinished step still exists.
+Otherwise, it starts over from scratch.
+
+The ledger is an append-only JSON-lines file per experiment id. It is safe
+to append from multiple processes at once. Lines that cannot be parsed,
+e.g., because a process died while appending, are skipped.
+"""
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from benchbuild.settings import CFG
+from benchbuild.utils.actions import Step, StepResult
+
+LOG = logging.getLogger(__name__)
+
+
+def ledger_dir():
+    """Return the directory that contains all ledger files."""
+    ldir = CFG["ledger"]["dir"].value()
+    if ldir is None:
+        ldir = os.path.join(str(CFG["build_dir"]), ".ledger")
+    return ldir
+
+
+def read(path):
+    """
+    Read all entries of a ledger file, skip damaged lines.
+
+    Args:
+        path: The ledger file.
+
+    Returns:
+        The list of entries.
+    """
+    entries = []
+    with open(path) as ledger:
+        for line in ledger:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                LOG.warning("Skipping a damaged entry of %s.", path)
+                continue
+            if isinstance(entry, dict):
+                entries.append(entry)
+    return entries
+
+
+def unwrap(step):
+    """Return the step that :step: wraps, e.g., in a MeasurementSlot."""
+    while hasattr(step, "_action"):
+        step = step._action
+    return step
+
+
+def latest_experiment_id(experiment):
+    """
+    Find the id of the most recent ledger that belongs to :experiment:.
+
+    Args:
+        experiment (str): The name of the experiment.
+
+    Returns:
+        The experiment id, or None if there is no ledger for :experiment:.
+    """
+    ledgers = glob.glob(os.path.join(ledger_dir(), "*.jsonl"))
+    for ledger_f in sorted(ledgers, key=os.path.getmtime, reverse=True):
+        if any(e.get("experiment") == experiment for e in read(ledger_f)):
+            return os.path.splitext(os.path.basename(ledger_f))[0]
+    return None
+
+
+class StepLedger(object):
+    """Record completed steps of an experiment run on disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self._done = set()
+        if os.path.exists(path):
+            self._done = {e["key"] for e in read(path) if "key" in e}
+
+    def __contains__(self, key):
+        return key in self._done
+
+    def key(self, step, seen):
+        """
+        Compute the ledger key of a step.
+
+        Steps that occur more than once in a chain with identical keys are
+        told apart by the order in which we encounter them.
+
+        Args:
+            step: The step we compute the key for.
+            seen (dict): Occurrences of all keys in the current chain.
+
+        Returns:
+            The key, or None, if the step is not recorded in the ledger.
+        """
+        step = unwrap(step)
+        obj = getattr(step, "_obj", None)
+        if not step.NAME or obj is None:
+            return None
+
+        flags = {
+            "cflags": list(getattr(obj, "cflags", [])),
+            "ldflags": list(getattr(obj, "ldflags", [])),
+            "version": getattr(obj, "VERSION", None)
+        }
+        flags_hash = hashlib.sha256(
+            json.dumps(flags, sort_keys=True).encode()).hexdigest()
+        key = "/".join([str(CFG["experiment_id"]), obj.name, step.NAME,
+                        flags_hash[:16]])
+        cnt = seen.get(key, 0)
+        seen[key] = cnt + 1
+        return "{0}#{1}".format(key, cnt)
+
+    def record(self, key, **kwargs):
+        """
+        Append a completed step to the ledger.
+
+        Args:
+            key: The ledger key of the step.
+            **kwargs: Additional information we store alongside the key.
+        """
+        entry = dict(kwargs)
+        entry["key"] = key
+        entry["completed"] = datetime.now().isoformat()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a+') as ledger:
+            fcntl.flock(ledger, fcntl.LOCK_EX)
+            end = ledger.seek(0, os.SEEK_END)
+            if end:
+                ledger.seek(end - 1)
+                if ledger.read(1) != "\n":
+                    # Terminate the line of an interrupted append.
+                    ledger.write("\n")
+            ledger.write(json.dumps(entry) + "\n")
+            ledger.flush()
+            os.fsync(ledger.fileno())
+            fcntl.flock(ledger, fcntl.LOCK_UN)
+        self._done.add(key)
+
+
+class Ledgered(Step):
+    """Record the wrapped step in the ledger, after it completed."""
+
+    def __init__(self, action, ledger, key):
+        super(Ledgered, self).__init__(getattr(action, "_obj", None))
+        self._action = action
+        self._ledger = ledger
+        self._key = key
+        self.STAGE = action.STAGE
+
+    def __len__(self):
+        return len(self._action)
+
+    def __call__(self):
+        result = self._action()
+        if result == StepResult.OK:
+            exp = getattr(self._obj, "experiment", self._obj)
+            self._ledger.record(self._key,
+                                step=unwrap(self._action).NAME,
+                                experiment=exp.name)
+        return result
+
+    def onerror(self):
+        self._action.onerror()
+
+    def __str__(self, indent=0):
+        return self._action.__str__(indent)
+
+
+__LEDGER = None
+
+
+def get():
+    """Return the ledger of the current experiment run, if enabled."""
+    global __LEDGER
+    if not CFG["ledger"]["enable"].value():
+        return None
+
+    path = os.path.join(ledger_dir(), str(CFG["experiment_id"]) + ".jsonl")
+    if __LEDGER is None or __LEDGER.path != path:
+        __LEDGER = StepLedger(path)
+    return __LEDGER
+
+
+def resume(actions):
+    """
+    Prepare a chain of actions for execution.
+
+    All actions with a ledger key are recorded in the ledger after they
+    complete successfully. In resume mode, all completed actions in front of
+    the first unfinished one are dropped from the chain.
+
+    Args:
+        actions: The chain of actions.
+
+    Returns:
+        The list of actions that should be executed.
+    """
+    ledger = get()
+    if ledger is None:
+        return actions
+
+    seen = {}
+    keys = [ledger.key(a, seen) for a in actions]
+    skip = [False] * len(actions)
+    if CFG["ledger"]["resume"].value():
+        for i, (action, key) in enumerate(zip(actions, keys)):
+            if key is None:
+                continue
+            if key not in ledger:
+                builddir = getattr(action._obj, "builddir", None)
+                if builddir is not None and not os.path.exists(builddir):
+                    LOG.info("%s does not exist anymore, starting over.",
+                             builddir)
+                    skip = [False] * len(actions)
+                break
+            skip[i] = True
+
+    chain = []
+    for action, key, done in zip(actions, keys, skip):
+        if done:
+            LOG.info("Skipping completed step: %s", key)
+        elif key is None:
+            chain.append(action)
+        else:
+            chain.append(Ledgered(action, ledger, key))
+    return chain
@@ -0,0 +1,126 @@
+"""
+Resource limits for measured binaries.
+
+Limits are taken from the configuration (``BB_LIMITS_*``) and may be
+overridden per experiment and per project with a ``LIMITS`` class attribute,
+e.g.::
+
+    class SPECK(Project):
+        LIMITS = {"wall_s": 600}
+
+The supported limits are:
+    wall_s - Wall clock time in seconds, enforced by a watchdog.
+    cpu_s - CPU time in seconds, enforced by RLIMIT_CPU.
+    as_bytes - Size of the address space, enforced by RLIMIT_AS.
+    output_bytes - Combined size of stdout and stderr, enforced by a watchdog.
+
+A limit of 0 (or None) disables it. If we kill a process, the run fails
+with one of the status codes in :class:`Status`.
+"""
+import os
+import resource
+import signal
+from enum import IntEnum, unique
+
+from benchbuild.settings import CFG
+
+KEYS = ["wall_s", "cpu_s", "as_bytes", "output_bytes"]
+
+
+@unique
+class Status(IntEnum):
+    """RunLog status codes for runs that exceeded one of their limits."""
+
+    WALL_TIME = 1001
+    CPU_TIME = 1002
+    OUTPUT = 1003
+
+
+def resolve(project=None, experiment=None):
+    """
+    Resolve the effective limits for a run.
+
+    Args:
+        project: The project we run.
+        experiment: The experiment we run under.
+
+    Returns:
+        A dictionary with all active limits.
+    """
+    limits = {k: CFG["limits"][k].value() for k in KEYS}
+    for obj in [experiment, project]:
+        limits.update(getattr(obj, "LIMITS", None) or {})
+    return {k: int(v) for k, v in limits.items() if v}
+
+
+def preexec(limits):
+    """
+    Create a preexec_fn that applies the rlimits to a child process.
+
+    The child is put into its own process group, so that a watchdog can
+    terminate it together with all of its children.
+
+    Args:
+        limits: The active limits, see :func:`resolve`.
+
+    Returns:
+        A function suitable for subprocess.Popen's preexec_fn.
+    """
+    def apply_limits():
+        os.setpgrp()
+        if "cpu_s" in limits:
+            cpu = limits["cpu_s"]
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if "as_bytes" in limits:
+            mem = limits["as_bytes"]
+            resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+
+    return apply_limits
+
+
+def kill(proc):
+    """Kill the process group of :proc:."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def cpu_time():
+    """Return the CPU time (user + system) of all reaped children so far."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def status(retcode, limits=None, cpu_s=None):
+    """
+    Map the return code of a process to a limit status.
+
+    The kernel sends SIGXCPU when a process reaches its soft CPU time limit
+    and SIGKILL when it reaches the hard limit, e.g., because it ignored the
+    SIGXCPU. We can only tell the latter apart from any other SIGKILL by the
+    CPU time the process used.
+
+    Args:
+        retcode: The return code, as reported by subprocess.
+        limits: The active limits of the process, see :func:`resolve`.
+        cpu_s: The CPU time the process used, see :func:`cpu_time`.
+
+    Returns:
+        Status.CPU_TIME, if the process was killed for exceeding its CPU time
+        limit, else the unchanged return code.
+
+    >>> status(-signal.SIGXCPU) == Status.CPU_TIME
+    True
+    >>> status(-signal.SIGKILL, {"cpu_s": 1}, 2.01) == Status.CPU_TIME
+    True
+    >>> status(-signal.SIGKILL, {"cpu_s": 1}, 0.1) == -signal.SIGKILL
+    True
+    """
+    if retcode == -signal.SIGXCPU:
+        return Status.CPU_TIME
+    limit = (limits or {}).get("cpu_s")
+    if retcode == -signal.SIGKILL and limit and cpu_s is not None \
+            and cpu_s >= limit:
+        return Status.CPU_TIME
+    return retcode
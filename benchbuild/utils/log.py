@@ -1,6 +1,4 @@
 import logging
-import logging.config as lc
-from benchbuild import settings
 
 __LOG_DICT = {
     "version": 1,
@@ -44,11 +42,48 @@ __LOG_DICT = {
 
 def configure():
     """Load logging configuration from our own defaults."""
+    import logging.config as lc
     lc.dictConfig(__LOG_DICT)
 
 
-def set_defaults():
-    """Configure the loggers default settings."""
+def configure_handlers():
+    """
+    Install the handlers of our defaults, without logging.config.
+
+    Importing logging.config costs a wrapped binary about 10ms per call.
+    Unlike configure, this keeps all existing loggers enabled.
+    """
+    formatters = {
+        name: logging.Formatter(fmt["format"])
+        for name, fmt in __LOG_DICT["formatters"].items()
+    }
+    handlers = {}
+    for name, conf in __LOG_DICT["handlers"].items():
+        handlers[name] = logging.StreamHandler()
+        handlers[name].setFormatter(formatters[conf["formatter"]])
+
+    loggers = [(logging.getLogger(name), conf)
+               for name, conf in __LOG_DICT["loggers"].items()]
+    loggers.append((logging.getLogger(), __LOG_DICT["root"]))
+    for logger, conf in loggers:
+        if "level" in conf:
+            logger.setLevel(conf["level"])
+        for handler in conf.get("handlers", []):
+            logger.addHandler(handlers[handler])
+        logger.propagate = conf.get("propagate", True)
+
+
+def set_defaults(verbosity=None):
+    """
+    Configure the loggers default settings.
+
+    Args:
+        verbosity: The verbosity level, defaults to BB_VERBOSITY.
+    """
+    if verbosity is None:
+        from benchbuild import settings
+        verbosity = settings.CFG["verbosity"].value()
+
     log_levels = {
         3: logging.DEBUG,
         2: logging.INFO,
@@ -58,4 +93,4 @@ def set_defaults():
 
     logging.captureWarnings(True)
     LOG = logging.getLogger()
-    LOG.setLevel(log_levels[settings.CFG["verbosity"].value()])
+    LOG.setLevel(log_levels[verbosity])
@@ -0,0 +1,271 @@
+"""
+Partitioning and retention of the large fact tables.
+
+metrics, log, compilestats and likwid carry the experiment they belong to
+in experiment_group. On PostgreSQL (11 or newer), ``benchbuild db
+partition`` converts them into tables that are LIST-partitioned by
+experiment_group. Every experiment gets its own partition, when it begins.
+Rows of experiments without a partition end up in a default partition.
+
+``benchbuild db archive`` exports all rows of an experiment into gzip
+compressed CSV files, one per table, and removes them afterwards.
+``benchbuild db prune`` only removes them. The partitions of an experiment
+are detached and dropped, which is a metadata operation. All other tables
+are cleaned up with a DELETE.
+"""
+import csv
+import gzip
+import os
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import and_, or_, select, text
+
+FACT_TABLES = ["metrics", "log", "compilestats", "likwid"]
+
+
+def partition_name(table, experiment_group):
+    """
+    Return the name of an experiment's partition.
+
+    Examples:
+        >>> partition_name("metrics", "12611981-47d7-488a-bb76-3f0d44e75191")
+        'metrics_p_1261198147d7488abb763f0d44e75191'
+    """
+    return "{0}_p_{1}".format(table, uuid.UUID(str(experiment_group)).hex)
+
+
+def supported(connection):
+    """
+    Check, if the database behind :connection: supports our partitions.
+
+    Declarative partitioning with a default partition needs PostgreSQL 11.
+    """
+    if connection.dialect.name != "postgresql":
+        return False
+    version = connection.dialect.server_version_info
+    return version is not None and tuple(version) >= (11, )
+
+
+def partitioned_tables(connection):
+    """Return the names of all fact tables that are partitioned."""
+    if not supported(connection):
+        return set()
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid"))
+    return {name for name, in rows} & set(FACT_TABLES)
+
+
+def __create_partition(connection, table, experiment_group):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS {0} PARTITION OF {1} "
+        "FOR VALUES IN ('{2}')".format(
+            partition_name(table, experiment_group), table,
+            uuid.UUID(str(experiment_group)))))
+
+
+def create_partitions(connection, experiment_group):
+    """
+    Create the partitions of an experiment, if the fact tables are
+    partitioned.
+
+    Args:
+        connection: The connection we create the partitions with.
+        experiment_group: The id of the experiment.
+    """
+    for table in partitioned_tables(connection):
+        __create_partition(connection, table, experiment_group)
+
+
+def __add_foreign_keys(connection, table):
+    for fkey in table.foreign_keys:
+        ddl = "ALTER TABLE {0} ADD FOREIGN KEY ({1}) REFERENCES {2} ({3})"\
+            .format(table.name, fkey.parent.name, fkey.column.table.name,
+                    fkey.column.name)
+        if fkey.onupdate:
+            ddl += " ON UPDATE " + fkey.onupdate
+        if fkey.ondelete:
+            ddl += " ON DELETE " + fkey.ondelete
+        connection.execute(text(ddl))
+
+
+def __primary_key(table):
+    """
+    Return the primary key of a partitioned fact table.
+
+    Examples:
+        >>> from benchbuild.utils.schema import BASE
+        >>> __primary_key(BASE.metadata.tables["compilestats"])
+        ['id', 'experiment_group']
+    """
+    columns = [c.name for c in table.primary_key.columns]
+    if "experiment_group" not in columns:
+        columns.append("experiment_group")
+    return columns
+
+
+def partition(connection):
+    """
+    Convert all fact tables into tables partitioned by experiment_group.
+
+    The conversion copies every table once, it should run inside a
+    transaction. PostgreSQL requires the primary key of a partitioned table
+    to contain the partition key. Therefore, the primary keys of the
+    converted tables are extended by experiment_group. Rows that belong to
+    no run get the nil UUID as experiment_group and end up in the default
+    partition.
+
+    Args:
+        connection: The connection to a PostgreSQL database.
+
+    Returns:
+        The names of the tables we converted.
+    """
+    from benchbuild.utils.schema import BASE, LOG_WITH_CONFIG
+
+    if not supported(connection):
+        raise ValueError("Partitioning requires PostgreSQL 11 or newer.")
+
+    todo = [t for t in FACT_TABLES if t not in partitioned_tables(connection)]
+    if not todo:
+        return todo
+
+    connection.execute(text("DROP VIEW IF EXISTS log_with_config"))
+    for name in todo:
+        table = BASE.metadata.tables[name]
+        legacy = name + "_legacy"
+        connection.execute(text(
+            "UPDATE {0} t SET experiment_group = r.experiment_group "
+            "FROM run r WHERE r.id = t.run_id AND "
+            "t.experiment_group IS NULL".format(name)))
+        connection.execute(text(
+            "UPDATE {0} SET experiment_group = '{1}' "
+            "WHERE experiment_group IS NULL".format(name, uuid.UUID(int=0))))
+        connection.execute(text("ALTER TABLE {0} RENAME TO {1}".format(
+            name, legacy)))
+        connection.execute(text(
+            "CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS) "
+            "PARTITION BY LIST (experiment_group)".format(name, legacy)))
+        for column in table.columns:
+            seq = connection.execute(
+                text("SELECT pg_get_serial_sequence(:t, :c)"),
+                t=legacy, c=column.name).scalar()
+            if seq:
+                connection.execute(text("ALTER SEQUENCE {0} OWNED BY "
+                                        "{1}.{2}".format(seq, name,
+                                                         column.name)))
+        connection.execute(text(
+            "CREATE TABLE {0}_default PARTITION OF {0} DEFAULT".format(name)))
+
+        groups = connection.execute(text(
+            "SELECT DISTINCT experiment_group FROM {0} "
+            "WHERE experiment_group IS NOT NULL".format(legacy)))
+        for group, in groups.fetchall():
+            __create_partition(connection, name, group)
+        connection.execute(text("INSERT INTO {0} SELECT * FROM {1}".format(
+            name, legacy)))
+        connection.execute(text("DROP TABLE {0}".format(legacy)))
+        connection.execute(text(
+            "ALTER TABLE {0} ADD PRIMARY KEY ({1})".format(
+                name, ", ".join(__primary_key(table)))))
+
+        for index in table.indexes:
+            index.create(connection)
+        __add_foreign_keys(connection, table)
+    connection.execute(LOG_WITH_CONFIG)
+    return todo
+
+
+def __rows_of(table, experiment_group):
+    """Return the filter for all rows of :table: that belong to the
+    experiment, or None if the table is shared by all experiments."""
+    from benchbuild.utils.schema import Run
+
+    runs = select([Run.id]).where(Run.experiment_group == experiment_group)
+    columns = table.columns
+    if table.name == "experiment":
+        return columns.id == experiment_group
+    if table.name == "rungroup":
+        return columns.experiment == experiment_group
+    if "experiment_group" in columns and "run_id" in columns:
+        # Rows written before the column existed.
+        return or_(columns.experiment_group == experiment_group,
+                   and_(columns.experiment_group.is_(None),
+                        columns.run_id.in_(runs)))
+    if "experiment_group" in columns:
+        return columns.experiment_group == experiment_group
+    if "run_id" in columns:
+        return columns.run_id.in_(runs)
+    return None
+
+
+def export(connection, experiment_group, directory):
+    """
+    Export all rows of an experiment into gzip compressed CSV files.
+
+    Args:
+        connection: The connection we read the rows with.
+        experiment_group: The id of the experiment.
+        directory: The directory that receives one file per table.
+
+    Returns:
+        An ordered dictionary with the number of rows exported per table.
+    """
+    from benchbuild.utils.schema import BASE
+
+    experiment_group = str(uuid.UUID(str(experiment_group)))
+    os.makedirs(directory, exist_ok=True)
+    counts = OrderedDict()
+    for table in BASE.metadata.sorted_tables:
+        rows = __rows_of(table, experiment_group)
+        if rows is None:
+            continue
+
+        result = connection.execution_options(stream_results=True).execute(
+            table.select().where(rows))
+        path = os.path.join(directory, table.name + ".csv.gz")
+        with gzip.open(path, 'wt', newline='') as csv_f:
+            writer = csv.writer(csv_f)
+            writer.writerow(result.keys())
+            counts[table.name] = 0
+            for row in result:
+                writer.writerow(row)
+                counts[table.name] += 1
+    return counts
+
+
+def prune(connection, experiment_group):
+    """
+    Remove all rows of an experiment.
+
+    Args:
+        connection: The connection we remove the rows with.
+        experiment_group: The id of the experiment.
+
+    Returns:
+        A tuple (counts, dropped): an ordered dictionary with the number of
+        deleted rows per table and the names of the dropped partitions.
+    """
+    from benchbuild.utils.schema import BASE
+
+    experiment_group = str(uuid.UUID(str(experiment_group)))
+    partitioned = partitioned_tables(connection)
+    counts = OrderedDict()
+    dropped = []
+    for table in reversed(BASE.metadata.sorted_tables):
+        part = partition_name(table.name, experiment_group)
+        if table.name in partitioned and connection.execute(
+                text("SELECT to_regclass(:p)"), p=part).scalar():
+            connection.execute(text(
+                "ALTER TABLE {0} DETACH PARTITION {1}".format(
+                    table.name, part)))
+            connection.execute(text("DROP TABLE {0}".format(part)))
+            dropped.append(part)
+
+        # Without a partition, or rows in the default partition.
+        rows = __rows_of(table, experiment_group)
+        if rows is not None:
+            counts[table.name] = connection.execute(
+                table.delete().where(rows)).rowcount
+    return counts, dropped
@@ -105,8 +105,13 @@ def begin_run_group(project):
         database and session is the database session this group lives in.
     """
     from benchbuild.utils.db import create_run_group
+    from benchbuild.utils import dbwriter
     from datetime import datetime
 
+    writer = dbwriter.get()
+    if writer is not None:
+        return writer.begin_run_group(project)
+
     group, session = create_run_group(project)
     group.begin = datetime.now()
     group.status = 'running'
@@ -124,10 +129,34 @@ def end_run_group(group, session):
         session: The database transaction we will finish.
     """
     from datetime import datetime
+    from benchbuild.utils import dbwriter
+    from benchbuild.utils.db import refresh_run_summary
+    from benchbuild.utils.schema import release
+
+    if isinstance(session, dbwriter.DeferredSession):
+        status = 'completed'
+        try:
+            session.flush()
+        except dbwriter.WriteError as ex:
+            logging.getLogger("benchbuild").error(
+                "%s The run group %s failed.", ex, group.id)
+            status = 'failed'
+        session.end_run_group(group, status)
+        release(group.id)
+        return
 
+    try:
+        dbwriter.flush()
+        group.status = 'completed'
+    except dbwriter.WriteError as ex:
+        logging.getLogger("benchbuild").error(
+            "%s The run group %s failed.", ex, group.id)
+        group.status = 'failed'
     group.end = datetime.now()
-    group.status = 'completed'
+    scope = group.id
+    refresh_run_summary(session, [scope])
     session.commit()
+    release(scope)
 
 
 def fail_run_group(group, session):
@@ -139,10 +168,25 @@ def fail_run_group(group, session):
         session: The database transaction we will finish.
     """
     from datetime import datetime
+    from benchbuild.utils import dbwriter
+    from benchbuild.utils.db import refresh_run_summary
+    from benchbuild.utils.schema import release
 
+    if isinstance(session, dbwriter.DeferredSession):
+        session.end_run_group(group, 'failed')
+        release(group.id)
+        return
+
+    try:
+        dbwriter.flush()
+    except dbwriter.WriteError as ex:
+        logging.getLogger("benchbuild").error(str(ex))
     group.end = datetime.now()
     group.status = 'failed'
+    scope = group.id
+    refresh_run_summary(session, [scope])
     session.commit()
+    release(scope)
 
 
 def begin(command, project, ename, group):
@@ -159,18 +203,26 @@ def begin(command, project, ename, group):
         (run, session), where run is the generated run instance and session the
         associated transaction for later use.
     """
-    from benchbuild.utils.db import create_run
+    from benchbuild.utils.db import create_run, persist_config_blob
+    from benchbuild.utils import dbwriter
     from benchbuild.utils import schema as s
     from benchbuild.settings import CFG
     from datetime import datetime
 
+    writer = dbwriter.get()
+    if writer is not None:
+        pending = writer.begin_run(command, project, ename, group)
+        if pending is not None:
+            return pending
+
     db_run, session = create_run(command, project, ename, group)
     db_run.begin = datetime.now()
     db_run.status = 'running'
     log = s.RunLog()
     log.run_id = db_run.id
+    log.experiment_group = db_run.experiment_group
     log.begin = datetime.now()
-    log.config = repr(CFG)
+    log.config_hash = persist_config_blob(session, CFG)
 
     session.add(log)
     session.commit()
@@ -191,8 +243,13 @@ def end(db_run, session, stdout, stderr):
         stdout: The stdout we captured of the run.
         stderr: The stderr we capture of the run.
     """
+    from benchbuild.utils.dbwriter import DeferredSession
     from benchbuild.utils.schema import RunLog
     from datetime import datetime
+    if isinstance(session, DeferredSession):
+        session.end_run(db_run, 'completed', 0, stdout, stderr)
+        return
+
     log = session.query(RunLog).filter(RunLog.run_id == db_run.id).one()
     log.stderr = stderr
     log.stdout = stdout
@@ -218,8 +275,13 @@ def fail(db_run, session, retcode, stdout, stderr):
         stdout: The stdout we captured of the run.
         stderr: The stderr we capture of the run.
     """
+    from benchbuild.utils.dbwriter import DeferredSession
     from benchbuild.utils.schema import RunLog
     from datetime import datetime
+    if isinstance(session, DeferredSession):
+        session.end_run(db_run, 'failed', retcode, stdout, stderr)
+        return
+
     log = session.query(RunLog).filter(RunLog.run_id == db_run.id).one()
     log.stderr = stderr
     log.stdout = stdout
@@ -272,26 +334,45 @@ def track_execution(cmd, project, experiment, **kwargs):
     """
     from plumbum.commands import ProcessExecutionError
     from warnings import warn
+    from benchbuild.utils.limits import resolve as resolve_limits
 
     db_run, session = begin(cmd, project, experiment.name,
                             project.run_uuid)
     ex = None
 
-    settings.CFG["db"]["run_id"] = db_run.id
+    if db_run.id is not None and db_run.id > 0:
+        settings.CFG["db"]["run_id"] = db_run.id
+    elif "run_id" in settings.CFG["db"]:
+        # A local id of the journal, there is no row to refer to yet.
+        del settings.CFG["db"].node["run_id"]
     settings.CFG["use_file"] = 0
+    limits = resolve_limits(project, experiment)
 
     def runner(retcode=0, ri = None):
+        from benchbuild.utils import tracing
         cmd_env = settings.to_env_dict(settings.CFG)
         r = RunInfo()
-        with local.env(**cmd_env):
+        with local.env(**cmd_env), \
+                tracing.span(project.name, "run", command=str(cmd),
+                             experiment=experiment.name, run_id=db_run.id):
+            if "BB_DB_RUN_ID" not in cmd_env:
+                local.env.pop("BB_DB_RUN_ID", None)
             has_stdin = kwargs.get("has_stdin", False)
             try:
                 import subprocess
-                ec, stdout, stderr = cmd.run(
-                    retcode=retcode,
-                    stdin=subprocess.PIPE if has_stdin else None,
-                    stderr=subprocess.PIPE,
-                    stdout=subprocess.PIPE)
+                stream = settings.CFG["capture"]["mode"].value() == "stream"
+                if stream or limits:
+                    from benchbuild.utils import capture
+                    ec, stdout, stderr = capture.run(
+                        cmd, str(db_run.id),
+                        retcode=retcode, has_stdin=has_stdin,
+                        limits=limits, bounded=stream)
+                else:
+                    ec, stdout, stderr = cmd.run(
+                        retcode=retcode,
+                        stdin=subprocess.PIPE if has_stdin else None,
+                        stderr=subprocess.PIPE,
+                        stdout=subprocess.PIPE)
 
                 r = RunInfo(
                     retcode=ec,
@@ -0,0 +1,275 @@
+"""
+Minimal runtime for generated wrappers.
+
+Every call of a wrapped binary or compiler starts a fresh interpreter. The
+regular startup of benchbuild searches and loads the config file and walks
+the whole configuration tree through the environment. It also pulls in
+plumbum and, through the runner, everything else.
+
+Instead, benchbuild.utils.wrapping freezes the configuration of the
+experiment into a flat snapshot (see settings.to_env_dict) next to the
+blob. The wrappers activate it before anything else is imported:
+    * benchbuild.settings initializes from the snapshot, only environment
+      variables that are actually set are decoded.
+    * The lookup paths are applied without importing plumbum.
+    * Logging and tracing are configured from the snapshot.
+    * Compilers are run as plain :class:`Command`.
+
+This module depends on python's standard library only.
+
+Examples:
+    >>> import os, tempfile
+    >>> snapshot_f = os.path.join(tempfile.mkdtemp(), "snapshot.json")
+    >>> with open(snapshot_f, 'w') as snapshot:
+    ...     _ = snapshot.write('{"BB_A": [1, 2], "BB_B": "b"}')
+    >>> load(snapshot_f)["BB_A"]
+    [1, 2]
+    >>> os.environ["BB_B"] = "42"
+    >>> value("BB_B", load(snapshot_f))
+    42
+    >>> del os.environ["BB_B"]
+"""
+import json
+import os
+import shlex
+import subprocess
+import sys
+from contextlib import contextmanager
+
+__SNAPSHOT = {}
+
+
+def store(path, config):
+    """
+    Freeze :config: into the snapshot at :path:.
+
+    The snapshot contains the database credentials, only its owner may
+    read it.
+
+    Args:
+        path: The snapshot file.
+        config: A benchbuild.settings.Configuration.
+    """
+    from benchbuild.settings import UUIDEncoder, to_env_dict
+
+    tmp = "{0}.{1}".format(path, os.getpid())
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as snapshot:
+        json.dump(to_env_dict(config), snapshot, cls=UUIDEncoder,
+                  separators=(",", ":"))
+    os.rename(tmp, path)
+
+
+def load(path):
+    """Load the snapshot at :path:."""
+    with open(path) as snapshot:
+        return json.load(snapshot)
+
+
+def snapshot():
+    """Return the active snapshot, None, if there is none."""
+    return __SNAPSHOT.get("values")
+
+
+def value(env_var, values=None):
+    """
+    Return the value of :env_var:, like settings.Configuration does.
+
+    The environment takes precedence over the snapshot :values:, which
+    default to the active snapshot.
+    """
+    if env_var in os.environ:
+        try:
+            return json.loads(os.environ[env_var])
+        except ValueError:
+            return os.environ[env_var]
+    if values is None:
+        values = snapshot() or {}
+    return values.get(env_var)
+
+
+def update_env(lookup_path, lib_path):
+    """Prepend :lookup_path: and :lib_path: to PATH and LD_LIBRARY_PATH."""
+    for var, paths in [("PATH", lookup_path),
+                       ("LD_LIBRARY_PATH", lib_path)]:
+        paths = os.path.pathsep.join(paths or [])
+        if var in os.environ:
+            paths = os.path.pathsep.join([paths, os.environ[var]])
+        os.environ[var] = paths
+
+    # plumbum copies the environment, once it is imported.
+    if "plumbum" in sys.modules:
+        from plumbum import local
+        local.env.update(PATH=os.environ["PATH"],
+                         LD_LIBRARY_PATH=os.environ["LD_LIBRARY_PATH"])
+
+
+def activate(path):
+    """
+    Activate the snapshot at :path: for this process.
+
+    This needs to happen before benchbuild.settings is imported.
+    """
+    values = load(path)
+    __SNAPSHOT["values"] = values
+    update_env(value("BB_ENV_LOOKUP_PATH"),
+               value("BB_ENV_LOOKUP_LD_LIBRARY_PATH"))
+    return values
+
+
+def configure_logging():
+    """Configure logging, like the benchbuild command does."""
+    from benchbuild.utils import log
+
+    log.configure_handlers()
+    log.set_defaults(value("BB_VERBOSITY") or 0)
+
+
+@contextmanager
+def env(**kwargs):
+    """Temporarily update the environment, plumbum's too, if loaded."""
+    prev = dict(os.environ)
+    os.environ.update(kwargs)
+    try:
+        if "plumbum" in sys.modules:
+            from plumbum import local
+            with local.env(**kwargs):
+                yield
+        else:
+            yield
+    finally:
+        os.environ.clear()
+        os.environ.update(prev)
+
+
+@contextmanager
+def span(name, cat, **kwargs):
+    """Trace the enclosed block, see benchbuild.utils.tracing.span."""
+    if not value("BB_TRACE_ENABLE"):
+        yield
+        return
+
+    from benchbuild.utils import tracing
+    with tracing.span(name, cat, **kwargs):
+        yield
+
+
+def load_blob(path):
+    """
+    Load the pickled runner at :path:.
+
+    Blobs are written by dill, but they are regular pickles. The standard
+    unpickler imports dill on demand, i.e., only if the runner was pickled
+    by value.
+    """
+    import pickle
+
+    with open(path, 'rb') as blob:
+        return pickle.load(blob)
+
+
+class CommandError(Exception):
+    """A :class:`Command` exited with an unexpected return code."""
+
+    def __init__(self, argv, retcode, stdout, stderr):
+        super(CommandError, self).__init__(
+            "{0} exited with {1}".format(" ".join(argv), retcode))
+        self.argv = argv
+        self.retcode = retcode
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class Command(object):
+    """
+    A command line and its environment.
+
+    It mimics the few parts of a plumbum command the compiler wrapper
+    needs, without importing plumbum.
+
+    Examples:
+        >>> cmd = Command(["sh", "-c"], {"BB_X": "x"})["echo $BB_X"]
+        >>> str(cmd)
+        "sh -c 'echo $BB_X'"
+        >>> cmd.run()
+        (0, 'x\\n', '')
+    """
+
+    def __init__(self, argv, envvars=None):
+        self.argv = list(argv)
+        self.envvars = dict(envvars or {})
+
+    @property
+    def executable(self):
+        """The binary we execute."""
+        return self.argv[0]
+
+    def __getitem__(self, args):
+        if isinstance(args, str):
+            args = [args]
+        return Command(self.argv + list(args), self.envvars)
+
+    def __str__(self):
+        return " ".join(shlex.quote(arg) for arg in self.argv)
+
+    def run(self, retcode=0, timeout=None):
+        """
+        Run the command, like plumbum's run.
+
+        Args:
+            retcode: The expected return code, None accepts all.
+            timeout: Kill the command after this many seconds.
+
+        Returns:
+            A tuple (retcode, stdout, stderr).
+
+        Raises:
+            CommandError: If the command exits with an unexpected return
+                code or runs into the timeout.
+        """
+        env = dict(os.environ, **self.envvars)
+        try:
+            proc = subprocess.run(self.argv, env=env, timeout=timeout,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+        except subprocess.TimeoutExpired as ex:
+            raise CommandError(self.argv, -9,
+                               (ex.stdout or b"").decode(errors="replace"),
+                               (ex.stderr or b"").decode(errors="replace"))
+        stdout = proc.stdout.decode(errors="replace")
+        stderr = proc.stderr.decode(errors="replace")
+        if retcode is not None and proc.returncode != retcode:
+            raise CommandError(self.argv, proc.returncode, stdout, stderr)
+        return proc.returncode, stdout, stderr
+
+    def plumbum(self):
+        """Return the same command as plumbum command."""
+        from plumbum import local
+
+        cmd = local[self.argv[0]][self.argv[1:]]
+        return cmd.with_env(**self.envvars) if self.envvars else cmd
+
+
+def store_command(path, cmd):
+    """
+    Store the plumbum command :cmd: at :path:, see :func:`load_command`.
+
+    Args:
+        path: The file we store the command in.
+        cmd: A plumbum command, e.g., the compiler.
+    """
+    envvars = getattr(cmd, "envvars", None)
+    if envvars is None:
+        # plumbum 2 renamed them.
+        envvars = getattr(cmd, "env", None)
+    with open(path, 'w') as cmd_f:
+        json.dump({"argv": [str(a) for a in cmd.formulate()],
+                   "env": dict(envvars or {})}, cmd_f)
+
+
+def load_command(path):
+    """Load the command at :path:, see :func:`store_command`."""
+    with open(path) as cmd_f:
+        cmd = json.load(cmd_f)
+    return Command(cmd["argv"], cmd["env"])
@@ -0,0 +1,282 @@
+"""
+Scheduling of experiment actions.
+
+By default, benchbuild executes all actions of an experiment strictly one
+after another. If the scheduler is configured to use more than one worker,
+e.g., via ``benchbuild run --parallel N`` or ``BB_SCHEDULER_PARALLEL=N``,
+consecutive per-project chains (``RequireAll``) are handed to a pool of
+worker processes instead.
+
+Every chain runs in a freshly forked worker process. This keeps the global
+configuration, the current working directory and the environment of each
+project isolated from all other projects. Workers never reuse the database
+connection of the driver process, they open their own on demand.
+
+The number of CPUs given by ``CFG["jobs"]`` is treated as a core budget that
+is split evenly among all workers.
+
+Pipelined execution
+-------------------
+
+With ``benchbuild run --pipeline`` (``BB_SCHEDULER_PIPELINE``) each chain
+still runs its steps in order, but all steps tagged with
+``StepStage.MEASURE`` share a single lock. Exactly one measurement at a
+time runs on the reserved core set (``BB_SCHEDULER_RESERVED_CORES``).
+Measurements are mutually exclusive, not ordered: the chain that reaches
+its measurement first takes the lock next.
+
+IO and BUILD steps of upcoming projects keep running on the remaining cores
+while a measurement is in progress. They do not share cores with the
+measurement, but they still compete for shared caches, memory bandwidth and
+IO. Use the sequential mode, if measurements need an otherwise idle machine.
+"""
+import logging
+import multiprocessing
+import os
+from functools import partial
+
+from benchbuild.settings import CFG
+from benchbuild.utils.actions import RequireAll, Step, StepResult, StepStage
+
+LOG = logging.getLogger(__name__)
+
+# The chains of the currently active pool. Workers are forked from the
+# driver process and pick up their chain from here, this way we never have
+# to pickle the actions themselves.
+__CHAINS = []
+
+
+def core_budget(workers, jobs=None):
+    """
+    Split the core budget among the given number of workers.
+
+    Args:
+        workers (int): The number of workers we want to use.
+        jobs (int): The core budget, defaults to ``CFG["jobs"]``.
+
+    Returns:
+        A tuple (workers, jobs): The number of workers we can afford and
+        the number of jobs each of these workers may use.
+
+    Examples:
+        >>> core_budget(2, 8)
+        (2, 4)
+        >>> core_budget(3, 8)
+        (3, 2)
+        >>> core_budget(16, 8)
+        (8, 1)
+    """
+    if jobs is None:
+        jobs = int(CFG["jobs"].value())
+    workers = max(1, min(workers, jobs))
+    return (workers, max(1, jobs // workers))
+
+
+def pipeline_workers(workers):
+    """
+    Return the number of workers we use in pipeline mode.
+
+    A pipeline needs at least one worker that measures and one that prepares
+    the upcoming projects.
+
+    Examples:
+        >>> pipeline_workers(1)
+        2
+        >>> pipeline_workers(4)
+        4
+    """
+    return max(workers, 2)
+
+
+def measurement_cores():
+    """
+    Split the cores we may use into a measurement and a build set.
+
+    The measurement set is taken from ``CFG["scheduler"]["reserved_cores"]``.
+    If nothing is configured, we reserve the last core available to us.
+
+    Returns:
+        A tuple (reserved, remaining) of core sets. The remaining set falls
+        back to all available cores, if nothing remains.
+    """
+    available = os.sched_getaffinity(0)
+    reserved = set(CFG["scheduler"]["reserved_cores"].value()) & available
+    if not reserved:
+        reserved = {max(available)}
+    remaining = (available - reserved) or available
+    return (reserved, remaining)
+
+
+class MeasurementSlot(Step):
+    """Run a measurement step exclusively on the reserved cores."""
+
+    STAGE = StepStage.MEASURE
+
+    def __init__(self, action, lock, cores):
+        super(MeasurementSlot, self).__init__(getattr(action, "_obj", None))
+        self._action = action
+        self._lock = lock
+        self._cores = cores
+
+    def __len__(self):
+        return len(self._action)
+
+    def __call__(self):
+        with self._lock:
+            affinity = os.sched_getaffinity(0)
+            jobs = CFG["jobs"].value()
+            os.sched_setaffinity(0, self._cores)
+            CFG["jobs"] = str(len(self._cores))
+            try:
+                return self._action()
+            finally:
+                CFG["jobs"] = jobs
+                os.sched_setaffinity(0, affinity)
+
+    def onerror(self):
+        self._action.onerror()
+
+    def __str__(self, indent=0):
+        return self._action.__str__(indent)
+
+
+def guard_measurements(action, lock, cores):
+    """
+    Wrap all measurement steps in :action: with a MeasurementSlot.
+
+    Args:
+        action: The action we want to guard, containers are searched
+            recursively.
+        lock: The lock that serializes all measurements.
+        cores: The reserved core set for measurements.
+
+    Returns:
+        The guarded action.
+    """
+    inner = getattr(action, "_actions", None)
+    if inner is not None:
+        action._actions = [guard_measurements(a, lock, cores) for a in inner]
+    elif action.STAGE == StepStage.MEASURE:
+        action = MeasurementSlot(action, lock, cores)
+    return action
+
+
+def partition(actions):
+    """
+    Partition a list of actions into sequential and concurrent groups.
+
+    Consecutive ``RequireAll`` chains are independent of each other and form
+    a concurrent group, everything else stays sequential.
+
+    Args:
+        actions: The list of actions we want to partition.
+
+    Returns:
+        A list of tuples (concurrent, actions).
+    """
+    groups = []
+    for action in actions:
+        concurrent = isinstance(action, RequireAll)
+        if groups and groups[-1][0] == concurrent:
+            groups[-1][1].append(action)
+        else:
+            groups.append((concurrent, [action]))
+    return groups
+
+
+def __run_chain(index, jobs, cores=None):
+    from benchbuild.utils import dbwriter
+    CFG["jobs"] = str(jobs)
+    if cores:
+        os.sched_setaffinity(0, cores)
+    try:
+        return __CHAINS[index]()
+    finally:
+        # Pool workers exit without running atexit handlers.
+        try:
+            dbwriter.flush()
+        except dbwriter.WriteError as ex:
+            LOG.error(str(ex))
+
+
+def run_concurrent(chains, workers, cores=None):
+    """
+    Run a list of independent chains in a pool of worker processes.
+
+    Args:
+        chains: The list of chains we want to execute.
+        workers: The maximum number of concurrent workers.
+        cores: Restrict all workers to this core set. The core budget
+            is taken from it as well.
+
+    Returns:
+        A list of the chains' results, in the order of :chains:.
+    """
+    global __CHAINS
+    workers, jobs = core_budget(min(workers, len(chains)),
+                                len(cores) if cores else None)
+    LOG.info("Running %d chains with %d workers, %d jobs each.",
+             len(chains), workers, jobs)
+
+    __CHAINS = chains
+    ctx = multiprocessing.get_context("fork")
+    pool = ctx.Pool(processes=workers, maxtasksperchild=1)
+    try:
+        results = pool.map(partial(__run_chain, jobs=jobs, cores=cores),
+                           range(len(chains)), chunksize=1)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        __CHAINS = []
+    return results
+
+
+def run_pipelined(chains, workers):
+    """
+    Run a list of independent chains as a measurement pipeline.
+
+    IO and BUILD steps of all chains run concurrently on the build cores,
+    also while a measurement runs. MEASURE steps run one at a time, in no
+    particular order, on the reserved cores only.
+
+    Args:
+        chains: The list of chains we want to execute.
+        workers: The number of chains we prepare ahead of time.
+
+    Returns:
+        A list of the chains' results, in the order of :chains:.
+    """
+    reserved, remaining = measurement_cores()
+    LOG.info("Reserved cores for measurements: %s", sorted(reserved))
+
+    lock = multiprocessing.get_context("fork").Lock()
+    chains = [guard_measurements(c, lock, reserved) for c in chains]
+    return run_concurrent(chains, workers, cores=remaining)
+
+
+def execute(actions, workers, pipeline=False):
+    """
+    Execute a list of actions, running independent chains concurrently.
+
+    Args:
+        actions: The list of actions we want to execute.
+        workers: The maximum number of concurrent workers.
+        pipeline: Serialize all measurements on a reserved core set, while
+            preparing upcoming projects on the remaining cores.
+
+    Returns:
+        The result of the last action.
+    """
+    result = StepResult.OK
+    for concurrent, group in partition(actions):
+        if concurrent and pipeline and len(group) > 1:
+            result = run_pipelined(group, pipeline_workers(workers))[-1]
+        elif concurrent and workers > 1 and len(group) > 1:
+            result = run_concurrent(group, workers)[-1]
+        else:
+            for action in group:
+                result = action()
+    return result
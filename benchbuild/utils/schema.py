@@ -6,8 +6,11 @@ The schema should initialize itself on an empty database. For now, we do not
 support automatic upgrades on schema changes. You might encounter some
 roadbumps when using an older version of benchbuild.
 
-Furthermore, for now, we are restricted to postgresql databases, although we
-already support arbitrary connection strings via config.
+The schema is portable between PostgreSQL and SQLite. For local or offline
+runs, point ``BB_DB_CONNECT_STRING`` to a SQLite file, e.g.,
+``sqlite:////home/user/bb.sqlite``. SQLite databases use write-ahead logging,
+so concurrent runs do not block each other. Results can be merged into the
+central database later with ``benchbuild db import``.
 
 If you want to use reports that use one of our SQL functions, you need to
 initialize the functions first using the following command:
@@ -22,18 +25,79 @@ As soon as we have alembic running, we can provide automatic up/downgrade
 paths for you.
 """
 
+import hashlib
 import logging
+import os
+import uuid
 import sqlalchemy as sa
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum
+from sqlalchemy import BigInteger, Float, LargeBinary, Numeric, SmallInteger
+from sqlalchemy import Index
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.types import CHAR, TypeDecorator
 from benchbuild.settings import CFG
 from benchbuild.utils import path as bbpath
 
 BASE = declarative_base()
 
+
+class GUID(TypeDecorator):
+    """
+    Platform-independent UUID.
+
+    Uses PostgreSQL's UUID type, otherwise CHAR(36).
+    """
+
+    impl = CHAR
+
+    def __init__(self, *args, as_uuid=False, **kwargs):
+        super(GUID, self).__init__(*args, **kwargs)
+        self.as_uuid = as_uuid
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID())
+        return dialect.type_descriptor(CHAR(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return str(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        if self.as_uuid:
+            return value if isinstance(value, uuid.UUID) else \
+                uuid.UUID(str(value))
+        return str(value)
+
+
+class Double(TypeDecorator):
+    """
+    Platform-independent double precision float.
+
+    Uses PostgreSQL's DOUBLE PRECISION, otherwise the generic Float.
+    """
+
+    impl = Float
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.DOUBLE_PRECISION())
+        return dialect.type_descriptor(Float(precision=53))
+
+
+# SQLite only assigns ids automatically to INTEGER PRIMARY KEY columns.
+BigId = BigInteger().with_variant(Integer, 'sqlite')
+
+
 class Run(BASE):
     """Store a run for each executed test binary."""
 
@@ -43,14 +107,17 @@ class Run(BASE):
     command = Column(String)
     project_name = Column(String, ForeignKey("project.name"), index=True)
     experiment_name = Column(String, index=True)
-    run_group = Column(postgresql.UUID, index=True)
-    experiment_group = Column(postgresql.UUID,
+    run_group = Column(GUID(), index=True)
+    experiment_group = Column(GUID(),
                               ForeignKey("experiment.id"),
                               index=True)
     begin = Column(DateTime(timezone=False))
     end = Column(DateTime(timezone=False))
     status = Column(Enum('completed', 'running', 'failed', name="run_state"))
 
+    __table_args__ = (Index("ix_run_experiment_group_project_name",
+                            "experiment_group", "project_name"), )
+
     def __repr__(self):
         return ("<Run: {0} status={1} run={2}>").format(
             self.project_name, self.status, self.id)
@@ -61,10 +128,10 @@ class RunGroup(BASE):
 
     __tablename__ = 'rungroup'
 
-    id = Column(postgresql.UUID(as_uuid=True), primary_key=True, index=True)
+    id = Column(GUID(as_uuid=True), primary_key=True, index=True)
     project = Column(String, ForeignKey("project.name"), index=True)
     experiment = Column(
-        postgresql.UUID(as_uuid=True),
+        GUID(as_uuid=True),
         ForeignKey("experiment.id",
                    ondelete="CASCADE",
                    onupdate="CASCADE"),
@@ -82,7 +149,7 @@ class Experiment(BASE):
 
     name = Column(String)
     description = Column(String)
-    id = Column(postgresql.UUID(as_uuid=True), primary_key=True)
+    id = Column(GUID(as_uuid=True), primary_key=True)
     begin = Column(DateTime(timezone=False))
     end = Column(DateTime(timezone=False))
 
@@ -97,7 +164,7 @@ class Likwid(BASE):
 
     metric = Column(String, primary_key=True, index=True)
     region = Column(String, primary_key=True, index=True)
-    value = Column(postgresql.DOUBLE_PRECISION)
+    value = Column(Double)
     core = Column(String, primary_key=True)
     run_id = Column(Integer,
                     ForeignKey("run.id",
@@ -105,6 +172,7 @@ class Likwid(BASE):
                                ondelete="CASCADE"),
                     nullable=False,
                     primary_key=True)
+    experiment_group = Column(GUID(), nullable=False, index=True)
 
 
 class Metric(BASE):
@@ -113,13 +181,16 @@ class Metric(BASE):
     __tablename__ = 'metrics'
 
     name = Column(String, primary_key=True, index=True, nullable=False)
-    value = Column(postgresql.DOUBLE_PRECISION)
+    value = Column(Double)
     run_id = Column(Integer,
                     ForeignKey("run.id",
                                onupdate="CASCADE",
                                ondelete="CASCADE"),
                     index=True,
                     primary_key=True)
+    experiment_group = Column(GUID(), nullable=False, index=True)
+
+    __table_args__ = (Index("ix_metrics_run_id_name", "run_id", "name"), )
 
     def __repr__(self):
         return "{0} - {1}".format(self.name, self.value)
@@ -161,11 +232,11 @@ class Event(BASE):
     __tablename__ = 'benchbuild_events'
 
     name = Column(String, index=True)
-    start = Column(postgresql.NUMERIC, primary_key=True)
-    duration = Column(postgresql.NUMERIC)
+    start = Column(Numeric, primary_key=True)
+    duration = Column(Numeric)
     id = Column(Integer, primary_key=True)
-    type = Column(postgresql.SMALLINT)
-    tid = Column(postgresql.BIGINT)
+    type = Column(SmallInteger)
+    tid = Column(BigInteger)
     run_id = Column(Integer,
                     ForeignKey("run.id",
                                onupdate="CASCADE",
@@ -174,17 +245,35 @@ class Event(BASE):
                     index=True,
                     primary_key=True)
 
+    __table_args__ = (Index("ix_benchbuild_events_run_id_name", "run_id",
+                            "name"), )
+
+
 class PerfEvent(BASE):
     """Store PAPI profiling based events."""
 
     __tablename__ = 'benchbuild_perf_events'
 
     name = Column(String, index=True)
-    start = Column(postgresql.NUMERIC, primary_key=True)
-    duration = Column(postgresql.NUMERIC)
+    start = Column(Numeric, primary_key=True)
+    duration = Column(Numeric)
     id = Column(Integer, primary_key=True)
-    type = Column(postgresql.SMALLINT)
-    tid = Column(postgresql.BIGINT)
+    type = Column(SmallInteger)
+    tid = Column(BigInteger)
+    run_id = Column(Integer,
+                    ForeignKey("run.id",
+                               onupdate="CASCADE",
+                               ondelete="CASCADE"),
+                    nullable=False,
+                    index=True,
+                    primary_key=True)
+
+
+class EventChunk(BASE):
+    """Store region events as compressed columnar chunks."""
+
+    __tablename__ = 'benchbuild_event_chunks'
+
     run_id = Column(Integer,
                     ForeignKey("run.id",
                                onupdate="CASCADE",
@@ -192,6 +281,62 @@ class PerfEvent(BASE):
                     nullable=False,
                     index=True,
                     primary_key=True)
+    kind = Column(String, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    count = Column(Integer)
+    data = Column(LargeBinary)
+
+
+class RunSummary(BASE):
+    """
+    Store aggregated metrics of every run group.
+
+    Reports read this instead of aggregating the metrics table. It is
+    refreshed at the end of each run group, see
+    benchbuild.utils.db.refresh_run_summary.
+    """
+
+    __tablename__ = 'run_summary'
+
+    run_group = Column(GUID(), primary_key=True)
+    metric = Column(String, primary_key=True)
+    experiment_group = Column(GUID(), ForeignKey("experiment.id",
+                                                 ondelete="CASCADE"))
+    experiment_name = Column(String)
+    project_name = Column(String)
+    count = Column(Integer)
+    total = Column(Double)
+    minimum = Column(Double)
+    maximum = Column(Double)
+    mean = Column(Double)
+
+    __table_args__ = (Index("ix_run_summary_experiment_group_project_name",
+                            "experiment_group", "project_name"), )
+
+
+class StepDuration(BASE):
+    """
+    Store the duration of every step of a run group.
+
+    See benchbuild.utils.tracing. Steps are not runs, they have no row in
+    the run table.
+    """
+
+    __tablename__ = 'step_duration'
+
+    run_group = Column(GUID(), primary_key=True)
+    name = Column(String, primary_key=True)
+    begin = Column(DateTime(timezone=False), primary_key=True)
+    experiment_group = Column(GUID(), ForeignKey("experiment.id",
+                                                 ondelete="CASCADE"),
+                              nullable=False, index=True)
+    experiment_name = Column(String)
+    project_name = Column(String)
+    duration = Column(Double)
+
+    __table_args__ = (Index("ix_step_duration_experiment_name_project_name",
+                            "experiment_name", "project_name"), )
+
 
 class Project(BASE):
     """Store project metadata."""
@@ -218,15 +363,16 @@ class CompileStat(BASE):
 
     __tablename__ = 'compilestats'
 
-    id = Column(postgresql.BIGINT, primary_key=True)
+    id = Column(BigId, primary_key=True)
     name = Column(String, index=True)
     component = Column(String, index=True)
-    value = Column(postgresql.NUMERIC)
+    value = Column(Numeric)
     run_id = Column(Integer,
                     ForeignKey("run.id",
                                onupdate="CASCADE",
                                ondelete="CASCADE"),
                     index=True)
+    experiment_group = Column(GUID(), nullable=False, index=True)
 
 
 class RunLog(BASE):
@@ -245,14 +391,34 @@ class RunLog(BASE):
                                ondelete="CASCADE"),
                     index=True,
                     primary_key=True)
+    experiment_group = Column(GUID(), nullable=False, index=True)
     begin = Column(DateTime(timezone=False))
     end = Column(DateTime(timezone=False))
     status = Column(Integer)
     config = Column(String)
+    config_hash = Column(String,
+                         ForeignKey("config_blob.hash"),
+                         index=True)
     stderr = Column(String)
     stdout = Column(String)
 
 
+class ConfigBlob(BASE):
+    """
+    Store the configuration of runs, content-addressed.
+
+    Most runs of an experiment share the same configuration, RunLog only
+    references it by its hash. Keys that differ for every run, like the
+    run id, are not part of the blob. The view ``log_with_config`` joins
+    both back together.
+    """
+
+    __tablename__ = 'config_blob'
+
+    hash = Column(String, primary_key=True)
+    config = Column(String)
+
+
 class Metadata(BASE):
     """
     Store metadata information for every run.
@@ -304,7 +470,7 @@ class GlobalConfig(BASE):
     __tablename__ = 'globalconfig'
 
     experiment_group = Column(
-        postgresql.UUID(as_uuid=True),
+        GUID(as_uuid=True),
         ForeignKey("experiment.id",
                    onupdate="CASCADE",
                    ondelete="CASCADE"),
@@ -335,30 +501,232 @@ class RegressionTest(BASE):
     project_name = Column(String)
 
 
+class JournalEntry(BASE):
+    """
+    Store the ids of all journal entries we replayed.
+
+    See benchbuild.utils.journal. Replaying a journal twice skips the
+    entries that are known here. The ids are removed together with their
+    journal file.
+    """
+
+    __tablename__ = 'journal_applied'
+
+    id = Column(String, primary_key=True)
+
+
+class JournalRun(BASE):
+    """Map the local ids of journaled runs to the ids of their rows."""
+
+    __tablename__ = 'journal_run'
+
+    local_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    run_id = Column(Integer,
+                    ForeignKey("run.id",
+                               onupdate="CASCADE",
+                               ondelete="CASCADE"),
+                    index=True)
+
+
+def connect_string():
+    """Return the sqlalchemy URL of the configured database."""
+    url = CFG["db"]["connect_string"].value()
+    if url:
+        return str(url)
+    if str(CFG["db"]["dialect"]).startswith("sqlite"):
+        return "{dialect}:///{db}".format(dialect=CFG["db"]["dialect"],
+                                           db=CFG["db"]["name"])
+    return "{dialect}://{u}:{p}@{h}:{P}/{db}".format(
+        u=CFG["db"]["user"],
+        h=CFG["db"]["host"],
+        P=CFG["db"]["port"],
+        p=CFG["db"]["pass"],
+        db=CFG["db"]["name"],
+        dialect=CFG["db"]["dialect"])
+
+
+def __sqlite_pragmas(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL only syncs at checkpoints. Commits become
+        # cheap, at the risk of losing the last commits on power loss.
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url):
+    """
+    Create an engine for the database at :url:.
+
+    SQLite databases are switched to write-ahead logging and wait for
+    concurrent writers, instead of failing right away.
+
+    Args:
+        url: A sqlalchemy URL.
+
+    Returns:
+        The engine.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True)
+
+    engine = create_engine(url, connect_args={"timeout": 60})
+    event.listen(engine, "connect", __sqlite_pragmas)
+    return engine
+
+
+def schema_cache_dir():
+    """Return the directory that remembers the databases we checked."""
+    cdir = CFG["db"]["schema_cache"].value()
+    if cdir is None:
+        cdir = os.path.join(
+            os.environ.get("XDG_CACHE_HOME",
+                           os.path.join(os.path.expanduser("~"), ".cache")),
+            "benchbuild", "schema")
+    return cdir
+
+
+def __schema_marker(bind, url):
+    digest = hashlib.sha1(url.encode())
+    for table in BASE.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(
+            dialect=bind.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            digest.update(str(CreateIndex(index).compile(
+                dialect=bind.dialect)).encode())
+    digest.update(str(LOG_WITH_CONFIG).encode())
+    return os.path.join(schema_cache_dir(), digest.hexdigest())
+
+
+def ensure_schema(bind, url):
+    """
+    Create all missing tables of the schema and upgrade existing ones.
+
+    Checking the schema has to reflect every table. Wrappers start a new
+    process for every invocation. Therefore we remember each database and
+    schema we checked successfully on disk. The marker covers the DDL of
+    the whole schema, any change of the schema checks the database again.
+    We only trust a marker, if the database still has all our tables.
+
+    Args:
+        bind: The engine or connection we create the tables with.
+        url: The sqlalchemy URL of the database.
+    """
+    in_memory = url.startswith("sqlite") and url.rstrip("/").endswith(
+        ("sqlite:", ":memory:"))
+    marker = None if in_memory else __schema_marker(bind, url)
+    if marker is not None and os.path.exists(marker):
+        tables = set(sa.inspect(bind).get_table_names())
+        if tables.issuperset(BASE.metadata.tables):
+            return
+
+    BASE.metadata.create_all(bind, checkfirst=True)
+    upgrade(bind)
+    if marker is not None and not CFG["db"]["rollback"].value():
+        try:
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            open(marker, 'a').close()
+        except OSError:
+            pass
+
+
+LOG_WITH_CONFIG = sa.text(
+    'CREATE VIEW log_with_config AS '
+    'SELECT l.run_id, l."begin", l."end", l.status, '
+    'COALESCE(b.config, l.config) AS config, l.stderr, l.stdout '
+    'FROM log l LEFT OUTER JOIN config_blob b ON l.config_hash = b.hash')
+
+
+def upgrade(bind):
+    """
+    Bring the tables of an existing database up to date.
+
+    create_all only creates missing tables, this adds missing columns,
+    views and indices. It is safe to call this on an up-to-date database.
+
+    Args:
+        bind: The engine or connection we upgrade the database with.
+    """
+    inspector = sa.inspect(bind)
+    if "log" not in inspector.get_table_names():
+        return
+
+    # Add all missing columns, we only keep their foreign keys.
+    for table in BASE.metadata.sorted_tables:
+        if table.name not in inspector.get_table_names():
+            continue
+        known = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in known:
+                continue
+            ddl = "ALTER TABLE {0} ADD COLUMN {1} {2}".format(
+                table.name, column.name,
+                column.type.compile(dialect=bind.dialect))
+            for fkey in column.foreign_keys:
+                ddl += " REFERENCES {0} ({1})".format(
+                    fkey.column.table.name, fkey.column.name)
+            bind.execute(sa.text(ddl))
+
+    if "log_with_config" not in inspector.get_view_names():
+        bind.execute(LOG_WITH_CONFIG)
+
+    # create_all does not add new indices to existing tables.
+    for table in BASE.metadata.sorted_tables:
+        known = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in known:
+                index.create(bind)
+
+
 class SessionManager(object):
+    """
+    Hand out sessions of a pooled engine.
+
+    Sessions with a scope, e.g., a run group, are reused until the scope is
+    released. In test mode all sessions share a single connection, whose
+    transaction is rolled back in the end. A forked process never reuses
+    the manager of its parent.
+    """
+
     def __init__(self):
         logger = logging.getLogger(__name__)
 
+        self.pid = os.getpid()
         self.__test_mode = CFG['db']['rollback'].value()
-        self.engine = create_engine(
-            "{dialect}://{u}:{p}@{h}:{P}/{db}".format(
-                u=CFG["db"]["user"],
-                h=CFG["db"]["host"],
-                P=CFG["db"]["port"],
-                p=CFG["db"]["pass"],
-                db=CFG["db"]["name"],
-                dialect=CFG["db"]["dialect"]))
-        self.connection = self.engine.connect()
+        url = connect_string()
+        self.engine = create_db_engine(url)
+        self.connection = None
         self.__transaction = None
+        self.__scopes = {}
+        bind = self.engine
         if self.__test_mode:
             logger.warning(
                 "DB test mode active, all actions will be rolled back.")
+            self.connection = bind = self.engine.connect()
             self.__transaction = self.connection.begin()
 
-        BASE.metadata.create_all(self.connection, checkfirst=True)
+        ensure_schema(bind, url)
+        self.__sessionmaker = sessionmaker(bind=bind)
 
     def get(self):
-        return sessionmaker(bind=self.connection)
+        return self.__sessionmaker
+
+    def scoped(self, scope):
+        """Return the session of :scope:, create it if necessary."""
+        session = self.__scopes.get(scope)
+        if session is None:
+            session = self.__scopes[scope] = self.__sessionmaker()
+        elif not session.is_active:
+            session.rollback()
+        return session
+
+    def release(self, scope):
+        """Close the session of :scope:, if there is one."""
+        session = self.__scopes.pop(scope, None)
+        if session is not None:
+            session.close()
 
     def __del__(self):
         if hasattr(self, '__transaction') and self.__transaction:
@@ -369,19 +737,51 @@ def __lazy_session__():
     """Initialize the connection manager lazily."""
     connection_manager = None
 
-    def __lazy_session_wrapped():
+    stale = []
+
+    def manager(create=True):
         nonlocal connection_manager
-        if connection_manager is None:
+        if connection_manager is not None and \
+                connection_manager.pid != os.getpid():
+            # Forked: Keep the parent's connections alive, closing them
+            # would terminate them for the parent as well.
+            stale.append(connection_manager)
+            connection_manager = None
+        if connection_manager is None and create:
             connection_manager = SessionManager()
-        return connection_manager.get()()
+        return connection_manager
+
+    def __lazy_session_wrapped(scope=None):
+        """
+        Return a session of the benchbuild database.
 
+        Args:
+            scope: Reuse the session of this scope, e.g., a run group.
+                Without a scope, we return a new session.
+        """
+        if scope is None:
+            return manager().get()()
+        return manager().scoped(str(scope))
+
+    __lazy_session_wrapped.manager = manager
     return __lazy_session_wrapped
 
 Session = __lazy_session__()
 
 
+def release(scope):
+    """Close the session of :scope:, see Session."""
+    manager = Session.manager(create=False)
+    if manager is not None:
+        manager.release(str(scope))
+
+
 def init_functions(connection):
     """Initialize all SQL functions in the database."""
+    if connection.get_bind().dialect.name != 'postgresql':
+        logging.getLogger(__name__).warning(
+            "SQL functions are only available on PostgreSQL.")
+        return
     if CFG["db"]["create_functions"].value():
         print("Refreshing SQL functions...")
     for file in bbpath.template_files("../sql/", exts=[".sql"]):
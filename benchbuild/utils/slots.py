@@ -0,0 +1,134 @@
+"""
+Core-pinned measurement slots.
+
+The CPUs we are allowed to use (see ``settings.available_cpus``) are split
+into disjoint slots of equal size. A measurement acquires a free slot and
+runs pinned to its cores. This way, several single-threaded measurements
+may run side by side, without competing for the same cores.
+
+Slots are claimed with one lock file per core, so all benchbuild processes
+on the same machine agree on which cores are busy, regardless of the slot
+size they ask for.
+
+Slots are enabled with ``BB_SLOTS_ENABLE``.
+"""
+import fcntl
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchbuild.settings import CFG, available_cpus
+
+LOG = logging.getLogger(__name__)
+
+
+def split(cpus, size):
+    """
+    Split a list of CPUs into disjoint slots of the given size.
+
+    Args:
+        cpus: The list of CPU ids.
+        size: The number of CPUs per slot.
+
+    Returns:
+        A list of slots, each a tuple of CPU ids. Left-over CPUs that do not
+        fill a complete slot are not used.
+
+    Examples:
+        >>> split([0, 1, 2, 3, 4], 2)
+        [(0, 1), (2, 3)]
+        >>> split([0, 1], 4)
+        [(0, 1)]
+    """
+    cpus = sorted(cpus)
+    size = max(1, min(size, len(cpus)))
+    return [tuple(cpus[i:i + size])
+            for i in range(0, len(cpus) - size + 1, size)]
+
+
+def lock_dir():
+    """Return the directory that contains the per-core lock files."""
+    ldir = CFG["slots"]["lock_dir"].value()
+    if ldir is None:
+        ldir = os.path.join(tempfile.gettempdir(), "benchbuild-slots")
+    os.makedirs(ldir, exist_ok=True)
+    return ldir
+
+
+def __try_lock(cores):
+    """Try to lock all :cores: at once, returns the open lock files."""
+    locks = []
+    for core in cores:
+        lock_f = open(os.path.join(lock_dir(), "cpu-{0}.lock".format(core)),
+                      'w')
+        try:
+            fcntl.flock(lock_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_f.close()
+            __release(locks)
+            return None
+        locks.append(lock_f)
+    return locks
+
+
+def __release(locks):
+    for lock_f in locks:
+        fcntl.flock(lock_f, fcntl.LOCK_UN)
+        lock_f.close()
+
+
+@contextmanager
+def slot(size, poll=0.1):
+    """
+    Pin the current process to a free slot of cores.
+
+    The slot is released and the previous affinity restored on exit. All
+    child processes started inside the context inherit the affinity.
+
+    Args:
+        size: The number of cores we need.
+        poll: Seconds to wait between two attempts to find a free slot.
+
+    Yields:
+        The tuple of pinned core ids, or None if slots are disabled.
+    """
+    if not CFG["slots"]["enable"].value():
+        yield None
+        return
+
+    slots = split(available_cpus() or os.sched_getaffinity(0), int(size))
+    locks = None
+    while locks is None:
+        for cores in slots:
+            locks = __try_lock(cores)
+            if locks is not None:
+                break
+        else:
+            time.sleep(poll)
+
+    affinity = os.sched_getaffinity(0)
+    LOG.debug("Pinning measurement to cores: %s", cores)
+    os.sched_setaffinity(0, cores)
+    try:
+        yield cores
+    finally:
+        os.sched_setaffinity(0, affinity)
+        __release(locks)
+
+
+def persist(run, session, cores):
+    """
+    Persist the cores a run was pinned to.
+
+    Args:
+        run: The run we attach the config to.
+        session: The db transaction we belong to.
+        cores: The pinned cores, as yielded by :func:`slot`.
+    """
+    from benchbuild.utils.db import persist_config
+
+    if cores is not None:
+        persist_config(run, session,
+                       {"slots.cores": ",".join(str(c) for c in cores)})
@@ -0,0 +1,138 @@
+"""
+Statistics helpers for repeated measurements.
+
+We only need a handful of descriptive statistics and the confidence interval
+of the mean. The quantiles of Student's t-distribution are taken from a
+table, so we do not have to depend on scipy.
+"""
+import math
+
+# Two-sided quantiles of Student's t-distribution for 1..30 degrees of
+# freedom. Beyond that we use the quantiles of the normal distribution.
+__T_TABLE = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833,
+           1.812, 1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734,
+           1.729, 1.725, 1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703,
+           1.701, 1.699, 1.697],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+           2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+           2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+           2.048, 2.045, 2.042],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250,
+           3.169, 3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878,
+           2.861, 2.845, 2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771,
+           2.763, 2.756, 2.750]
+}
+__Z_TABLE = {0.90: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+
+def t_quantile(confidence, dof):
+    """
+    Two-sided quantile of Student's t-distribution.
+
+    Args:
+        confidence (float): The confidence level, one of 0.90, 0.95 or 0.99.
+        dof (int): The degrees of freedom.
+
+    Returns:
+        The quantile t, such that P(-t < T < t) = confidence.
+
+    Examples:
+        >>> t_quantile(0.95, 4)
+        2.776
+        >>> t_quantile(0.95, 100)
+        1.96
+    """
+    if confidence not in __T_TABLE:
+        raise ValueError("Unsupported confidence level: {0}".format(
+            confidence))
+    if dof < 1:
+        raise ValueError("We need at least one degree of freedom.")
+    table = __T_TABLE[confidence]
+    if dof <= len(table):
+        return table[dof - 1]
+    return __Z_TABLE[confidence]
+
+
+def mean(samples):
+    """Arithmetic mean of :samples:."""
+    return sum(samples) / len(samples)
+
+
+def stddev(samples):
+    """Sample standard deviation of :samples:."""
+    if len(samples) < 2:
+        return 0.0
+    avg = mean(samples)
+    return math.sqrt(
+        sum((x - avg) ** 2 for x in samples) / (len(samples) - 1))
+
+
+def ci_halfwidth(samples, confidence=0.95):
+    """
+    Half-width of the confidence interval of the mean of :samples:.
+
+    Args:
+        samples: A list of at least 2 samples.
+        confidence: The confidence level.
+
+    Returns:
+        The half-width of the confidence interval, or infinity, if there
+        are not enough samples.
+
+    Examples:
+        >>> round(ci_halfwidth([1.0, 2.0, 3.0]), 3)
+        2.484
+    """
+    if len(samples) < 2:
+        return float("inf")
+    return t_quantile(confidence, len(samples) - 1) * \
+        stddev(samples) / math.sqrt(len(samples))
+
+
+def summary(samples, confidence=0.95):
+    """
+    Summarize a list of samples.
+
+    Args:
+        samples: The samples we summarize.
+        confidence: The confidence level of the interval.
+
+    Returns:
+        A dictionary with the mean, the standard deviation, the half-width
+        of the confidence interval, its width relative to the mean and the
+        number of samples.
+    """
+    avg = mean(samples)
+    halfwidth = ci_halfwidth(samples, confidence)
+    return {
+        "mean": avg,
+        "stddev": stddev(samples),
+        "ci": halfwidth,
+        "ci_rel": halfwidth / avg if avg else float("inf"),
+        "n": len(samples)
+    }
+
+
+def converged(samples, rel_width, confidence=0.95):
+    """
+    Check, if the confidence interval of the mean is narrow enough.
+
+    Args:
+        samples: The samples we have so far.
+        rel_width: The target width of the confidence interval, relative to
+            the mean.
+        confidence: The confidence level of the interval.
+
+    Returns:
+        True, if the full width of the confidence interval is at most
+        :rel_width: times the mean.
+
+    Examples:
+        >>> converged([1.0, 1.01, 0.99, 1.0], 0.05)
+        True
+        >>> converged([1.0, 2.0, 3.0], 0.05)
+        False
+    """
+    stats = summary(samples, confidence)
+    return 2 * stats["ci_rel"] <= rel_width
@@ -0,0 +1,173 @@
+"""
+Tracing of steps, wrappers and runtime extensions.
+
+With ``BB_TRACE_ENABLE`` every step, every invocation of a compiler or run
+wrapper and every tracked execution of a binary is recorded as a span with
+its start, duration, process id and the project/experiment it belongs to.
+
+Each process appends its spans to its own file under
+``<build_dir>/.trace/<experiment_id>``. At the end of an experiment all
+files are merged into a single ``trace.json`` in the Chrome trace event
+format, which can be loaded into chrome://tracing or Perfetto.
+
+With ``BB_TRACE_METRICS`` the duration of each project step is stored in
+the database as well, in the table step_duration.
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from benchbuild.settings import CFG
+
+LOG = logging.getLogger(__name__)
+
+# Process ids for which we already wrote the process name.
+__NAMED = set()
+
+
+def trace_dir():
+    """Return the directory that contains all trace files."""
+    tdir = CFG["trace"]["dir"].value()
+    if tdir is None:
+        tdir = os.path.join(str(CFG["build_dir"]), ".trace",
+                            str(CFG["experiment_id"]))
+    return tdir
+
+
+def __write(events):
+    pid = os.getpid()
+    if pid not in __NAMED:
+        __NAMED.add(pid)
+        events = [{
+            "name": "process_name", "ph": "M", "pid": pid,
+            "args": {"name": os.path.basename(sys.argv[0] or "python")}
+        }] + events
+
+    tdir = trace_dir()
+    os.makedirs(tdir, exist_ok=True)
+    with open(os.path.join(tdir, "{0}.jsonl".format(pid)), 'a') as trace_f:
+        for event in events:
+            trace_f.write(json.dumps(event) + "\n")
+
+
+@contextmanager
+def span(name, cat, **kwargs):
+    """
+    Record the enclosed block as a complete event.
+
+    We only check, if tracing is enabled, after the block finished. Wrappers
+    load their configuration inside the block.
+
+    Args:
+        name: The name of the span.
+        cat: The category of the span, e.g., step, wrapper or run.
+        **kwargs: Additional arguments stored with the span.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if CFG["trace"]["enable"].value():
+            kwargs = {k: str(v) for k, v in kwargs.items() if v is not None}
+            __write([{
+                "name": name, "cat": cat, "ph": "X",
+                "ts": int(start * 1e6),
+                "dur": int((time.time() - start) * 1e6),
+                "pid": os.getpid(), "tid": threading.get_ident() % (1 << 31),
+                "args": kwargs
+            }])
+
+
+def trace_step(step, name, call):
+    """
+    Trace the execution of a step.
+
+    Args:
+        step: The step we execute.
+        name: The NAME of the step.
+        call: Executes the step and returns its result.
+
+    Returns:
+        The result of the step.
+    """
+    obj = getattr(step, "_obj", None)
+    exp = getattr(obj, "experiment", obj)
+    project = obj.name if exp is not obj else None
+
+    begin = datetime.now()
+    start = time.time()
+    with span(name, "step", project=project,
+              experiment=getattr(exp, "name", None)):
+        result = call()
+
+    if project is not None and CFG["trace"]["enable"].value() and \
+            CFG["trace"]["metrics"].value():
+        persist_duration(obj, name, begin, time.time() - start)
+    return result
+
+
+def persist_duration(project, name, begin, duration):
+    """
+    Store the duration of a step in the run group of its project.
+
+    Args:
+        project: The project the step worked on.
+        name: The NAME of the step.
+        begin: When the step began.
+        duration: The duration of the step in seconds.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    from benchbuild.utils import dbwriter
+    from benchbuild.utils.schema import Session, StepDuration
+
+    values = {
+        "run_group": str(project.run_uuid),
+        "name": name,
+        "begin": begin,
+        "experiment_group": str(CFG["experiment_id"]),
+        "experiment_name": project.experiment.name,
+        "project_name": project.name,
+        "duration": duration
+    }
+    writer = dbwriter.get()
+    if writer is not None:
+        writer.put(("insert", StepDuration.__tablename__, [values]))
+        return
+
+    session = None
+    try:
+        session = Session()
+        session.execute(StepDuration.__table__.insert(), [values])
+        session.commit()
+    except SQLAlchemyError as ex:
+        if session is not None:
+            session.rollback()
+        LOG.warning("Could not store the duration of %s: %s", name, ex)
+
+
+def merge():
+    """
+    Merge the spans of all processes into a Chrome trace.
+
+    Returns:
+        The path of the merged trace, or None if there is nothing to merge.
+    """
+    tdir = trace_dir()
+    events = []
+    for trace_f in sorted(glob.glob(os.path.join(tdir, "*.jsonl"))):
+        with open(trace_f) as spans:
+            events.extend(json.loads(l) for l in spans if l.strip())
+    if not events:
+        return None
+
+    path = os.path.join(tdir, "trace.json")
+    with open(path, 'w') as trace_f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_f)
+    LOG.info("Trace written to %s", path)
+    return path
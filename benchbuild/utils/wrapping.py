@@ -1,14 +1,20 @@
 import dill
+import logging
 import os
 import sys
 from plumbum import local
 from benchbuild.settings import CFG
 from benchbuild.utils.cmd import mv, chmod, rm
+from benchbuild.utils import blobs, runtime
 from benchbuild.utils.path import list_to_path, template_str
 from benchbuild.utils.run import run, uchroot_no_llvm as uchroot
 
+LOG = logging.getLogger(__name__)
+
 PROJECT_BIN_F_EXT = ".bin"
 PROJECT_BLOB_F_EXT = ".postproc"
+PROJECT_WRAPPER_F_EXT = ".wrapper"
+PROJECT_CONFIG_F_EXT = ".config.json"
 
 
 def strip_path_prefix(ipath, prefix):
@@ -36,6 +42,25 @@ def strip_path_prefix(ipath, prefix):
     return ipath[len(prefix):] if ipath.startswith(prefix) else ipath
 
 
+def __store_runner(name_absolute, runner, sprefix):
+    """
+    Store the runner of the wrapped binary :name_absolute:.
+
+    Runners go to the blob store (see benchbuild.utils.blobs). Wrappers
+    inside a chroot cannot reach it, they get a blob of their own.
+
+    Returns:
+        The path of the runner's blob.
+    """
+    if not sprefix:
+        return blobs.store(runner)
+
+    blob_f = name_absolute + PROJECT_BLOB_F_EXT
+    with open(blob_f, 'wb') as blob:
+        dill.dump(runner, blob, protocol=-1, recurse=True)
+    return blob_f
+
+
 def wrap(name, runner, sprefix=None, **template_vars):
     """ Wrap the binary :name: with the function :runner:.
 
@@ -45,6 +70,13 @@ def wrap(name, runner, sprefix=None, **template_vars):
     perform the serialization, make sure :runner: can be serialized
     with it and you're fine.
 
+    The wrapper loads a frozen snapshot of our current configuration (see
+    benchbuild.utils.runtime), it does not read the config file.
+
+    With BB_WRAPPER_DAEMON, :name: becomes a thin client of the wrapper
+    server (see benchbuild.utils.wrapserver) and the python tool is kept
+    as fallback. Wrappers inside a chroot cannot reach the server.
+
     Args:
         name: Binary we want to wrap
         runner: Function that should run instead of :name:
@@ -60,9 +92,10 @@ def wrap(name, runner, sprefix=None, **template_vars):
     else:
         run(mv[name_absolute, real_f])
 
-    blob_f = name_absolute + PROJECT_BLOB_F_EXT
-    with open(blob_f, 'wb') as blob:
-        dill.dump(runner, blob, protocol=-1, recurse=True)
+    blob_f = __store_runner(name_absolute, runner, sprefix)
+
+    config_f = name_absolute + PROJECT_CONFIG_F_EXT
+    runtime.store(config_f, CFG)
 
     bin_path = list_to_path(CFG["env"]["binary_path"].value())
     bin_path = list_to_path([bin_path, os.environ["PATH"]])
@@ -70,24 +103,42 @@ def wrap(name, runner, sprefix=None, **template_vars):
     bin_lib_path = list_to_path(CFG["env"]["binary_ld_library_path"].value())
     bin_lib_path = list_to_path([bin_lib_path, os.environ["LD_LIBRARY_PATH"]])
 
-    template_vars['db_host'] = str(CFG["db"]["host"])
-    template_vars['db_name'] = str(CFG["db"]["name"])
-    template_vars['db_port'] = str(CFG["db"]["port"])
-    template_vars['db_pass'] = str(CFG["db"]["pass"])
-    template_vars['db_user'] = str(CFG["db"]["user"])
     template_vars['path'] = bin_path
     template_vars['ld_lib_path'] = bin_lib_path
     template_vars['blobf'] = strip_path_prefix(blob_f, sprefix)
     template_vars['runf'] = strip_path_prefix(real_f, sprefix)
-
+    template_vars['configf'] = strip_path_prefix(config_f, sprefix)
+
+    daemon = CFG["wrapper"]["daemon"].value() and not sprefix and \
+        'python' not in template_vars
+    if daemon:
+        from benchbuild.utils import wrapserver
+        try:
+            template_vars['socket'] = wrapserver.socket_path()
+        except OSError as ex:
+            LOG.warning("Not using the wrapper server: %s", ex)
+            daemon = False
     if 'python' not in template_vars:
         template_vars['python'] = sys.executable
 
-    with open(name_absolute, 'w') as wrapper:
+    wrapper_f = name_absolute
+    if daemon:
+        wrapper_f = name_absolute + PROJECT_WRAPPER_F_EXT
+    with open(wrapper_f, 'w') as wrapper:
         lines = template_str("templates/run_static.py.inc")
         lines = lines.format(**template_vars)
         wrapper.write(lines)
-    run(chmod["+x", name_absolute])
+    run(chmod["+x", wrapper_f])
+
+    if daemon:
+        template_vars['idle'] = str(CFG["wrapper"]["idle"].value())
+        template_vars['fallback'] = wrapper_f
+        with open(name_absolute, 'w') as wrapper:
+            lines = template_str("templates/run_client.py.inc")
+            lines = lines.format(**template_vars)
+            wrapper.write(lines)
+        run(chmod["+x", name_absolute])
+        wrapserver.ensure_server(template_vars['socket'])
     return local[name_absolute]
 
 
@@ -98,25 +149,22 @@ def wrap_dynamic(self, name, runner, sprefix=None, **template_vars):
     This module generates a python tool :name: that can replace
     a yet unspecified binary.
     It behaves similar to the :wrap: function. However, the first
-    argument is the actual binary name.
+    argument is the actual binary name. The runner gets the name of that
+    binary as keyword argument project_name.
 
     Args:
         name: name of the python module
         runner: Function that should run the real binary
-        base_class: The base_class of our project.
-        base_module: The module of base_class.
 
     Returns: plumbum command, readty to launch.
 
     """
-    base_class = self.__class__.__name__
-    base_module = self.__module__
-
     name_absolute = os.path.abspath(name)
-    blob_f = name_absolute + PROJECT_BLOB_F_EXT
+    blob_f = __store_runner(name_absolute, runner, sprefix)
     real_f = name_absolute + PROJECT_BIN_F_EXT
-    with open(blob_f, 'wb') as blob:
-        blob.write(dill.dumps(runner))
+
+    config_f = name_absolute + PROJECT_CONFIG_F_EXT
+    runtime.store(config_f, CFG)
 
     bin_path = list_to_path(CFG["env"]["binary_path"].value())
     bin_path = list_to_path([bin_path, os.environ["PATH"]])
@@ -126,17 +174,11 @@ def wrap_dynamic(self, name, runner, sprefix=None, **template_vars):
     bin_lib_path = list_to_path([bin_lib_path, os.environ[
         "LD_LIBRARY_PATH"]])
 
-    template_vars['db_host'] = str(CFG["db"]["host"])
-    template_vars['db_name'] = str(CFG["db"]["name"])
-    template_vars['db_port'] = str(CFG["db"]["port"])
-    template_vars['db_pass'] = str(CFG["db"]["pass"])
-    template_vars['db_user'] = str(CFG["db"]["user"])
     template_vars['path'] = bin_path
     template_vars['ld_lib_path'] = bin_lib_path
     template_vars['blobf'] = strip_path_prefix(blob_f, sprefix)
     template_vars['runf'] = strip_path_prefix(real_f, sprefix)
-    template_vars['base_class'] = base_class
-    template_vars['base_module'] = base_module
+    template_vars['configf'] = strip_path_prefix(config_f, sprefix)
 
     if 'python' not in template_vars:
         template_vars['python'] = sys.executable
@@ -156,6 +198,9 @@ def wrap_cc(filepath, cflags, ldflags, compiler, extension,
 
     This will generate a wrapper script in the current directory
     and return a complete plumbum command to it.
+    Like wrap, the script loads a frozen snapshot of our configuration. The
+    compiler is stored as plain command line (see runtime.store_command),
+    the script imports plumbum only to hand it to :extension:.
 
     Args:
         filepath (str): Path to the wrapper script.
@@ -174,10 +219,9 @@ def wrap_cc(filepath, cflags, ldflags, compiler, extension,
         Command of the new compiler we can call.
     """
     cc_f = os.path.abspath(filepath + ".benchbuild.cc")
-    with open(cc_f, 'wb') as cc:
-        cc.write(dill.dumps(compiler()))
-        if compiler_ext_name is not None:
-            cc_f = compiler_ext_name(".benchbuild.cc")
+    runtime.store_command(cc_f, compiler())
+    if compiler_ext_name is not None:
+        cc_f = compiler_ext_name(".benchbuild.cc")
 
     blob_f = os.path.abspath(filepath + PROJECT_BLOB_F_EXT)
     if extension is not None:
@@ -186,17 +230,17 @@ def wrap_cc(filepath, cflags, ldflags, compiler, extension,
         if compiler_ext_name is not None:
             blob_f = compiler_ext_name(PROJECT_BLOB_F_EXT)
 
+    config_f = os.path.abspath(filepath + PROJECT_CONFIG_F_EXT)
+    runtime.store(config_f, CFG)
+    if compiler_ext_name is not None:
+        config_f = compiler_ext_name(PROJECT_CONFIG_F_EXT)
+
     # Update LDFLAGS with configure compiler_ld_library_path. This way
     # the libraries found in LD_LIBRARY_PATH are available at link-time too.
     lib_path_list = CFG["env"]["compiler_ld_library_path"].value()
     ldflags = ldflags + ["-L" + pelem for pelem in lib_path_list if pelem]
 
-    template_vars['db_host'] = str(CFG["db"]["host"])
-    template_vars['db_name'] = str(CFG["db"]["name"])
-    template_vars['db_port'] = str(CFG["db"]["port"])
-    template_vars['db_pass'] = str(CFG["db"]["pass"])
-    template_vars['db_user'] = str(CFG["db"]["user"])
-    template_vars['CFG_FILE'] = CFG["config_file"].value()
+    template_vars['CFG_SNAPSHOT'] = config_f
     template_vars['CC_F'] = cc_f
     template_vars['CFLAGS'] = cflags
     template_vars['LDFLAGS'] = ldflags
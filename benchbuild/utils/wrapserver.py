@@ -0,0 +1,474 @@
+"""
+Long-lived server for wrapped binaries.
+
+Every binary wrapped by benchbuild.utils.wrapping.wrap is a python script.
+Starting it imports benchbuild, plumbum and dill and unpickles the runner,
+on every single call. With ``BB_WRAPPER_DAEMON`` the wrapped binary becomes
+a thin client, that only needs python's standard library. It forwards its
+arguments, environment, working directory and stdio file descriptors to
+this server via a UNIX socket.
+
+The server keeps all modules imported and all runners unpickled. It forks
+a child for every request, which adopts the client's environment, stdio,
+CPU affinity and resource limits. The child activates the configuration
+snapshot of the wrapper (see benchbuild.utils.runtime) and calls the runner
+in a process group of its own. The exit status is sent back to the client.
+Database connections are opened by the children, pooled connections must
+not cross a fork.
+
+The socket lives in a directory only we may access, either below
+``XDG_RUNTIME_DIR`` or in the temporary directory. Both sides check that
+their peer belongs to the same user, before they send anything.
+
+The client forwards SIGINT, SIGTERM and SIGHUP to the server, which sends
+them to the child's process group. If the client goes away, the child's
+process group is killed.
+
+The server is started on demand and exits after ``BB_WRAPPER_IDLE``
+seconds without requests. If the client cannot reach it, the client starts
+a new server in the background and falls back to the regular wrapper
+script. A lock file next to the socket ensures that only one server runs.
+"""
+import array
+import fcntl
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+LOG = logging.getLogger(__name__)
+
+# The client template (templates/run_client.py.inc) mirrors this protocol:
+# A length-prefixed JSON request, with the stdio descriptors attached, and
+# a signed exit status as reply. Until the reply, the client may send
+# signal numbers, in the format of the exit status.
+HEADER = struct.Struct("!I")
+STATUS = struct.Struct("!i")
+MAX_FDS = 3
+# The resource limits a client passes on to its runner.
+RLIMITS = ("RLIMIT_CPU", "RLIMIT_AS", "RLIMIT_DATA", "RLIMIT_STACK",
+           "RLIMIT_FSIZE", "RLIMIT_NOFILE", "RLIMIT_CORE")
+PEERCRED = struct.Struct("3i")
+
+
+def private_dir():
+    """
+    Return a directory for the socket, that only we may access.
+
+    Raises:
+        OSError: If the directory belongs to someone else, or others may
+            access it.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base and os.path.isdir(base):
+        path = os.path.join(base, "benchbuild")
+    else:
+        path = os.path.join(tempfile.gettempdir(),
+                            "benchbuild-{0}".format(os.getuid()))
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            info.st_mode & 0o077:
+        raise OSError("{0} is not a private directory.".format(path))
+    return path
+
+
+def socket_path():
+    """Return the path of the wrapper server's socket."""
+    from benchbuild.settings import CFG
+
+    path = CFG["wrapper"]["socket"].value()
+    if not path:
+        path = os.path.join(private_dir(), "wrapper.sock")
+    return path
+
+
+def peer_uid(sock):
+    """Return the uid of the process on the other end of :sock:."""
+    _, uid, _ = PEERCRED.unpack(sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, PEERCRED.size))
+    return uid
+
+
+def send_request(sock, request, fds):
+    """Send a request and the file descriptors :fds: to the server."""
+    payload = json.dumps(request).encode()
+    sock.sendmsg([HEADER.pack(len(payload)) + payload],
+                 [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                   array.array("i", fds))])
+
+
+def __recv_exactly(sock, size, data=b""):
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection closed by the client.")
+        data += chunk
+    return data
+
+
+def recv_request(sock):
+    """
+    Receive a request of a client.
+
+    Returns:
+        A tuple (request, fds) of the decoded request and the list of file
+        descriptors we received.
+    """
+    fds = array.array("i")
+    data, ancdata, _, _ = sock.recvmsg(
+        4096, socket.CMSG_SPACE(MAX_FDS * fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - len(cdata) % fds.itemsize])
+
+    data = __recv_exactly(sock, HEADER.size, data)
+    size, = HEADER.unpack_from(data)
+    data = __recv_exactly(sock, HEADER.size + size, data)
+    return json.loads(data[HEADER.size:].decode()), list(fds)
+
+
+def recv_signal(sock):
+    """
+    Receive a signal number the client forwards.
+
+    Returns:
+        The signal number, or None if the client closed the connection.
+    """
+    try:
+        data = __recv_exactly(sock, STATUS.size)
+    except (OSError, EOFError):
+        return None
+    return STATUS.unpack(data)[0]
+
+
+def lock(path):
+    """
+    Take the lock of the wrapper server at :path:.
+
+    Returns:
+        The open lock file, or None if another server holds the lock.
+    """
+    lock_f = open(path + ".lock", "a")
+    try:
+        fcntl.flock(lock_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_f.close()
+        return None
+    return lock_f
+
+
+def connect(path):
+    """
+    Return a socket connected to the server at :path:, or None.
+
+    Servers of other users are ignored.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        if os.stat(path).st_uid == os.getuid() and \
+                peer_uid(sock) == os.getuid():
+            return sock
+        LOG.warning("The wrapper server at %s belongs to someone else.",
+                    path)
+    except OSError:
+        pass
+    sock.close()
+    return None
+
+
+def ensure_server(path, timeout=10):
+    """
+    Start a wrapper server at :path:, unless there is one already.
+
+    Returns:
+        True, if the server accepts connections.
+    """
+    from benchbuild.settings import CFG
+
+    sock = connect(path)
+    if sock is None:
+        subprocess.Popen(
+            [sys.executable, "-m", __name__, path,
+             str(CFG["wrapper"]["idle"].value())],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True)
+        deadline = time.time() + timeout
+        while sock is None and time.time() < deadline:
+            time.sleep(0.05)
+            sock = connect(path)
+    if sock is None:
+        LOG.warning("Could not start the wrapper server at %s.", path)
+        return False
+    sock.close()
+    return True
+
+
+def apply_limits(request):
+    """Adopt the CPU affinity and the resource limits of the client."""
+    import resource
+
+    os.sched_setaffinity(0, request["affinity"])
+    for name, limit in request["rlimits"].items():
+        try:
+            resource.setrlimit(getattr(resource, name), tuple(limit))
+        except (AttributeError, ValueError, OSError) as ex:
+            LOG.warning("Could not set %s to %s: %s", name, limit, ex)
+
+
+def run_request(request, runner):
+    """
+    Run a wrapped binary inside the calling process, like the regular
+    wrapper script (templates/run_static.py.inc) does.
+
+    Args:
+        request: The request of the client.
+        runner: The unpickled runner of the binary.
+
+    Returns:
+        The exit status of the runner.
+    """
+    from plumbum import local
+    from benchbuild import settings
+    from benchbuild.utils import runtime, tracing
+
+    apply_limits(request)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    local.env.clear()
+    local.env.update(**request["env"])
+    # The server's configuration belongs to whoever started it.
+    settings.CFG.init_from_snapshot(runtime.activate(request["configf"]))
+
+    run_f = request["runf"]
+    args = request["args"]
+    with local.env(PATH=request["path"],
+                   LD_LIBRARY_PATH=request["ld_lib_path"],
+                   BB_CMD=run_f + " ".join(args)), \
+            tracing.span(os.path.basename(run_f), "wrapper"):
+        with tracing.span("runtime extension", "extension"):
+            run_info = runner(run_f, args,
+                              has_stdin=request["has_stdin"],
+                              has_stdout=request["has_stdout"])
+    return run_info.retcode
+
+
+class WrapperServer(object):
+    """Serve the requests of wrapped binaries, see the module docs."""
+
+    def __init__(self, path, idle=600):
+        self.path = path
+        self.idle = idle
+        self.children = 0
+        self._runners = {}
+        self._lock = threading.Lock()
+        self._lock_f = None
+
+    def lock(self):
+        """
+        Take the lock of our socket.
+
+        Returns:
+            True, if no other server holds it.
+        """
+        if self._lock_f is None:
+            self._lock_f = lock(self.path)
+        return self._lock_f is not None
+
+    def runner(self, blob_f):
+        """Return the unpickled runner of :blob_f:, None if it is missing."""
+        import dill
+
+        try:
+            mtime = os.stat(blob_f).st_mtime
+        except FileNotFoundError:
+            return None
+        cached = self._runners.get(blob_f)
+        if cached is None or cached[0] != mtime:
+            with open(blob_f, "rb") as blob:
+                cached = self._runners[blob_f] = (mtime, dill.load(blob))
+        return cached[1]
+
+    def serve_forever(self):
+        """Accept requests until we are idle for too long."""
+        if not self.lock():
+            LOG.info("A wrapper server runs at %s already.", self.path)
+            return
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        listener.listen(64)
+        listener.settimeout(self.idle)
+        try:
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    if self.children:
+                        continue
+                    break
+                conn.settimeout(None)
+                self.handle(listener, conn)
+        finally:
+            listener.close()
+            os.unlink(self.path)
+
+    def handle(self, listener, conn):
+        """Fork a child for the request on :conn:."""
+        try:
+            if peer_uid(conn) != os.getuid():
+                LOG.warning("Rejected a client of another user.")
+                conn.close()
+                return
+            request, fds = recv_request(conn)
+        except (OSError, EOFError, ValueError):
+            LOG.exception("Could not receive a request.")
+            conn.close()
+            return
+
+        runner, error = None, None
+        try:
+            runner = self.runner(request["blobf"])
+        except Exception:  # pylint: disable=broad-except
+            error = traceback.format_exc()
+
+        pid = os.fork()
+        if pid == 0:
+            listener.close()
+            self.__child(conn, request, fds, runner, error)
+
+        try:
+            # Also in the child, we might signal the group before it runs.
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        for fd in fds:
+            os.close(fd)
+        with self._lock:
+            self.children += 1
+        reaping = threading.Lock()
+        threading.Thread(target=self.__reap, args=(pid, conn, reaping),
+                         daemon=True).start()
+        threading.Thread(target=self.__forward, args=(pid, conn, reaping),
+                         daemon=True).start()
+
+    def __child(self, conn, request, fds, runner, error):
+        status = 1
+        try:
+            os.setpgid(0, 0)
+            if self._lock_f is not None:
+                self._lock_f.close()
+            conn.close()
+            for target, fd in enumerate(fds[:MAX_FDS]):
+                os.dup2(fd, target)
+            for fd in fds:
+                if fd >= MAX_FDS:
+                    os.close(fd)
+            if error is not None:
+                sys.stderr.write(error)
+            elif runner is None:
+                # The regular wrapper does nothing without a runner.
+                status = 0
+            else:
+                status = run_request(request, runner)
+        except SystemExit as ex:
+            status = ex.code if isinstance(ex.code, int) else \
+                int(ex.code is not None)
+        except BaseException:  # pylint: disable=broad-except
+            traceback.print_exc()
+        finally:
+            from benchbuild.utils import dbwriter
+            try:
+                dbwriter.flush()
+            except dbwriter.WriteError as ex:
+                LOG.error(str(ex))
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+    def __reap(self, pid, conn, reaping):
+        # Wait without reaping, the pid must not be reused while
+        # __forward might still signal it.
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        with reaping:
+            _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status):
+            status = os.WEXITSTATUS(status)
+        else:
+            status = 128 + os.WTERMSIG(status)
+        try:
+            conn.sendall(STATUS.pack(status))
+        except OSError:
+            pass
+        finally:
+            try:
+                # Wakes up __forward.
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+            with self._lock:
+                self.children -= 1
+
+    @staticmethod
+    def __forward(pid, conn, reaping):
+        """Forward the client's signals to the child's process group."""
+        while True:
+            signum = recv_signal(conn)
+            if signum is None:
+                # The client is gone, so is the child.
+                signum = signal.SIGKILL
+            with reaping:
+                try:
+                    if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG |
+                                 os.WNOWAIT) is not None:
+                        return
+                    os.killpg(pid, signum)
+                except (ChildProcessError, ProcessLookupError):
+                    return
+            if signum == signal.SIGKILL:
+                return
+
+
+def main(argv=None):
+    """Run a wrapper server: wrapserver <socket> [idle seconds]"""
+    from benchbuild.utils import log
+
+    argv = sys.argv[1:] if argv is None else argv
+    idle = float(argv[1]) if len(argv) > 1 else 600
+    server = WrapperServer(argv[0], idle)
+    if not server.lock():
+        # Started by several clients at once.
+        return
+
+    log.configure()
+    log.set_defaults()
+    # Import everything a runner needs once, every child inherits it.
+    import benchbuild.utils.db  # pylint: disable=unused-variable
+    import benchbuild.utils.run  # pylint: disable=unused-variable
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
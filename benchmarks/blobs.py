@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Compare per-binary dill blobs with the blob store of wrapped binaries.
+
+This builds the runners of the raw experiment for a number of projects,
+like RawRuntime.actions_for_project does, and serializes one runner per
+wrapped binary:
+    dill    One dill.dump(runner, recurse=True) per binary, as wrap did.
+    store   benchbuild.utils.blobs.store, see its documentation.
+
+Afterwards, one blob of each kind is loaded in a fresh interpreter.
+
+Usage:
+    python benchmarks/blobs.py [projects] [binaries per project]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+LOAD = """
+import sys, time
+from benchbuild.utils import runtime
+start = time.perf_counter()
+runner = runtime.load_blob(sys.argv[1])
+loaded = time.perf_counter()
+getattr(runner, "runner", lambda: runner)()
+print(loaded - start, time.perf_counter() - start)
+"""
+
+
+def runners(num_projects):
+    from benchbuild.experiments.raw import RawRuntime, run_with_time
+    from benchbuild.settings import CFG
+
+    experiment = RawRuntime()
+    result = []
+    for name in sorted(experiment.projects)[:num_projects]:
+        project = experiment.projects[name](experiment)
+        project.runtime_extension = partial(run_with_time, project,
+                                            experiment, CFG, 1)
+        result.append(project.runtime_extension)
+    return result
+
+
+def store_size(directory):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(directory) for f in files)
+
+
+def load(path):
+    out = subprocess.check_output([sys.executable, "-c", LOAD, path],
+                                  stderr=subprocess.DEVNULL)
+    return [float(t) * 1000 for t in out.split()]
+
+
+def main(num_projects=20, binaries=5):
+    import dill
+    from benchbuild.utils import blobs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        all_runners = runners(num_projects)
+        legacy_dir = os.path.join(tmp, "dill")
+        os.makedirs(legacy_dir)
+        store_dir = os.path.join(tmp, "store")
+
+        start = time.perf_counter()
+        for i, runner in enumerate(all_runners):
+            for j in range(binaries):
+                blob_f = os.path.join(legacy_dir, "{0}-{1}.postproc".format(
+                    i, j))
+                with open(blob_f, 'wb') as blob:
+                    dill.dump(runner, blob, protocol=-1, recurse=True)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        specs = [blobs.store(runner, store_dir) for runner in all_runners
+                 for _ in range(binaries)]
+        store_time = time.perf_counter() - start
+
+        print("{0} projects, {1} binaries each".format(len(all_runners),
+                                                       binaries))
+        print("{0:>6}: {1:8.3f}s {2:10d} bytes {3:8d} bytes/blob".format(
+            "dill", legacy_time, store_size(legacy_dir),
+            store_size(legacy_dir) // len(specs)))
+        print("{0:>6}: {1:8.3f}s {2:10d} bytes {3:8d} bytes/spec".format(
+            "store", store_time, store_size(store_dir),
+            os.path.getsize(specs[0])))
+
+        legacy_load = load(os.path.join(legacy_dir, "0-0.postproc"))
+        store_load = load(specs[0])
+        print("load (unpickle / runner ready):")
+        print("{0:>6}: {1:8.1f}ms {2:8.1f}ms".format("dill", *legacy_load))
+        print("{0:>6}: {1:8.1f}ms {2:8.1f}ms".format("store", *store_load))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
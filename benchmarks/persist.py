@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compare per-row ORM persistence with benchbuild.utils.db.bulk_insert.
+
+This inserts a synthetic likwid measurement (cores x metrics x regions) into
+the configured database (BB_DB_*), once with one session.add() per row and
+once with bulk_insert. All rows are attached to a throwaway experiment and run,
+which are deleted afterwards.
+
+Usage:
+    python benchmarks/persist.py [cores] [metrics] [regions]
+"""
+import sys
+import time
+import uuid
+
+from benchbuild.utils import schema as s
+from benchbuild.utils.db import bulk_insert
+
+
+def measurements(cores, metrics, regions):
+    return [("region-{0}".format(r), "metric-{0}".format(m),
+             "core-{0}".format(c), float(c * m + r))
+            for r in range(regions) for m in range(metrics)
+            for c in range(cores)]
+
+
+def orm(session, run, rows):
+    for (region, name, core, value) in rows:
+        session.add(s.Likwid(metric=name, region=region, value=value,
+                             core=core, run_id=run.id,
+                             experiment_group=run.experiment_group))
+    session.commit()
+
+
+def bulk(session, run, rows):
+    bulk_insert(session, s.Likwid,
+                ["metric", "region", "value", "core", "run_id",
+                 "experiment_group"],
+                ((name, region, value, core, run.id, run.experiment_group)
+                 for (region, name, core, value) in rows))
+    session.commit()
+
+
+def main(cores=64, metrics=20, regions=10):
+    rows = measurements(cores, metrics, regions)
+    session = s.Session()
+    print("{0} rows per run".format(len(rows)))
+
+    experiment = s.Experiment(name="benchmarks/persist.py", id=uuid.uuid4())
+    session.add(experiment)
+    session.commit()
+    for name, persist in [("orm", orm), ("bulk", bulk)]:
+        run = s.Run(command="benchmarks/persist.py",
+                    experiment_group=experiment.id)
+        session.add(run)
+        session.commit()
+        start = time.perf_counter()
+        persist(session, run, rows)
+        duration = time.perf_counter() - start
+        print("{0:>5}: {1:8.3f}s {2:10.0f} rows/s".format(
+            name, duration, len(rows) / duration))
+        # SQLite does not cascade without PRAGMA foreign_keys.
+        session.query(s.Likwid).filter(s.Likwid.run_id == run.id).delete()
+        session.delete(run)
+        session.commit()
+    session.delete(experiment)
+    session.commit()
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
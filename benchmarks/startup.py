@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure the cold start of generated run wrappers.
+
+This wraps a copy of /bin/true with benchbuild.utils.wrapping.wrap and
+compares the wall time of a call with:
+    python        The bare interpreter, it runs the binary like the
+                  runner does.
+    legacy        The imports and setup every wrapper did before the
+                  configuration snapshot (settings, plumbum, dill, logging).
+    wrapper       The wrapper, its runner is pickled by reference.
+    wrapper+dill  The wrapper, its runner is pickled by value, which needs
+                  dill to load.
+
+The overhead of a wrapper is its time minus the time of the bare
+interpreter. The target of TARGET_MS applies to the median overhead of the
+wrapper with a runner pickled by reference, which is how the runners of our
+experiments are stored. Single calls may take longer on a busy machine.
+Runners pickled by value have to import dill and usually miss the target.
+
+Usage:
+    python benchmarks/startup.py [calls]
+"""
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+DIRECT = """
+import subprocess, sys
+subprocess.call(sys.argv[1:])
+"""
+LEGACY = """
+import dill
+from benchbuild.utils import log, tracing
+from benchbuild import settings
+from plumbum import local
+settings.update_env()
+log.configure()
+log.set_defaults()
+"""
+
+TARGET_MS = 50
+
+
+def exec_runner(run_f, args, has_stdin=False, has_stdout=False):
+    return SimpleNamespace(retcode=subprocess.call([run_f] + args))
+
+
+def by_value():
+    # Nested, so dill pickles it by value.
+    def runner(run_f, args, has_stdin=False, has_stdout=False):
+        return SimpleNamespace(retcode=subprocess.call([run_f] + args))
+    return runner
+
+
+def measure(cmd, env, calls):
+    import statistics
+
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, check=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def main(calls=20):
+    # Keep this module light, the wrappers import it.
+    import shutil
+    import tempfile
+    import benchbuild
+    # Import ourselves by name, so dill pickles exec_runner by reference.
+    import startup
+    from benchbuild.settings import CFG
+    from benchbuild.utils.wrapping import wrap
+
+    root = os.path.dirname(os.path.dirname(benchbuild.__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [root, os.path.dirname(os.path.abspath(__file__))]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        CFG["wrapper"]["blob_dir"] = os.path.join(tmp, "blobs")
+        true = os.path.join(tmp, "true")
+        shutil.copy("/bin/true", true)
+        commands = [("python", [sys.executable, "-c", DIRECT, true]),
+                    ("legacy", [sys.executable, "-c", LEGACY + DIRECT,
+                                true])]
+        for name, runner in [("wrapper", startup.exec_runner),
+                             ("wrapper+dill", by_value())]:
+            binary = os.path.join(tmp, name)
+            shutil.copy("/bin/true", binary)
+            wrap(binary, runner)
+            commands.append((name, [binary]))
+
+        results = [(name, measure(cmd, env, calls))
+                   for name, cmd in commands]
+
+    base = results[0][1]
+    print("median of {0} calls".format(calls))
+    for name, duration in results:
+        print("{0:>12}: {1:7.1f}ms {2:+7.1f}ms".format(
+            name, duration, duration - base))
+    overhead = results[2][1] - base
+    print("wrapper overhead {0:.1f}ms, target < {1}ms: {2}".format(
+        overhead, TARGET_MS, "ok" if overhead < TARGET_MS else "missed"))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -5,6 +5,7 @@ extra_files = [
     "templates/compiler.py.inc",
     "templates/run_static.py.inc",
     "templates/run_dynamic.py.inc",
+    "templates/run_client.py.inc",
     "templates/slurm-prepare-node.sh.inc",
     "templates/slurm-cleanup-node.sh.inc"
 ]